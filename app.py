@@ -1,14 +1,13 @@
-from flask import Flask, request, jsonify, send_file, Response, render_template_string
+from flask import Flask, Blueprint, current_app, g, request, jsonify, send_file, Response, render_template_string, stream_with_context
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt
 from config import Config
 from auth import UserManager, rate_limit, TokenBlacklist
 import json
-import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.naive_bayes import MultinomialNB
-from sklearn.pipeline import Pipeline
+import time
 import joblib
+import logging
+import contextvars
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
 import pickle
@@ -16,30 +15,35 @@ import datetime
 import uuid
 import csv
 import io
-import matplotlib
-matplotlib.use('Agg')  # Set the backend to Agg before importing pyplot
-import matplotlib.pyplot as plt
-import seaborn as sns
-import base64
 import numpy as np
 from werkzeug.utils import secure_filename
 import threading
-
-app = Flask(__name__)
-app.config.from_object(Config)
-
-# Initialize CORS with more permissive settings for development
-CORS(app, 
-    origins=['http://localhost:3000', 'http://127.0.0.1:3000', 
-             'http://localhost:4000', 'http://127.0.0.1:4000',
-             'http://localhost:5000', 'http://127.0.0.1:5000'],
-    supports_credentials=True,
-    allow_headers=['Content-Type', 'Authorization', 'Accept'],
-    methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS']
+import concurrent.futures
+from scoring import BulkScorer, ramped_chunks, apply_size_policy
+from model_store import ModelStore
+from model_registry import ModelRegistry, PairModel, MODES
+from batching import MicroBatcher
+from feedback import FeedbackTrainer, LABELS
+from warmup import Warmup, load_warmup_messages
+from json_provider import json_encoder_for
+from structured_logging import configure_logging, start_request, request_id_var
+from metrics import registry as metrics_registry, record_request, record_cache, STAGE_SECONDS, BATCH_SIZE
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from cascade import Cascade
+from ingest import (
+    split_extensions, is_supported_upload, open_decompressed, iter_records,
+    open_archive, list_archive_members, iter_member_records, iter_eml_members,
+    plan_archive_tasks, ByteBudget, UploadTooLarge, ARCHIVES, TEXT_FORMATS, MAIL_FORMATS
+)
+from visualizations import (
+    VisualizationRenderer, viz_path_for, compute_chart_data, resolve_dpi,
+    CHART_NAMES, CHART_FORMATS, MIN_DPI, MAX_DPI
 )
 
-# Initialize JWT
-jwt = JWTManager(app)
+# Routes are registered on a blueprint; create_app() builds the Flask app
+api = Blueprint("api", __name__)
+logger = logging.getLogger("spam_api")
+jwt = JWTManager()
 user_manager = UserManager()
 
 @jwt.token_in_blocklist_loader
@@ -47,7 +51,38 @@ def check_if_token_is_revoked(jwt_header, jwt_payload):
     jti = jwt_payload["jti"]
     return TokenBlacklist.get_instance().is_blacklisted(jti)
 
-@app.route("/register", methods=["POST"])
+@api.before_app_request
+def bind_request_id():
+    """Tag everything logged for this request with a correlation id."""
+    g.request_started = time.perf_counter()
+    start_request(request.headers.get("X-Request-ID"), current_app.config["LOG_DEBUG_SAMPLE_RATE"])
+
+@api.after_app_request
+def add_request_id(response):
+    started = g.request_started
+    # Label by route template so ids in the path don't create new series
+    route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+    method, path, status = request.method, request.path, response.status_code
+    
+    def finish():
+        seconds = time.perf_counter() - started
+        record_request(route, method, status, seconds)
+        logger.debug("request completed", extra={
+            "method": method,
+            "path": path,
+            "status": status,
+            "duration_ms": round(seconds * 1000, 2)
+        })
+    
+    response.headers["X-Request-ID"] = request_id_var.get()
+    if response.is_streamed:
+        # The body (e.g. /predict/stream) is still to be produced; time the whole response
+        response.call_on_close(finish)
+    else:
+        finish()
+    return response
+
+@api.route("/register", methods=["POST"])
 @rate_limit
 def register():
     data = request.get_json()
@@ -73,7 +108,7 @@ def register():
         "user": auth_result['user']
     })
 
-@app.route("/login", methods=["POST"])
+@api.route("/login", methods=["POST"])
 @rate_limit
 def login():
     data = request.get_json()
@@ -95,14 +130,14 @@ def login():
         "user": auth_result['user']
     })
 
-@app.route("/logout", methods=["POST"])
+@api.route("/logout", methods=["POST"])
 @jwt_required()
 def logout():
     jti = get_jwt()["jti"]
     TokenBlacklist.get_instance().add_token(jti)
     return jsonify({"message": "Successfully logged out"})
 
-@app.route("/refresh", methods=["POST"])
+@api.route("/refresh", methods=["POST"])
 @jwt_required(refresh=True)
 def refresh():
     """Refresh access token."""
@@ -128,38 +163,70 @@ def refresh():
 
 # Load dataset and train model
 dataset_path = "dataset.csv"
-if not os.path.exists(dataset_path):
-    raise FileNotFoundError(f"Dataset file '{dataset_path}' not found.")
-
-df = pd.read_csv(dataset_path)
-if "Spam/Ham" not in df.columns and "label" not in df.columns:
-    raise ValueError("Dataset must contain 'Spam/Ham' or 'label' column.")
-
-# Check if we need to map labels
-if "Spam/Ham" in df.columns:
-    df['label'] = df['Spam/Ham'].map({'spam': 1, 'ham': 0})
-    
-# Combine subject and message if available
-if "Subject" in df.columns and "Message" in df.columns:
-    df['text'] = df['Subject'].fillna('') + ' ' + df['Message'].fillna('')
-elif "Message" in df.columns:
-    df['text'] = df['Message'].fillna('')
-elif "message" in df.columns:
-    df['text'] = df['message'].fillna('')
-else:
-    raise ValueError("Dataset must contain 'Message' or 'message' column.")
-
-# Create and train the model
-pipeline = Pipeline([
-    ('tfidf', TfidfVectorizer(stop_words='english', max_features=5000)),
-    ('clf', MultinomialNB())
-])
-pipeline.fit(df['text'], df['label'])
-
-# Save model
 model_path = "spam_model.pkl"
-joblib.dump(pipeline, model_path)
-print(f"Model trained and saved to {model_path}")
+
+def train_model():
+    """Train the pipeline from the dataset and save it to model_path.
+
+    pandas and the sklearn estimators are imported here rather than at
+    module level so that a server starting from a saved model never pays
+    for them.
+    """
+    import pandas as pd
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.pipeline import Pipeline
+    from train import prepare_frame
+
+    if not os.path.exists(dataset_path):
+        raise FileNotFoundError(f"Dataset file '{dataset_path}' not found.")
+    
+    df = pd.read_csv(dataset_path)
+    # Subject + Message text and 0/1 labels, shared with the out-of-core trainer
+    text, labels = prepare_frame(df)
+    
+    # Create and train the model
+    pipeline = Pipeline([
+        ('tfidf', TfidfVectorizer(stop_words='english', max_features=5000)),
+        ('clf', MultinomialNB())
+    ])
+    pipeline.fit(text, labels)
+    
+    # Save model
+    joblib.dump(pipeline, model_path)
+    logger.info("model trained", extra={"entries": len(df), "path": model_path})
+    return pipeline
+
+def model_is_stale():
+    """A saved model is reused unless the dataset is newer than it."""
+    if not os.path.exists(model_path):
+        return True
+    if os.path.exists(dataset_path):
+        return os.path.getmtime(dataset_path) > os.path.getmtime(model_path)
+    return False
+
+# Services shared by the routes, created once per process by init_services()
+model_store = None
+feedback_trainer = None
+model_registry = None
+cascade = Cascade([])
+predict_batcher = None
+visualization_renderer = None
+warmup = Warmup()
+scoring_options = {"size_policy": "none", "max_chars": None}
+
+def score_messages(messages, model=None, mode=None, explain=True):
+    """Score messages with a named model (default: DEFAULT_MODEL), including word influence.
+
+    Messages the cascade decides never reach the model. Its rules see the
+    size-limited text, as the model does.
+    """
+    texts = None
+    if cascade.stages:
+        texts, _ = apply_size_policy(messages, scoring_options["max_chars"], scoring_options["size_policy"])
+    return cascade.apply(messages, lambda undecided: model_registry.predict(
+        undecided, model=model, mode=mode, explain=explain, **scoring_options
+    ), texts=texts)
 
 # User storage
 USERS_FILE = "users.pkl"
@@ -170,7 +237,7 @@ def load_users():
             with open(USERS_FILE, 'rb') as f:
                 return pickle.load(f)
         except Exception as e:
-            print(f"Error loading users: {e}")
+            logger.warning("failed to load users", exc_info=True)
             return {}
     return {}
 
@@ -187,7 +254,7 @@ def load_history():
             with open(HISTORY_FILE, 'rb') as f:
                 return pickle.load(f)
         except Exception as e:
-            print(f"Error loading history: {e}")
+            logger.warning("failed to load history", exc_info=True)
             return {}
     return {}
 
@@ -195,33 +262,216 @@ def save_history(history):
     with open(HISTORY_FILE, 'wb') as f:
         pickle.dump(history, f)
 
-# Initialize if not exists
-if not os.path.exists(USERS_FILE):
-    save_users({
-        "demo": {
-            "username": "Demo User",
-            "password": generate_password_hash("password123"),
-            "email": "demo@example.com"
-        }
-    })
+def init_storage():
+    """Create the user and history stores if they do not exist yet."""
+    if not os.path.exists(USERS_FILE):
+        save_users({
+            "demo": {
+                "username": "Demo User",
+                "password": generate_password_hash("password123"),
+                "email": "demo@example.com"
+            }
+        })
+    
+    if not os.path.exists(HISTORY_FILE):
+        save_history({})
 
-if not os.path.exists(HISTORY_FILE):
-    save_history({})
+# Bulk uploads: .txt/.csv, optionally .gz/.zst compressed, or .zip archives of them
+def allowed_file(filename):
+    return '.' in filename and is_supported_upload(filename)
 
-# Define allowed file extensions for bulk upload
-ALLOWED_EXTENSIONS = {'txt', 'csv'}
+def cacheable_response(response):
+    """Mark a response for a finished, immutable report render as cacheable."""
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config["VISUALIZATION_CACHE_MAX_AGE"]
+    response.cache_control.immutable = True
+    if response.get_etag()[0] is None:
+        response.add_etag()
+    return response.make_conditional(request)
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+def init_services(app):
+    """Load (or train) the model and create the shared services from app.config."""
+    global model_store, feedback_trainer, model_registry, cascade, predict_batcher, visualization_renderer
+    config = app.config
+    
+    # The pipeline stays loaded between requests and is reloaded when the file changes
+    model_store = ModelStore(
+        model_path,
+        versions_dir=config["MODEL_VERSIONS_DIR"],
+        precision=config["MODEL_PRECISION"]
+    )
+    
+    if model_is_stale():
+        pipeline = train_model()
+        # Keep the version history consistent if feedback versions already exist
+        if model_store.load_versions()["versions"]:
+            model_store.publish(pipeline, note="retrained from dataset")
+    else:
+        logger.info("using saved model", extra={"path": model_path})
+    
+    # User feedback is folded into the model in the background via partial_fit
+    feedback_trainer = FeedbackTrainer(
+        model_store,
+        log_path=config["FEEDBACK_LOG_FILE"],
+        batch_size=config["FEEDBACK_BATCH_SIZE"],
+        apply_interval=config["FEEDBACK_APPLY_INTERVAL"]
+    )
+    # Feedback logged but not applied before the last shutdown
+    feedback_trainer.replay()
+    
+    # Models selectable per /predict request, with optional shadow/ensemble scoring
+    model_registry = ModelRegistry(
+        config["DEFAULT_MODEL"],
+        mode=config["MODEL_MODE"],
+        secondary_model=config["SECONDARY_MODEL"],
+        primary_weight=config["ENSEMBLE_PRIMARY_WEIGHT"]
+    )
+    model_registry.register("nb", model_store)
+    if os.path.exists(config["LR_MODEL_FILE"]) and os.path.exists(config["LR_VECTORIZER_FILE"]):
+        model_registry.register("lr", PairModel(config["LR_MODEL_FILE"], config["LR_VECTORIZER_FILE"]))
+    
+    # Exact-hash allow/blocklists and rules that can decide before the model
+    if config["CASCADE_ENABLED"]:
+        cascade = Cascade.from_files(
+            allowlist_path=config["CASCADE_ALLOWLIST_FILE"],
+            blocklist_path=config["CASCADE_BLOCKLIST_FILE"],
+            rules_path=config["CASCADE_RULES_FILE"]
+        )
+    
+    scoring_options.update(size_policy=config["MESSAGE_SIZE_POLICY"], max_chars=config["MESSAGE_MAX_CHARS"])
+    
+    # Optional micro-batching of concurrent single-message /predict calls
+    if config["PREDICT_MICROBATCH_ENABLED"]:
+        predict_batcher = MicroBatcher(
+            score_messages,
+            max_batch_size=config["PREDICT_MICROBATCH_MAX_SIZE"],
+            max_wait=config["PREDICT_MICROBATCH_WINDOW_MS"] / 1000.0
+        )
+    
+    # Report charts are rendered ahead of time in a background process pool
+    visualization_renderer = VisualizationRenderer(
+        reports_dir="reports",
+        max_workers=config["VISUALIZATION_WORKERS"],
+        cache_max_bytes=config["VISUALIZATION_CACHE_MAX_BYTES"]
+    )
+    
+    # Gauges read at scrape time
+    metrics_registry.add_gauge("spam_api_model_loads", "Times the served model has been loaded from disk",
+                               lambda: model_store.load_count)
+    metrics_registry.add_gauge("spam_api_queue_depth", "Items waiting in each background queue", lambda: {
+        ("predict_microbatch",): predict_batcher.queue_depth() if predict_batcher is not None else 0,
+        ("feedback",): feedback_trainer.pending_count(),
+        ("visualizations",): visualization_renderer.pending_count()
+    }, labelnames=("queue",))
+    
+    init_storage()
+
+def warmup_steps(app, render_pool=True):
+    """Start-up steps that exercise every hot path before traffic arrives."""
+    messages = load_warmup_messages(app.config["WARMUP_MESSAGES_FILE"])
+    
+    default = model_registry.default_model
+    secondary = [name for name in model_registry.names() if name != default]
+    
+    # Only the default model gates readiness; other models that fail are
+    # reported by /ready and are not used by the rest of the warm-up
+    def load_models():
+        model_registry.current(default)
+        for name in secondary:
+            try:
+                model_registry.current(name)
+            except Exception as e:
+                warmup.record_model_error(name, e)
+    
+    def predict():
+        results = model_registry.predict(messages, model=default, mode='single', **scoring_options)
+        with app.app_context():
+            jsonify({"predictions": results})
+        for name in secondary:
+            if warmup.model_failed(name):
+                continue
+            try:
+                model_registry.predict(messages, model=name, mode='single', **scoring_options)
+            except Exception as e:
+                warmup.record_model_error(name, e)
+    
+    def bulk_scoring():
+        BulkScorer(model_store.get(), chunk_size=app.config["BULK_CHUNK_SIZE"]).score(messages)
+    
+    steps = [("load_models", load_models), ("predict", predict), ("bulk_scoring", bulk_scoring)]
+    if render_pool:
+        steps.append(("render_pool", visualization_renderer.warm))
+    return steps
 
-# Add a lock for thread-safe visualization generation
-visualization_lock = threading.Lock()
+def start_warmup(app, mode="background"):
+    """Run the warm-up that /ready waits for.
 
-@app.route("/user", methods=["GET", "OPTIONS"])
+    'background' serves while warming (the development server), 'blocking'
+    finishes before returning (a pre-fork master, so workers are forked
+    warm) and 'off' reports ready at once.
+    """
+    if mode == "off" or not app.config["WARMUP_ENABLED"]:
+        warmup.mark_ready()
+    elif mode == "blocking":
+        # The chart pool's processes and threads do not survive a fork; each
+        # worker starts its own from after_fork()
+        warmup.run(warmup_steps(app, render_pool=False))
+    else:
+        warmup.start(warmup_steps(app, render_pool=app.config["WARMUP_RENDER_POOL"]))
+
+CORS_ORIGINS = ['http://localhost:3000', 'http://127.0.0.1:3000', 
+                'http://localhost:4000', 'http://127.0.0.1:4000',
+                'http://localhost:5000', 'http://127.0.0.1:5000']
+
+def create_app(config=None, warmup_mode="background"):
+    """Build the Flask app and load the model.
+
+    config is a dict of settings applied on top of config.Config. The
+    services behind the routes are module-level, so there is one app per
+    process; under a pre-fork server create it once in the master (see
+    wsgi.py) and every worker shares the loaded model copy-on-write.
+    """
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    if config:
+        app.config.update(config)
+    
+    configure_logging(
+        level=app.config["LOG_LEVEL"],
+        fmt=app.config["LOG_FORMAT"],
+        sample_rate=app.config["LOG_DEBUG_SAMPLE_RATE"]
+    )
+    
+    # Per-process metrics, shared through METRICS_DIR under several workers
+    metrics_registry.configure(app.config["METRICS_DIR"], app.config["METRICS_FLUSH_INTERVAL"])
+    
+    # NumPy-aware (and, with orjson installed, much faster) jsonify()
+    app.json_encoder = json_encoder_for(app.config["JSON_BACKEND"])
+    
+    # Initialize CORS with more permissive settings for development
+    CORS(app, 
+        origins=CORS_ORIGINS,
+        supports_credentials=True,
+        allow_headers=['Content-Type', 'Authorization', 'Accept'],
+        methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS']
+    )
+    
+    jwt.init_app(app)
+    app.register_blueprint(api)
+    init_services(app)
+    start_warmup(app, warmup_mode)
+    return app
+
+def after_fork(app):
+    """Per-worker set-up in a pre-fork server, called from its post_fork hook."""
+    if app.config["WARMUP_ENABLED"] and app.config["WARMUP_RENDER_POOL"]:
+        threading.Thread(target=visualization_renderer.warm, name="render-pool-warmup", daemon=True).start()
+
+@api.route("/user", methods=["GET", "OPTIONS"])
 @jwt_required()
 def get_user():
     if request.method == "OPTIONS":
-        response = app.make_default_options_response()
+        response = current_app.make_default_options_response()
         return response
         
     user_id = get_jwt_identity()
@@ -243,11 +493,11 @@ def get_user():
     })
 
 
-@app.route("/user/settings", methods=["PUT", "OPTIONS"])
+@api.route("/user/settings", methods=["PUT", "OPTIONS"])
 @jwt_required()
 def update_settings():
     if request.method == "OPTIONS":
-        response = app.make_default_options_response()
+        response = current_app.make_default_options_response()
         return response
         
     user_id = get_jwt_identity()
@@ -272,11 +522,11 @@ def update_settings():
     })
 
 
-@app.route("/predict", methods=["POST", "OPTIONS"])
+@api.route("/predict", methods=["POST", "OPTIONS"])
 def predict():
     # Handle preflight OPTIONS request
     if request.method == "OPTIONS":
-        response = app.make_default_options_response()
+        response = current_app.make_default_options_response()
         return response
         
     try:
@@ -294,32 +544,41 @@ def predict():
         if not messages or not isinstance(messages, list):
             return jsonify({"error": "No messages provided or invalid format"}), 400
 
-        model = joblib.load(model_path)
-        predictions = model.predict(messages)
-        probabilities = model.predict_proba(messages)
+        # Optional model name and shadow/ensemble mode, in the body or query string
+        model_name = data.get("model") or request.args.get("model")
+        mode = data.get("mode") or request.args.get("mode")
+        if model_name is not None and model_name not in model_registry.names():
+            return jsonify({"error": f"Unknown model '{model_name}'", "models": model_registry.names()}), 400
+        if mode is not None and mode not in MODES:
+            return jsonify({"error": f"Unknown mode '{mode}'", "modes": list(MODES)}), 400
+
+        # Single-message calls can share a batch with concurrent requests
+        if len(messages) == 1 and predict_batcher is not None and model_name is None and mode is None:
+            scored = [predict_batcher.submit(messages[0])]
+        else:
+            scored = score_messages(messages, model=model_name, mode=mode)
 
         results = []
         spam_count = 0
         ham_count = 0
         
-        for i, prediction in enumerate(predictions):
-            is_spam = prediction == 1
-            proba = probabilities[i][1] if is_spam else probabilities[i][0]
-            
-            if is_spam:
+        for message, prediction in zip(messages, scored):
+            if prediction["prediction"] == "spam":
                 spam_count += 1
             else:
                 ham_count += 1
-                
-            word_influence = get_word_influence_for_message(messages[i], model)
             
             result = {
-                "message": messages[i][:100] + "..." if len(messages[i]) > 100 else messages[i],
-                "prediction": "spam" if is_spam else "ham",
-                "confidence": round(float(proba) * 100, 2),
+                "message": message[:100] + "..." if len(message) > 100 else message,
+                "prediction": prediction["prediction"],
+                "confidence": prediction["confidence"],
                 "timestamp": datetime.datetime.now().isoformat(),
-                "word_influence": word_influence
+                "word_influence": prediction["word_influence"],
+                "model": prediction.get("model")
             }
+            for key in ("size_policy", "decided_by", "reason"):
+                if key in prediction:
+                    result[key] = prediction[key]
             results.append(result)
 
         return jsonify({
@@ -333,18 +592,199 @@ def predict():
         })
         
     except Exception as e:
-        print(f"Error in predict endpoint: {str(e)}")
+        logger.exception("predict failed")
         return jsonify({
             "error": "Failed to process prediction request",
             "details": str(e)
         }), 500
 
 
-@app.route("/history", methods=["GET", "OPTIONS"])
+def parse_stream_line(line):
+    """Turn one NDJSON (or plain text) input line into (message, id).
+
+    Accepts {"message": ..., "id": ...} objects, JSON strings, or raw text.
+    """
+    text = line.decode('utf-8', errors='replace').strip()
+    if not text:
+        return None, None
+    if text[0] in '{"':
+        value = json.loads(text)
+        if isinstance(value, dict):
+            message = value.get("message")
+            if not isinstance(message, str):
+                raise ValueError("object has no string 'message' field")
+            return message, value.get("id")
+        if isinstance(value, str):
+            return value, None
+        raise ValueError("expected an object or a string")
+    return text, None
+
+
+@api.route("/predict/stream", methods=["POST", "OPTIONS"])
+def predict_stream():
+    """Score newline-delimited messages and stream NDJSON results back.
+
+    Input lines are read from the request stream and scored in micro-batches
+    as they arrive, so neither side has to buffer the whole exchange. The
+    model and mode are chosen with ?model= and ?mode=, as for /predict.
+    """
+    if request.method == "OPTIONS":
+        response = current_app.make_default_options_response()
+        return response
+    
+    model_name = request.args.get("model")
+    mode = request.args.get("mode")
+    if model_name is not None and model_name not in model_registry.names():
+        return jsonify({"error": f"Unknown model '{model_name}'", "models": model_registry.names()}), 400
+    if mode is not None and mode not in MODES:
+        return jsonify({"error": f"Unknown mode '{mode}'", "modes": list(MODES)}), 400
+    
+    # Load the model before the response starts, so a failure is still a 500
+    try:
+        model_registry.current(model_name)
+    except Exception as model_error:
+        logger.exception("model loading failed")
+        return jsonify({"error": "Internal server error - model loading failed"}), 500
+    
+    explain = request.args.get("explain", "1").lower() not in ("0", "false", "no")
+    batch_size = request.args.get("batch_size", default=current_app.config["PREDICT_STREAM_BATCH_SIZE"], type=int)
+    batch_size = max(1, min(batch_size, 10000))
+    
+    def read_lines():
+        for line_number, line in enumerate(request.stream, start=1):
+            try:
+                message, message_id = parse_stream_line(line)
+            except ValueError as parse_error:
+                yield line_number, None, None, str(parse_error)
+                continue
+            if message is not None:
+                yield line_number, message, message_id, None
+    
+    def generate():
+        for batch in ramped_chunks(read_lines(), batch_size):
+            valid = [item for item in batch if item[3] is None]
+            BATCH_SIZE.observe(len(valid), "predict_stream")
+            try:
+                scored = iter(score_messages(
+                    [item[1] for item in valid], model=model_name, mode=mode, explain=explain
+                )) if valid else iter(())
+            except Exception as pred_error:
+                logger.exception("predict stream batch failed")
+                scored = None
+            
+            lines = []
+            for line_number, message, message_id, error in batch:
+                if error is None and scored is None:
+                    error = "Failed to score message"
+                if error is not None:
+                    record = {"line": line_number, "error": error}
+                else:
+                    record = {"line": line_number, **next(scored)}
+                if message_id is not None:
+                    record["id"] = message_id
+                lines.append(json.dumps(record, cls=current_app.json_encoder))
+            yield "\n".join(lines) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@api.route("/feedback", methods=["POST", "OPTIONS"])
+@jwt_required()
+def submit_feedback():
+    """Mark a message as spam or ham; applied to the model in the background.
+
+    Requires a signed-in user: feedback retrains the model everyone is
+    served, and each entry is logged with the user who gave it.
+    """
+    if request.method == "OPTIONS":
+        response = current_app.make_default_options_response()
+        return response
+    
+    try:
+        data = request.get_json() or {}
+        label = data.get("label")
+        if label not in LABELS:
+            return jsonify({"error": "label must be 'spam' or 'ham'"}), 400
+        
+        # Either the message itself, or a result from a bulk report
+        message = data.get("message")
+        if message is None and data.get("batch_id") and data.get("result_id"):
+            report_path = os.path.join("reports", f"{secure_filename(data['batch_id'])}.pkl")
+            if not os.path.exists(report_path):
+                return jsonify({"error": "Report not found"}), 404
+            with open(report_path, 'rb') as f:
+                report_data = pickle.load(f)
+            result = next((r for r in report_data["results"] if r["id"] == data["result_id"]), None)
+            if result is None:
+                return jsonify({"error": "Result not found in report"}), 404
+            message = result["full_message"]
+        
+        if not isinstance(message, str) or not message.strip():
+            return jsonify({"error": "Provide a message, or a batch_id and result_id"}), 400
+        
+        pending = feedback_trainer.add(message, label, user_id=get_jwt_identity())
+        return jsonify({
+            "message": "Feedback recorded",
+            "pending": pending,
+            "model_version": model_store.current_version()
+        }), 202
+        
+    except Exception as e:
+        logger.exception("feedback failed")
+        return jsonify({"error": f"Failed to record feedback: {str(e)}"}), 500
+
+
+@api.route("/model/versions", methods=["GET"])
+def model_versions():
+    index = model_store.load_versions()
+    return jsonify({
+        "current": index["current"],
+        "versions": index["versions"],
+        "pending_feedback": feedback_trainer.pending_count(),
+        "last_feedback_error": feedback_trainer.last_error
+    })
+
+
+@api.route("/models", methods=["GET"])
+def list_models():
+    """Available models, the serving mode and per-model latency/disagreement."""
+    return jsonify({
+        "models": model_registry.names(),
+        "default": model_registry.default_model,
+        "mode": model_registry.mode,
+        "secondary": model_registry.secondary_model,
+        **model_registry.stats.snapshot()
+    })
+
+
+@api.route("/cascade/stats", methods=["GET"])
+def cascade_stats():
+    """Per-stage hit rates and latency of the pre-classifier cascade."""
+    return jsonify({
+        "stages": [stage.name for stage in cascade.stages],
+        "stats": cascade.stats()
+    })
+
+
+@api.route("/model/rollback", methods=["POST", "OPTIONS"])
+@jwt_required()
+def rollback_model():
+    if request.method == "OPTIONS":
+        response = current_app.make_default_options_response()
+        return response
+    
+    try:
+        version = model_store.rollback()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"message": "Rolled back model", "current": version})
+
+
+@api.route("/history", methods=["GET", "OPTIONS"])
 @jwt_required()
 def get_history():
     if request.method == "OPTIONS":
-        response = app.make_default_options_response()
+        response = current_app.make_default_options_response()
         return response
         
     user_id = get_jwt_identity()
@@ -357,11 +797,11 @@ def get_history():
     return jsonify({"history": history[user_id]})
 
 
-@app.route("/history/<scan_id>", methods=["GET", "OPTIONS"])
+@api.route("/history/<scan_id>", methods=["GET", "OPTIONS"])
 @jwt_required()
 def get_scan_details(scan_id):
     if request.method == "OPTIONS":
-        response = app.make_default_options_response()
+        response = current_app.make_default_options_response()
         return response
         
     user_id = get_jwt_identity()
@@ -383,54 +823,22 @@ def get_scan_details(scan_id):
     return jsonify({"scan": scan})
 
 
-@app.route("/", methods=["GET", "OPTIONS"])
+@api.route("/", methods=["GET", "OPTIONS"])
 def home():
     if request.method == "OPTIONS":
         return "", 200
     return jsonify({"status": "ok", "message": "Flask server is running!"})
 
 
-def get_word_influence_for_message(message, model):
-    """Analyze which words in the message most influenced the prediction"""
-    # Extract the vectorizer and classifier from the pipeline
-    vectorizer = model.named_steps['tfidf']
-    classifier = model.named_steps['clf']
-    
-    # Transform the message to get its feature vector
-    X = vectorizer.transform([message])
-    
-    # Get the feature names
-    feature_names = vectorizer.get_feature_names_out()
-    
-    # Get the coefficients for spam class (class 1)
-    coef = classifier.feature_log_prob_[1] - classifier.feature_log_prob_[0]
-    
-    # Get the non-zero features in the message
-    non_zero = X.nonzero()[1]
-    
-    # Create a list of (word, coefficient) tuples for words in the message
-    word_influence = []
-    for idx in non_zero:
-        word = feature_names[idx]
-        influence = coef[idx]
-        word_influence.append({"word": word, "influence": float(influence)})
-    
-    # Sort by absolute influence
-    word_influence.sort(key=lambda x: abs(x["influence"]), reverse=True)
-    
-    # Return top 20 most influential words
-    return word_influence[:20]
-
-
-@app.route("/word-stats", methods=["GET", "OPTIONS"])
+@api.route("/word-stats", methods=["GET", "OPTIONS"])
 def word_stats():
     """Return the most influential words for spam detection"""
     # Handle preflight OPTIONS request
     if request.method == "OPTIONS":
-        response = app.make_default_options_response()
+        response = current_app.make_default_options_response()
         return response
         
-    model = joblib.load(model_path)
+    model = model_store.get()
     
     # Extract the TF-IDF vectorizer and classifier from the pipeline
     vectorizer = model.named_steps['tfidf']
@@ -462,205 +870,140 @@ def word_stats():
 
 
 # Add new endpoint for bulk email analysis
-@app.route("/bulk-analyze", methods=["POST", "OPTIONS"])
+@api.route("/bulk-analyze", methods=["POST", "OPTIONS"])
 @jwt_required(optional=True)  # Make JWT optional for testing
 def bulk_analyze():
     if request.method == "OPTIONS":
-        response = app.make_default_options_response()
+        response = current_app.make_default_options_response()
         return response
     
     try:
-        # Print debug info
-        print(f"Bulk analyze request received")
-        print(f"Content-Type: {request.headers.get('Content-Type', 'None')}")
-        print(f"Authorization header: {request.headers.get('Authorization', 'None')}")
-        
         # Get user ID (if authenticated)
         user_id = get_jwt_identity()
-        print(f"User ID from JWT: {user_id}")
         
         # Use demo user if not authenticated (for testing)
         if not user_id:
             user_id = "demo"
-            print("Using demo user for unauthenticated request")
         
         # Make sure reports directory exists
         reports_dir = "reports"
         if not os.path.exists(reports_dir):
             os.makedirs(reports_dir)
-            print(f"Created reports directory at {os.path.abspath(reports_dir)}")
+            logger.info("created reports directory", extra={"path": os.path.abspath(reports_dir)})
         
         # Check if file is present in the request
-        print("Request files:", list(request.files.keys()))
-        print("Request form:", list(request.form.keys()))
-        
         if 'file' not in request.files:
-            print("No file found in request.files")
+            logger.debug("bulk analyze without a file", extra={"form_fields": list(request.form.keys())})
             return jsonify({"error": "No file provided"}), 400
             
         file = request.files['file']
-        print(f"Received file: {file.filename}")
         
         if file.filename == '':
             return jsonify({"error": "No file selected"}), 400
             
-        if not allowed_file(file.filename):
-            return jsonify({"error": "File type not allowed. Please upload .txt or .csv files"}), 400
-        
-        print(f"Processing file: {file.filename}")
+        # An explicit ingestion mode overrides the file extension, e.g. for an
+        # mbox uploaded without one; otherwise the extension must be known
+        fmt, compression = split_extensions(file.filename)
+        mode = request.form.get("mode")
+        if mode:
+            if mode not in TEXT_FORMATS and mode not in MAIL_FORMATS:
+                return jsonify({"error": f"Unknown mode '{mode}'. Use one of: txt, csv, mbox, eml"}), 400
+            if fmt not in ARCHIVES:
+                fmt = mode
+        elif not allowed_file(file.filename):
+            return jsonify({"error": "File type not allowed. Please upload .txt, .csv, .mbox or .eml files, optionally as .gz/.zst, or a .zip of them"}), 400
         
         try:
-            # Read the file content
-            content = file.read().decode('utf-8')
-            print(f"File content length: {len(content)} bytes")
-            print("First 100 characters:", content[:100])
+            # Load model
+            try:
+                model = model_store.get()
+            except Exception as model_error:
+                logger.exception("model loading failed")
+                return jsonify({"error": "Internal server error - model loading failed"}), 500
             
-            # Process the file based on type
-            emails = []
-            if file.filename.endswith('.csv'):
-                try:
-                    # Try pandas first
-                    df = pd.read_csv(io.StringIO(content))
-                    print("CSV columns:", df.columns.tolist())
-                    
-                    # Try different possible column names
-                    message_columns = ['message', 'Message', 'text', 'Text', 'content', 'Content', 'email', 'Email']
-                    found_column = None
-                    
-                    for col in message_columns:
-                        if col in df.columns:
-                            found_column = col
-                            break
-                    
-                    if found_column:
-                        print(f"Using column '{found_column}' for messages")
-                        emails = df[found_column].fillna('').astype(str).tolist()
-                    else:
-                        # If no known column found, try using the first column that's not 'label'
-                        non_label_cols = [col for col in df.columns if col.lower() != 'label']
-                        if non_label_cols:
-                            first_col = non_label_cols[0]
-                            print(f"No standard column name found. Using first non-label column '{first_col}'")
-                            emails = df[first_col].fillna('').astype(str).tolist()
-                        else:
-                            raise ValueError("No suitable column found for messages")
-                        
-                except Exception as csv_error:
-                    print(f"Pandas CSV reading failed: {str(csv_error)}")
-                    print("Falling back to simple CSV reading")
-                    # Fallback to simple CSV reading
-                    reader = csv.reader(io.StringIO(content))
-                    header = next(reader, None)  # Skip header
-                    print("CSV header:", header)
-                    
-                    if header:
-                        # Try to find the message column in the header
-                        message_col_idx = None
-                        for idx, col in enumerate(header):
-                            if col.lower() in ['message', 'text', 'content', 'email']:
-                                message_col_idx = idx
-                                break
-                        
-                        if message_col_idx is None:
-                            # If no message column found, use first non-label column
-                            for idx, col in enumerate(header):
-                                if col.lower() != 'label':
-                                    message_col_idx = idx
-                                    break
-                        
-                        if message_col_idx is not None:
-                            print(f"Using column index {message_col_idx} for messages")
-                            emails = [row[message_col_idx] for row in reader if row and len(row) > message_col_idx]
-                        else:
-                            raise ValueError("No suitable column found for messages")
-                    else:
-                        # No header - use first column
-                        emails = [row[0] for row in reader if row]
-            else:
-                # Handle text file (one email per line)
-                emails = [line.strip() for line in content.split('\n') if line.strip()]
+            batch_id = str(uuid.uuid4())  # Generate a unique batch ID
+            logger.debug("bulk analyze started", extra={
+                "batch_id": batch_id,
+                "user_id": user_id,
+                "upload": file.filename,
+                "content_type": file.content_type
+            })
+            
+            # Decompress and parse the upload incrementally while scoring it in
+            # chunks; aggregates for the report summary are kept as we go
+            scorer = BulkScorer(
+                model,
+                chunk_size=current_app.config["BULK_CHUNK_SIZE"],
+                size_policy=current_app.config["MESSAGE_SIZE_POLICY"],
+                max_chars=current_app.config["MESSAGE_MAX_CHARS"],
+                cascade=cascade
+            )
             
-            print(f"Extracted {len(emails)} emails")
-            if len(emails) > 0:
-                print("First email sample:", emails[0][:100])
+            # CSV uploads may name the columns to read instead of guessing
+            csv_options = {
+                key: request.form.get(key)
+                for key in ("message_column", "id_column", "label_column")
+                if request.form.get(key)
+            }
+            
+            # Limits on what the upload expands to (see BULK_MAX_* in config.py)
+            budget = ByteBudget(current_app.config["BULK_MAX_DECOMPRESSED_BYTES"])
             
-            # Remove any empty strings or None values
-            emails = [email for email in emails if email and isinstance(email, str)]
-            print(f"After cleaning: {len(emails)} valid emails")
+            if fmt in ARCHIVES:
+                archive = open_archive(file.stream)
+                members = list_archive_members(archive, current_app.config["BULK_MAX_ARCHIVE_MEMBERS"], budget)
+                logger.debug("archive opened", extra={"batch_id": batch_id, "members": len(members)})
+                # Members are decompressed, parsed and scored in parallel;
+                # results keep archive order and are tagged with their member.
+                # Each task runs in a copy of the request's logging context.
+                tasks = plan_archive_tasks(members, current_app.config["BULK_CHUNK_SIZE"])
+                with concurrent.futures.ThreadPoolExecutor(
+                        max_workers=current_app.config["BULK_ARCHIVE_WORKERS"]) as executor:
+                    futures = [
+                        executor.submit(contextvars.copy_context().run, scorer.consume,
+                                        iter_eml_members(archive, names, budget))
+                        if kind == 'eml' else
+                        executor.submit(contextvars.copy_context().run, scorer.consume,
+                                        iter_member_records(archive, names[0], csv_options, budget), names[0])
+                        for kind, names in tasks
+                    ]
+                    results = []
+                    for future in futures:
+                        results.extend(future.result())
+            else:
+                stream = open_decompressed(file.stream, compression, budget)
+                results = scorer.consume(iter_records(stream, fmt, csv_options))
             
-            if not emails:
-                print("No valid emails found in file")
+            if not results:
+                logger.info("no valid emails in upload", extra={"batch_id": batch_id, "file_type": fmt})
                 return jsonify({
                     "error": "No valid emails found in the file. Please make sure the file contains valid email content.",
                     "details": {
-                        "file_type": file.filename.split('.')[-1],
-                        "content_length": len(content),
-                        "first_100_chars": content[:100]
+                        "file_type": fmt,
+                        "compression": compression
                     }
                 }), 422
             
-            # Load model
-            try:
-                model = joblib.load(model_path)
-            except Exception as model_error:
-                print(f"Error loading model: {str(model_error)}")
-                return jsonify({"error": "Internal server error - model loading failed"}), 500
-            
-            # Make predictions
-            try:
-                predictions = model.predict(emails)
-                probabilities = model.predict_proba(emails)
-            except Exception as pred_error:
-                print(f"Error making predictions: {str(pred_error)}")
-                return jsonify({
-                    "error": "Failed to analyze emails. The content may be invalid or in an unsupported format.",
-                    "details": str(pred_error)
-                }), 422
-            
-            # Prepare results
-            results = []
-            batch_id = str(uuid.uuid4())  # Generate a unique batch ID
-            print(f"Generated batch ID: {batch_id}")
-            
-            spam_count = 0
-            ham_count = 0
-            
-            for i, prediction in enumerate(predictions):
-                is_spam = prediction == 1
-                # Get the correct probability - use the spam class probability directly
-                proba = probabilities[i][1] if is_spam else probabilities[i][0]
-                
-                if is_spam:
-                    spam_count += 1
-                else:
-                    ham_count += 1
-                    
-                # Get word influence for this prediction
-                word_influence = get_word_influence_for_message(emails[i], model)
-                
-                result = {
-                    "id": str(uuid.uuid4()),
-                    "message": emails[i][:100] + "..." if len(emails[i]) > 100 else emails[i],
-                    "full_message": emails[i],
-                    "prediction": "spam" if is_spam else "ham",
-                    "confidence": round(float(proba) * 100, 2),  # Convert to percentage with 2 decimal places
-                    "word_influence": word_influence,
-                    "timestamp": datetime.datetime.now().isoformat()
-                }
-                results.append(result)
+            total_emails = len(results)
+            aggregates = scorer.aggregates
+            feature_names = scorer.feature_names
+            spam_count = aggregates.spam_count
+            ham_count = aggregates.ham_count
             
             # Generate report data
             report_data = {
                 "batch_id": batch_id,
                 "timestamp": datetime.datetime.now().isoformat(),
-                "total_emails": len(emails),
+                "total_emails": total_emails,
                 "spam_count": spam_count,
                 "ham_count": ham_count,
-                "spam_percentage": round((spam_count / len(emails)) * 100, 2),
+                "spam_percentage": round((spam_count / total_emails) * 100, 2),
+                "aggregates": aggregates.to_summary(feature_names),
                 "results": results
             }
             
             # Save to user's history
+            persist_start = time.perf_counter()
             history = load_history()
             if user_id not in history:
                 history[user_id] = []
@@ -669,7 +1012,7 @@ def bulk_analyze():
             batch_entry = {
                 "id": batch_id,
                 "type": "batch",
-                "total_emails": len(emails),
+                "total_emails": total_emails,
                 "spam_count": spam_count,
                 "ham_count": ham_count,
                 "timestamp": datetime.datetime.now().isoformat()
@@ -691,37 +1034,51 @@ def bulk_analyze():
             report_path = os.path.join(reports_dir, f"{batch_id}.pkl")
             with open(report_path, 'wb') as f:
                 pickle.dump(report_data, f)
+            STAGE_SECONDS.observe(time.perf_counter() - persist_start, "report_persistence")
                 
-            print(f"Saved report to {os.path.abspath(report_path)}")
+            logger.info("bulk analysis completed", extra={
+                "batch_id": batch_id,
+                "emails": total_emails,
+                "spam": spam_count
+            })
+            
+            # Start rendering charts now so the first view doesn't wait
+            try:
+                visualization_renderer.submit(batch_id)
+            except Exception as viz_error:
+                logger.warning("failed to schedule visualizations", exc_info=True, extra={"batch_id": batch_id})
             
             # Add CORS headers to the response
             response = jsonify({
                 "message": "Bulk analysis completed successfully",
                 "batch_id": batch_id,
                 "summary": {
-                    "total_emails": len(emails),
+                    "total_emails": total_emails,
                     "spam_count": spam_count,
                     "ham_count": ham_count,
-                    "spam_percentage": round((spam_count / len(emails)) * 100, 2)
+                    "spam_percentage": round((spam_count / total_emails) * 100, 2)
                 }
             })
             
             return response
             
+        except UploadTooLarge as limit_error:
+            logger.warning("upload over limits", extra={"upload": file.filename, "reason": str(limit_error)})
+            return jsonify({"error": str(limit_error)}), 413
+            
         except Exception as process_error:
-            print(f"Error processing file content: {str(process_error)}")
+            logger.warning("failed to process upload", exc_info=True, extra={"upload": file.filename})
             return jsonify({
                 "error": "Failed to process file content",
                 "details": str(process_error),
                 "file_info": {
                     "name": file.filename,
-                    "type": file.content_type,
-                    "size": len(content) if 'content' in locals() else 'unknown'
+                    "type": file.content_type
                 }
             }), 422
         
     except Exception as e:
-        print(f"Error in bulk analysis: {str(e)}")
+        logger.exception("bulk analysis failed")
         error_response = jsonify({
             "error": "Failed to process file",
             "details": str(e)
@@ -729,29 +1086,23 @@ def bulk_analyze():
         return error_response, 500
 
 # Add endpoint to get report details
-@app.route("/report/<batch_id>", methods=["GET", "OPTIONS"])
+@api.route("/report/<batch_id>", methods=["GET", "OPTIONS"])
 @jwt_required(optional=True)  # Make JWT optional for testing
 def get_report(batch_id):
     if request.method == "OPTIONS":
-        response = app.make_default_options_response()
+        response = current_app.make_default_options_response()
         return response
     
     try:
-        # Print debug info
-        print(f"Report request for batch_id: {batch_id}")
-        print(f"Authorization header: {request.headers.get('Authorization', 'None')}")
-        
         # Load report data
         report_path = os.path.join("reports", f"{batch_id}.pkl")
         if not os.path.exists(report_path):
-            print(f"Report not found: {report_path}")
+            logger.debug("report not found", extra={"batch_id": batch_id})
             return jsonify({"error": "Report not found"}), 404
             
         with open(report_path, 'rb') as f:
             report_data = pickle.load(f)
         
-        print(f"Report data loaded successfully for batch {batch_id}")
-        
         response = jsonify({"report": report_data})
         
         # Add explicit CORS headers to this specific response
@@ -760,49 +1111,53 @@ def get_report(batch_id):
         return response
         
     except Exception as e:
-        print(f"Error in get_report endpoint: {str(e)}")
+        logger.exception("failed to get report", extra={"batch_id": batch_id})
         return jsonify({"error": f"Failed to get report: {str(e)}"}), 500
 
+def iter_report_csv(report_data):
+    """Header and data rows of a report's CSV download."""
+    # Reports built from archives record which member each email came from
+    has_source = any("source" in result for result in report_data["results"])
+    
+    header = ["Email", "Prediction", "Confidence (%)", "Top Influential Words"]
+    if has_source:
+        header.append("Source")
+    yield header
+    
+    for result in report_data["results"]:
+        top_words = ", ".join([f"{item['word']} ({item['influence']:.2f})" for item in result["word_influence"][:5]])
+        row = [
+            result["full_message"],
+            result["prediction"],
+            result["confidence"],
+            top_words
+        ]
+        if has_source:
+            row.append(result.get("source", ""))
+        yield row
+
 # Add endpoint to download report as CSV
-@app.route("/report/<batch_id>/download", methods=["GET", "OPTIONS"])
+@api.route("/report/<batch_id>/download", methods=["GET", "OPTIONS"])
 @jwt_required(optional=True)  # Make JWT optional for testing
 def download_report(batch_id):
     if request.method == "OPTIONS":
-        response = app.make_default_options_response()
+        response = current_app.make_default_options_response()
         return response
     
     try:
-        # Print debug info
-        print(f"Download report request for batch_id: {batch_id}")
-        print(f"Authorization header: {request.headers.get('Authorization', 'None')}")
-        
         # Load report data
         report_path = os.path.join("reports", f"{batch_id}.pkl")
         if not os.path.exists(report_path):
-            print(f"Report not found: {report_path}")
+            logger.debug("report not found", extra={"batch_id": batch_id})
             return jsonify({"error": "Report not found"}), 404
             
         with open(report_path, 'rb') as f:
             report_data = pickle.load(f)
         
-        print(f"Report data loaded successfully for batch {batch_id}")
-        
         # Create CSV file
         output = io.StringIO()
         writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow(["Email", "Prediction", "Confidence (%)", "Top Influential Words"])
-        
-        # Write data
-        for result in report_data["results"]:
-            top_words = ", ".join([f"{item['word']} ({item['influence']:.2f})" for item in result["word_influence"][:5]])
-            writer.writerow([
-                result["full_message"],
-                result["prediction"],
-                result["confidence"],
-                top_words
-            ])
+        writer.writerows(iter_report_csv(report_data))
         
         # Prepare response
         output.seek(0)
@@ -819,140 +1174,135 @@ def download_report(batch_id):
         return response
         
     except Exception as e:
-        print(f"Error in download_report endpoint: {str(e)}")
+        logger.exception("failed to download report", extra={"batch_id": batch_id})
         return jsonify({"error": f"Failed to download report: {str(e)}"}), 500
 
-# Add endpoint to get visualization data
-@app.route("/report/<batch_id>/visualizations", methods=["GET", "OPTIONS"])
+# Add endpoint to get raw chart data so clients can draw charts themselves
+# (the bundled front end still shows the PNGs from /visualizations)
+@api.route("/report/<batch_id>/chart-data", methods=["GET", "OPTIONS"])
 @jwt_required(optional=True)  # Make JWT optional for testing
-def get_visualizations(batch_id):
+def get_chart_data(batch_id):
     if request.method == "OPTIONS":
-        response = app.make_default_options_response()
+        response = current_app.make_default_options_response()
         return response
     
     try:
-        print(f"Visualization request for batch_id: {batch_id}")
-        print(f"Authorization header: {request.headers.get('Authorization', 'None')}")
+        bins = request.args.get("bins", default=20, type=int)
+        if bins < 1 or bins > 100:
+            return jsonify({"error": "bins must be between 1 and 100"}), 400
         
-        user_id = get_jwt_identity()
-        print(f"User ID from JWT: {user_id}")
+        report_path = os.path.join("reports", f"{batch_id}.pkl")
+        if not os.path.exists(report_path):
+            logger.debug("report not found", extra={"batch_id": batch_id})
+            return jsonify({"error": "Report not found"}), 404
+            
+        with open(report_path, 'rb') as f:
+            report_data = pickle.load(f)
         
-        # Check if pre-generated visualizations exist
-        viz_path = os.path.join("reports", f"{batch_id}_viz.json")
-        if os.path.exists(viz_path):
-            print(f"Using pre-generated visualizations from {viz_path}")
+        return jsonify({
+            "batch_id": batch_id,
+            "chart_data": compute_chart_data(report_data, bins=bins)
+        })
+        
+    except Exception as e:
+        logger.exception("failed to get chart data", extra={"batch_id": batch_id})
+        return jsonify({"error": f"Failed to get chart data: {str(e)}"}), 500
+
+# Add endpoint to get visualization data
+@api.route("/report/<batch_id>/visualizations", methods=["GET", "OPTIONS"])
+@jwt_required(optional=True)  # Make JWT optional for testing
+def get_visualizations(batch_id):
+    if request.method == "OPTIONS":
+        response = current_app.make_default_options_response()
+        return response
+    
+    try:
+        # Serve pre-generated visualizations if rendering has finished
+        viz_path = viz_path_for(batch_id)
+        pregenerated = os.path.exists(viz_path)
+        record_cache("visualizations", pregenerated)
+        if pregenerated:
+            logger.debug("serving pre-generated visualizations", extra={"batch_id": batch_id, "user_id": get_jwt_identity()})
             with open(viz_path, 'r') as f:
                 viz_data = json.load(f)
-                return jsonify(viz_data)
+            return cacheable_response(jsonify(viz_data))
         
-        # Load report data
         report_path = os.path.join("reports", f"{batch_id}.pkl")
         if not os.path.exists(report_path):
-            print(f"Report not found: {report_path}")
+            logger.debug("report not found", extra={"batch_id": batch_id})
             return jsonify({"error": "Report not found"}), 404
-            
-        with open(report_path, 'rb') as f:
-            report_data = pickle.load(f)
         
-        print(f"Report data loaded successfully for batch {batch_id}")
+        # A previous render failed: report it once, the next request retries
+        if visualization_renderer.status(batch_id) == "failed":
+            error = visualization_renderer.pop_error(batch_id)
+            return jsonify({"error": f"Failed to generate visualizations: {error}"}), 500
         
-        # Generate visualizations with thread safety
-        visualizations = {}
-        with visualization_lock:
-            try:
-                # Clear any existing plots
-                plt.close('all')
-                
-                # 1. Pie chart of spam vs ham
-                plt.figure(figsize=(8, 8))
-                plt.pie(
-                    [report_data["spam_count"], report_data["ham_count"]], 
-                    labels=["Spam", "Ham"], 
-                    autopct='%1.1f%%',
-                    colors=['#ff6b6b', '#4ecdc4']
-                )
-                plt.title('Spam vs Ham Distribution')
-                
-                buf = io.BytesIO()
-                plt.savefig(buf, format='png', bbox_inches='tight')
-                buf.seek(0)
-                visualizations["pie_chart"] = base64.b64encode(buf.read()).decode('utf-8')
-                plt.close()
-                
-                # 2. Confidence distribution histogram
-                confidences = [result["confidence"] for result in report_data["results"]]
-                spam_confidences = [result["confidence"] for result in report_data["results"] if result["prediction"] == "spam"]
-                ham_confidences = [result["confidence"] for result in report_data["results"] if result["prediction"] == "ham"]
-                
-                plt.figure(figsize=(10, 6))
-                if spam_confidences:
-                    sns.histplot(spam_confidences, color='#ff6b6b', label='Spam', alpha=0.7, bins=10)
-                if ham_confidences:
-                    sns.histplot(ham_confidences, color='#4ecdc4', label='Ham', alpha=0.7, bins=10)
-                plt.title('Confidence Distribution')
-                plt.xlabel('Confidence (%)')
-                plt.ylabel('Count')
-                plt.legend()
-                
-                buf = io.BytesIO()
-                plt.savefig(buf, format='png', bbox_inches='tight')
-                buf.seek(0)
-                visualizations["confidence_histogram"] = base64.b64encode(buf.read()).decode('utf-8')
-                plt.close()
-                
-                # 3. Word influence visualization
-                all_words = []
-                for result in report_data["results"]:
-                    for word_info in result["word_influence"]:
-                        all_words.append((word_info["word"], abs(word_info["influence"])))
-                
-                word_influences = {}
-                for word, influence in all_words:
-                    if word in word_influences:
-                        word_influences[word] += influence
-                    else:
-                        word_influences[word] = influence
-                
-                sorted_words = sorted(word_influences.items(), key=lambda x: x[1], reverse=True)[:30]
-                words = [item[0] for item in sorted_words]
-                influences = [item[1] for item in sorted_words]
-                
-                plt.figure(figsize=(12, 8))
-                plt.barh(words, influences, color='#6c5ce7')
-                plt.title('Top Influential Words')
-                plt.xlabel('Influence Score')
-                plt.tight_layout()
-                
-                buf = io.BytesIO()
-                plt.savefig(buf, format='png', bbox_inches='tight')
-                buf.seek(0)
-                visualizations["word_influence"] = base64.b64encode(buf.read()).decode('utf-8')
-                plt.close()
-                
-                print(f"Generated {len(visualizations)} visualizations successfully")
-                
-                # Save visualizations to file for future use
-                try:
-                    with open(viz_path, 'w') as f:
-                        json.dump({"visualizations": visualizations}, f)
-                    print(f"Saved visualizations to {viz_path}")
-                except Exception as save_error:
-                    print(f"Error saving visualizations: {str(save_error)}")
-                
-            except Exception as viz_error:
-                print(f"Error generating visualizations: {str(viz_error)}")
-                if not visualizations:
-                    return jsonify({"error": f"Failed to generate visualizations: {str(viz_error)}"}), 500
+        # Never render on the request path; queue it (no-op if already queued)
+        status = visualization_renderer.submit(batch_id)
+        if status == "ready":
+            with open(viz_path, 'r') as f:
+                return cacheable_response(jsonify(json.load(f)))
         
-        return jsonify({"visualizations": visualizations})
+        return jsonify({"status": "pending", "batch_id": batch_id}), 202
         
     except Exception as e:
-        print(f"Error in visualization endpoint: {str(e)}")
+        logger.exception("visualization request failed", extra={"batch_id": batch_id})
         return jsonify({"error": f"Failed to process visualization request: {str(e)}"}), 500
 
 
+
+# Add endpoint to get a single chart in a given format and size
+@api.route("/report/<batch_id>/visualizations/<chart>", methods=["GET", "OPTIONS"])
+@jwt_required(optional=True)  # Make JWT optional for testing
+def get_visualization_chart(batch_id, chart):
+    if request.method == "OPTIONS":
+        response = current_app.make_default_options_response()
+        return response
+    
+    try:
+        if chart not in CHART_NAMES:
+            return jsonify({"error": f"Unknown chart. Use one of: {', '.join(CHART_NAMES)}"}), 404
+        
+        fmt = request.args.get("format", "png").lower()
+        if fmt not in CHART_FORMATS:
+            return jsonify({"error": f"Unsupported format. Use one of: {', '.join(CHART_FORMATS)}"}), 400
+        
+        width = request.args.get("width", type=int)
+        dpi = request.args.get("dpi", type=int)
+        if width is not None and not (50 <= width <= 4000):
+            return jsonify({"error": "width must be between 50 and 4000 pixels"}), 400
+        if dpi is not None and not (MIN_DPI <= dpi <= MAX_DPI):
+            return jsonify({"error": f"dpi must be between {MIN_DPI} and {MAX_DPI}"}), 400
+        dpi = resolve_dpi(chart, width=width, dpi=dpi)
+        
+        report_path = os.path.join("reports", f"{batch_id}.pkl")
+        if not os.path.exists(report_path):
+            return jsonify({"error": "Report not found"}), 404
+        
+        # Render in the process pool; wait briefly so small thumbnails can be
+        # served in one round trip, otherwise tell the client to retry
+        future = visualization_renderer.submit_chart(batch_id, chart, fmt, dpi)
+        if future is not None:
+            try:
+                future.result(timeout=current_app.config["VISUALIZATION_WAIT_SECONDS"])
+            except concurrent.futures.TimeoutError:
+                return jsonify({"status": "pending", "batch_id": batch_id, "chart": chart}), 202
+        
+        chart_path = visualization_renderer.cache.get(batch_id, chart, fmt, dpi)
+        if chart_path is None:
+            return jsonify({"error": "Failed to render chart"}), 500
+        
+        response = send_file(chart_path, mimetype=CHART_FORMATS[fmt], conditional=False)
+        response.set_etag(visualization_renderer.cache.etag_for(batch_id, chart, fmt, dpi))
+        return cacheable_response(response)
+        
+    except Exception as e:
+        logger.exception("chart request failed", extra={"batch_id": batch_id, "chart": chart})
+        return jsonify({"error": f"Failed to process chart request: {str(e)}"}), 500
+
+
 # Add debug endpoint to check reports directory
-@app.route("/debug/reports", methods=["GET"])
+@api.route("/debug/reports", methods=["GET"])
 def debug_reports():
     try:
         reports_dir = "reports"
@@ -988,18 +1338,25 @@ def debug_reports():
             "cwd": os.getcwd()
         })
 
+# Add debug endpoint for /predict micro-batching statistics
+@api.route("/debug/batching", methods=["GET"])
+def debug_batching():
+    if predict_batcher is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **predict_batcher.stats()})
+
 # Add endpoint to list available reports
-@app.route("/list_reports", methods=["GET", "OPTIONS"])
+@api.route("/list_reports", methods=["GET", "OPTIONS"])
 def list_reports():
     if request.method == "OPTIONS":
-        response = app.make_default_options_response()
+        response = current_app.make_default_options_response()
         return response
         
     try:
         reports_dir = "reports"
         if not os.path.exists(reports_dir):
             os.makedirs(reports_dir)
-            print(f"Created reports directory at {os.path.abspath(reports_dir)}")
+            logger.info("created reports directory", extra={"path": os.path.abspath(reports_dir)})
             return jsonify({"reports": []})
             
         report_files = [f for f in os.listdir(reports_dir) if f.endswith('.pkl')]
@@ -1020,18 +1377,18 @@ def list_reports():
                     "ham_count": report_data.get("ham_count", 0)
                 })
             except Exception as e:
-                print(f"Error loading report {filename}: {str(e)}")
+                logger.warning("failed to load report", exc_info=True, extra={"report_file": filename})
                 
         # Sort by timestamp (newest first)
         reports.sort(key=lambda x: x["timestamp"], reverse=True)
         
         return jsonify({"reports": reports})
     except Exception as e:
-        print(f"Error listing reports: {str(e)}")
+        logger.exception("failed to list reports")
         return jsonify({"error": f"Failed to list reports: {str(e)}"}), 500
 
 # Add endpoint to serve the static visualization page
-@app.route("/visualizations", methods=["GET"])
+@api.route("/visualizations", methods=["GET"])
 def visualizations_page():
     try:
         with open("static_visualizations.html", "r") as f:
@@ -1040,29 +1397,56 @@ def visualizations_page():
     except Exception as e:
         return f"Error loading visualization page: {str(e)}"
 
+@api.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Prometheus text format; summed over all workers when METRICS_DIR is set."""
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
+
 # Add a health check endpoint
-@app.route("/health", methods=["GET"])
+@api.route("/health", methods=["GET"])
 def health_check():
     return jsonify({"status": "healthy", "timestamp": datetime.datetime.now().isoformat()})
 
 
+@api.route("/ready", methods=["GET"])
+def readiness_check():
+    """Readiness for load balancers: 503 until the warm-up has finished."""
+    status = warmup.snapshot()
+    status["model_version"] = model_store.current_version()
+    status["model_load_count"] = model_store.load_count
+    status["models"] = model_registry.names()
+    status["sklearn_version_mismatches"] = model_registry.sklearn_version_mismatches()
+    return jsonify(status), 200 if warmup.is_ready() else 503
+
+
 if __name__ == "__main__":
+    app = create_app()
     print("Starting Flask server for Spam Detection API...")
-    print(f"Dataset loaded with {len(df)} entries")
     print("API endpoints:")
     print("  - GET  / : Health check")
+    print("  - GET  /ready : Readiness (503 until model warm-up has finished)")
+    print("  - GET  /metrics : Prometheus metrics (request/stage latency, batch sizes, caches, queues)")
     print("  - POST /register : Register a new user")
     print("  - POST /login : Login a user")
     print("  - GET  /user : Get user details (requires auth)")
     print("  - PUT  /user/settings : Update user settings (requires auth)")
     print("  - POST /predict : Analyze messages for spam (requires auth)")
+    print("  - POST /predict/stream : Stream NDJSON messages in, NDJSON results out")
+    print("  - POST /feedback : Mark a message as spam/ham to update the model")
+    print("  - GET  /model/versions : List model versions")
+    print("  - GET  /models : List models, serving mode and per-model latency/disagreement")
+    print("  - GET  /cascade/stats : Pre-classifier cascade hit rates and latency")
+    print("  - POST /model/rollback : Restore the previous model version (requires auth)")
     print("  - GET  /history : Get user's scan history (requires auth)")
     print("  - GET  /history/<scan_id> : Get details of a specific scan (requires auth)")
     print("  - GET  /word-stats : Get influential words for spam detection")
     print("  - POST /bulk-analyze : Analyze multiple emails from a file (requires auth)")
     print("  - GET  /report/<batch_id> : Get details of a bulk analysis report (requires auth)")
     print("  - GET  /report/<batch_id>/download : Download report as CSV (requires auth)")
+    print("  - GET  /report/<batch_id>/chart-data : Get chart aggregates as JSON (requires auth)")
     print("  - GET  /report/<batch_id>/visualizations : Get visualizations for a report (requires auth)")
+    print("  - GET  /report/<batch_id>/visualizations/<chart> : Get one chart as png/svg/webp at a given width or dpi")
     print("  - GET  /list_reports : List all available reports")
     print("  - GET  /visualizations : View visualizations in browser")
     print("  - GET  /debug/reports : Debug information about reports directory")
@@ -0,0 +1,264 @@
+"""Plain-array export of the spam pipeline and a scikit-learn free scorer.
+
+`export` writes the fitted TfidfVectorizer + MultinomialNB pipeline as a
+directory of .npy files (vocabulary, stop words, IDF, class log-priors,
+feature log-probabilities) plus a small meta.json. ArrayModel loads them
+with np.load(mmap_mode='r'), so worker processes share the pages, and
+scores with NumPy/SciPy only, repeating the exact floating point operations
+scikit-learn 1.0 performs so predictions and probabilities are identical.
+
+The weights can also be exported in reduced precision (--dtype float32 or
+float16) to shrink the artifact and the pages each worker maps; those
+artifacts are scored in float32 and are close to, not identical with, the
+pipeline (benchmarks/bench_precision.py measures how close).
+
+Usage:
+  python array_model.py export --model spam_model.pkl --output spam_model_arrays [--dtype float32]
+  python array_model.py verify --model spam_model.pkl --artifact spam_model_arrays --dataset dataset.csv
+"""
+import os
+import re
+import sys
+import json
+import shutil
+import argparse
+
+import numpy as np
+from scipy import sparse
+from scipy.special import logsumexp
+
+FORMAT_VERSION = 1
+DTYPES = ('float64', 'float32', 'float16')
+ARRAYS = ("terms", "stop_words", "idf", "classes", "class_log_prior", "feature_log_prob")
+
+
+def export_pipeline(pipeline, output_dir, dtype='float64'):
+    """Write the arrays of a fitted tfidf/clf pipeline to output_dir."""
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported dtype '{dtype}'")
+    vectorizer = pipeline.named_steps['tfidf']
+    classifier = pipeline.named_steps['clf']
+
+    unsupported = {
+        "analyzer": vectorizer.analyzer != 'word',
+        "tokenizer": vectorizer.tokenizer is not None,
+        "preprocessor": vectorizer.preprocessor is not None,
+        "strip_accents": vectorizer.strip_accents is not None,
+        "binary": vectorizer.binary,
+        "sublinear_tf": vectorizer.sublinear_tf,
+        "norm": vectorizer.norm not in ('l2', None)
+    }
+    unsupported = [name for name, flag in unsupported.items() if flag]
+    if unsupported:
+        raise ValueError(f"Unsupported vectorizer settings for array export: {', '.join(unsupported)}")
+
+    vocabulary = vectorizer.vocabulary_
+    terms = sorted(vocabulary, key=vocabulary.get)
+    stop_words = vectorizer.get_stop_words() or ()
+
+    arrays = {
+        "terms": np.array(terms, dtype=str),
+        "stop_words": np.array(sorted(stop_words), dtype=str),
+        "idf": np.asarray(vectorizer.idf_ if vectorizer.use_idf else np.ones(len(terms)), dtype=dtype),
+        "classes": np.asarray(classifier.classes_),
+        "class_log_prior": np.asarray(classifier.class_log_prior_, dtype=dtype),
+        "feature_log_prob": np.ascontiguousarray(classifier.feature_log_prob_, dtype=dtype)
+    }
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "dtype": dtype,
+        "lowercase": bool(vectorizer.lowercase),
+        "token_pattern": vectorizer.token_pattern,
+        "ngram_range": list(vectorizer.ngram_range),
+        "use_idf": bool(vectorizer.use_idf),
+        "norm": vectorizer.norm
+    }
+
+    # Build next to the target and swap it in, so a reader never sees half an export
+    tmp_dir = f"{output_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+    with open(os.path.join(tmp_dir, "meta.json"), 'w') as f:
+        json.dump(meta, f, indent=2)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+    return meta
+
+
+class ArrayModel:
+    """Scores messages from an exported artifact with NumPy and SciPy only.
+
+    Exposes predict/predict_proba like the sklearn Pipeline, plus transform
+    and get_feature_names_out for word-influence explanations.
+    """
+
+    def __init__(self, artifact_dir, mmap=True):
+        with open(os.path.join(artifact_dir, "meta.json"), 'r') as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported array model format: {self.meta.get('format_version')}")
+
+        mmap_mode = 'r' if mmap else None
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(artifact_dir, f"{name}.npy"), mmap_mode=mmap_mode))
+
+        self.vocabulary = {term: idx for idx, term in enumerate(self.terms.tolist())}
+        self._stop_words = frozenset(self.stop_words.tolist())
+        self._token_pattern = re.compile(self.meta["token_pattern"])
+        self._min_n, self._max_n = self.meta["ngram_range"]
+        # float16 weights are widened per product: SciPy sparse has no float16 kernels
+        self.compute_dtype = np.float64 if self.meta["dtype"] == 'float64' else np.float32
+        self._idf_diag = sparse.diags(np.asarray(self.idf, dtype=self.compute_dtype), offsets=0,
+                                      shape=(len(self.terms), len(self.terms)), format='csr')
+
+    def get_feature_names_out(self):
+        return self.terms
+
+    def analyze(self, doc):
+        """Tokens and n-grams of one message, as CountVectorizer's word analyzer."""
+        if isinstance(doc, bytes):
+            doc = doc.decode('utf-8', 'strict')
+        if self.meta["lowercase"]:
+            doc = doc.lower()
+        tokens = [token for token in self._token_pattern.findall(doc) if token not in self._stop_words]
+
+        if self._max_n == 1:
+            return tokens
+        original = tokens
+        min_n = self._min_n
+        if min_n == 1:
+            tokens = list(original)
+            min_n += 1
+        else:
+            tokens = []
+        for n in range(min_n, min(self._max_n + 1, len(original) + 1)):
+            for i in range(len(original) - n + 1):
+                tokens.append(" ".join(original[i:i + n]))
+        return tokens
+
+    def counts(self, messages):
+        indices, values, indptr = [], [], [0]
+        for message in messages:
+            counter = {}
+            for feature in self.analyze(message):
+                idx = self.vocabulary.get(feature)
+                if idx is not None:
+                    counter[idx] = counter.get(idx, 0) + 1
+            indices.extend(counter.keys())
+            values.extend(counter.values())
+            indptr.append(len(indices))
+        X = sparse.csr_matrix(
+            (np.asarray(values, dtype=np.int64), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int32)),
+            shape=(len(indptr) - 1, len(self.terms))
+        )
+        X.sort_indices()
+        return X
+
+    def transform(self, messages):
+        """TF-IDF matrix of the messages, equal to the fitted vectorizer's."""
+        X = self.counts(messages).astype(self.compute_dtype)
+        if self.meta["use_idf"]:
+            X = X * self._idf_diag
+        if self.meta["norm"] == 'l2':
+            _normalize_rows_l2(X)
+        return X
+
+    def _joint_log_likelihood(self, X):
+        feature_log_prob = self.feature_log_prob
+        if feature_log_prob.dtype != self.compute_dtype:
+            feature_log_prob = feature_log_prob.astype(self.compute_dtype)
+        return X @ feature_log_prob.T + self.class_log_prior.astype(self.compute_dtype)
+
+    def predict_log_proba(self, messages):
+        jll = self._joint_log_likelihood(self.transform(messages))
+        return jll - np.atleast_2d(logsumexp(jll, axis=1)).T
+
+    def predict_proba(self, messages):
+        return np.exp(self.predict_log_proba(messages))
+
+    def predict(self, messages):
+        jll = self._joint_log_likelihood(self.transform(messages))
+        return self.classes[np.argmax(jll, axis=1)]
+
+
+def _normalize_rows_l2(X):
+    """In-place row L2 normalization of a CSR matrix.
+
+    Squares are summed left to right in storage order, as scikit-learn's
+    inplace_csr_row_normalize_l2 does, so the norms match to the last bit;
+    padding rows with trailing zeros and using a sequential cumulative sum
+    keeps that order while staying vectorized.
+    """
+    lengths = np.diff(X.indptr)
+    if not len(lengths) or not lengths.max():
+        return
+    padded = np.zeros((X.shape[0], lengths.max()), dtype=X.dtype)
+    mask = np.arange(lengths.max()) < lengths[:, None]
+    padded[mask] = X.data
+    sums = np.cumsum(padded * padded, axis=1)[:, -1]
+    norms = np.sqrt(sums)
+    norms[sums == 0.0] = 1.0
+    X.data /= np.repeat(norms, lengths)
+
+
+def artifact_size(artifact_dir):
+    return sum(os.path.getsize(os.path.join(artifact_dir, name)) for name in os.listdir(artifact_dir))
+
+
+def verify(pipeline, model, messages):
+    """Compare an ArrayModel against the sklearn pipeline on messages."""
+    expected_proba = pipeline.predict_proba(messages)
+    actual_proba = model.predict_proba(messages)
+    return {
+        "messages": len(messages),
+        "predictions_equal": bool(np.array_equal(pipeline.predict(messages), model.predict(messages))),
+        "probabilities_equal": bool(np.array_equal(expected_proba, actual_proba)),
+        "max_probability_diff": float(np.abs(expected_proba - actual_proba).max()) if len(messages) else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the spam pipeline to plain arrays and verify the NumPy scorer.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = sub.add_parser("export", help="write the array artifact")
+    export_parser.add_argument("--model", default="spam_model.pkl")
+    export_parser.add_argument("--output", default="spam_model_arrays")
+    export_parser.add_argument("--dtype", choices=DTYPES, default="float64",
+                               help="weight precision; only float64 is bit-for-bit equivalent")
+
+    verify_parser = sub.add_parser("verify", help="check the artifact scores exactly like the pipeline")
+    verify_parser.add_argument("--model", default="spam_model.pkl")
+    verify_parser.add_argument("--artifact", default="spam_model_arrays")
+    verify_parser.add_argument("--dataset", default="dataset.csv")
+    verify_parser.add_argument("--sample", type=int, default=5000)
+    args = parser.parse_args()
+
+    import joblib
+    pipeline = joblib.load(args.model)
+
+    if args.command == "export":
+        meta = export_pipeline(pipeline, args.output, dtype=args.dtype)
+        print(f"Exported {args.model} to {args.output} ({artifact_size(args.output) / 1024:.1f} KB, "
+              f"{meta['dtype']}, ngram_range={meta['ngram_range']})")
+        return
+
+    from train import iter_chunks
+
+    messages = []
+    for texts, _ in iter_chunks(args.dataset, args.sample):
+        messages.extend(texts)
+        if len(messages) >= args.sample:
+            break
+    messages = messages[:args.sample]
+
+    result = verify(pipeline, ArrayModel(args.artifact), messages)
+    print(json.dumps(result, indent=2))
+    if not (result["predictions_equal"] and result["probabilities_equal"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
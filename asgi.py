@@ -0,0 +1,459 @@
+"""Entry point for ASGI servers.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+
+Reading reports (JSON and the CSV download), scan history and pre-rendered
+visualizations is I/O-bound, so those GET endpoints are served natively on
+the event loop. Files are stat'ed, read and unpickled on a small I/O thread
+pool, and the CSV download is streamed in chunks, so a slow client holds a
+coroutine rather than a thread. Every other request, /predict included,
+runs the Flask app on its own thread pool. CPU-bound scoring therefore
+never waits behind report traffic. Request bodies reach Flask as a stream
+read from the event loop on demand, so uploads are not buffered first.
+"""
+import io
+import os
+import re
+import csv
+import sys
+import time
+import pickle
+import asyncio
+import logging
+import hashlib
+import itertools
+import collections
+import concurrent.futures
+
+from flask import json as flask_json
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from werkzeug.exceptions import ClientDisconnected
+
+import app as server
+from app import create_app, iter_report_csv, load_history, CORS_ORIGINS
+from visualizations import REPORTS_DIR, viz_path_for
+from structured_logging import start_request, request_id_var
+from metrics import record_request, record_cache
+
+logger = logging.getLogger("spam_api.asgi")
+
+# Read size of the buffered request body stream handed to the Flask app
+WSGI_INPUT_BUFFER_BYTES = 64 * 1024
+
+
+def report_path(batch_id):
+    return os.path.join(REPORTS_DIR, f"{batch_id}.pkl")
+
+
+def load_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def json_body(flask_app, data):
+    """Encode data like jsonify() does outside debug mode."""
+    with flask_app.app_context():
+        return (flask_json.dumps(data, separators=(",", ":")) + "\n").encode('utf-8')
+
+
+def header(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+
+def verify_token(flask_app, scope, optional=False):
+    """Run flask_jwt_extended's @jwt_required checks against a request's headers.
+
+    Returns (identity, None), or (None, error response) as built by the
+    JWTManager's error handlers, so expiry, the blocklist, token types and
+    the JWT_* settings are all handled exactly as for the Flask routes.
+    """
+    headers = [(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope["headers"]]
+    with flask_app.test_request_context(scope["path"], query_string=scope["query_string"].decode('latin-1'), headers=headers):
+        try:
+            verify_jwt_in_request(optional=optional)
+            return get_jwt_identity(), None
+        except Exception as e:
+            # Re-raised when no JWT error handler matches
+            return None, flask_app.make_response(flask_app.handle_user_exception(e))
+
+
+class ReceiveStream(io.RawIOBase):
+    """An ASGI request body as a blocking file for a WSGI thread.
+
+    Each read waits for the next body message from the event loop, so the
+    upload streams into Flask as it arrives and the client's pace sets the
+    reader's.
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._chunk = memoryview(b"")
+        self._more = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._chunk and self._more:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message["type"] == "http.disconnect":
+                self._more = False
+                raise ClientDisconnected()
+            self._chunk = memoryview(message.get("body", b""))
+            self._more = message.get("more_body", False)
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+
+class ReportCache:
+    """Recently unpickled reports, keyed by path, mtime and size.
+
+    Only used from the event loop. Concurrent requests for a report that is
+    still loading wait on the same load rather than unpickling it again.
+    """
+
+    def __init__(self, max_entries, executor):
+        self.max_entries = max_entries
+        self.executor = executor
+        self._entries = collections.OrderedDict()
+        self._loading = {}
+
+    async def get(self, path):
+        loop = asyncio.get_running_loop()
+        stat = await loop.run_in_executor(self.executor, os.stat, path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        record_cache("reports", key in self._entries)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        if key not in self._loading:
+            future = loop.run_in_executor(self.executor, load_pickle, path)
+            future.add_done_callback(lambda done: self._loaded(key, done))
+            self._loading[key] = future
+        # A cancelled request must not cancel the load other requests wait on
+        return await asyncio.shield(self._loading[key])
+
+    def _loaded(self, key, future):
+        self._loading.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            self._entries[key] = future.result()
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def wsgi_environ(scope, body):
+    """PEP 3333 environ for an ASGI HTTP scope.
+
+    body is read to its end rather than to CONTENT_LENGTH
+    (wsgi.input_terminated), so chunked uploads work too.
+    """
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode('utf-8').decode('latin-1'),
+        "PATH_INFO": scope["path"].encode('utf-8').decode('latin-1'),
+        "QUERY_STRING": scope["query_string"].decode('latin-1'),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+        environ["REMOTE_PORT"] = str(scope["client"][1])
+
+    for name, value in scope["headers"]:
+        name = name.decode('latin-1').upper().replace("-", "_")
+        key = name if name in ("CONTENT_TYPE", "CONTENT_LENGTH") else f"HTTP_{name}"
+        value = value.decode('latin-1')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def run_wsgi(wsgi_app, environ, send_sync):
+    """Run a WSGI app in the calling thread, passing its response to send_sync."""
+    response = {"started": False}
+
+    def write(data):
+        if not response["started"]:
+            send_sync({"type": "http.response.start", "status": response["status"], "headers": response["headers"]})
+            response["started"] = True
+        if data:
+            send_sync({"type": "http.response.body", "body": data, "more_body": True})
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and response["started"]:
+            raise exc_info[1].with_traceback(exc_info[2])
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+        return write
+
+    result = wsgi_app(environ, start_response)
+    try:
+        # Streaming responses (/predict/stream) are forwarded chunk by chunk
+        for chunk in result:
+            write(chunk)
+        write(b"")
+        send_sync({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+
+
+class AsyncApp:
+    """ASGI app: async report/history/visualization reads, Flask for the rest."""
+
+    def __init__(self, flask_app, io_threads=32, wsgi_threads=16, report_cache_size=16, csv_chunk_rows=500):
+        self.flask_app = flask_app
+        self.io_executor = concurrent.futures.ThreadPoolExecutor(io_threads, thread_name_prefix="asgi-io")
+        self.wsgi_executor = concurrent.futures.ThreadPoolExecutor(wsgi_threads, thread_name_prefix="asgi-wsgi")
+        self.reports = ReportCache(report_cache_size, self.io_executor)
+        self.csv_chunk_rows = csv_chunk_rows
+        # Only GET is served natively; OPTIONS preflights and other methods go
+        # to Flask. Templates match Flask's rules, for the same metric labels.
+        self.routes = [
+            ("/report/<batch_id>", re.compile(r"/report/([^/]+)"), self.get_report),
+            ("/report/<batch_id>/download", re.compile(r"/report/([^/]+)/download"), self.download_report),
+            ("/report/<batch_id>/visualizations", re.compile(r"/report/([^/]+)/visualizations"), self.get_visualizations),
+            ("/history", re.compile(r"/history"), self.get_history),
+            ("/history/<scan_id>", re.compile(r"/history/([^/]+)"), self.get_scan_details)
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            raise ValueError(f"Unsupported ASGI scope type '{scope['type']}'")
+
+        if scope["method"] == "GET":
+            for route, pattern, handler in self.routes:
+                match = pattern.fullmatch(scope["path"])
+                if match:
+                    # Each ASGI request runs in its own task, so this binds the id for this request only
+                    start_request(header(scope, b"x-request-id"), self.flask_app.config["LOG_DEBUG_SAMPLE_RATE"])
+                    return await self.call_native(route, handler, scope, receive, send, match.groups())
+        await self.call_wsgi(scope, receive, send)
+
+    async def call_native(self, route, handler, scope, receive, send, args):
+        response = {"status": 500}
+
+        async def tracked_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await handler(scope, receive, tracked_send, *args)
+        finally:
+            record_request(route, scope["method"], response["status"], time.perf_counter() - start)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.io_executor.shutdown(wait=False)
+                self.wsgi_executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def run_io(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.io_executor, fn, *args)
+
+    async def call_wsgi(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        body = io.BufferedReader(ReceiveStream(receive, loop), WSGI_INPUT_BUFFER_BYTES)
+        send_sync = lambda message: asyncio.run_coroutine_threadsafe(send(message), loop).result()
+        await loop.run_in_executor(self.wsgi_executor, run_wsgi, self.flask_app, wsgi_environ(scope, body), send_sync)
+
+    def response_headers(self, scope, content_type, extra=()):
+        headers = [
+            (b"content-type", content_type.encode('latin-1')),
+            (b"x-request-id", request_id_var.get().encode('latin-1'))
+        ]
+        # Same origins as the Flask-CORS set-up in create_app()
+        origin = header(scope, b"origin")
+        if origin in CORS_ORIGINS:
+            headers += [
+                (b"access-control-allow-origin", origin.encode('latin-1')),
+                (b"access-control-allow-credentials", b"true"),
+                (b"vary", b"Origin")
+            ]
+        return headers + list(extra)
+
+    async def send_body(self, scope, send, body, status=200, content_type="application/json", extra_headers=()):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": self.response_headers(scope, content_type, extra_headers)
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def send_json(self, scope, send, data, status=200):
+        # Large reports take a while to encode; keep that off the event loop
+        body = await self.run_io(json_body, self.flask_app, data)
+        await self.send_body(scope, send, body, status)
+
+    async def send_cacheable(self, scope, send, body):
+        """Like cacheable_response(): immutable, ETag'd, 304 on a matching If-None-Match."""
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        max_age = self.flask_app.config["VISUALIZATION_CACHE_MAX_AGE"]
+        extra = [
+            (b"cache-control", f"private, max-age={max_age}, immutable".encode('latin-1')),
+            (b"etag", etag.encode('latin-1'))
+        ]
+        if_none_match = header(scope, b"if-none-match") or ""
+        candidates = {tag.strip().replace("W/", "", 1) for tag in if_none_match.split(",")}
+        if etag in candidates or "*" in candidates:
+            await self.send_body(scope, send, b"", status=304, extra_headers=extra)
+        else:
+            await self.send_body(scope, send, body, extra_headers=extra)
+
+    async def authenticate(self, scope, send, optional=False):
+        """Check the request's token like @jwt_required (see verify_token).
+
+        Returns (ok, identity); on failure the error response has been sent.
+        """
+        identity, error = await self.run_io(verify_token, self.flask_app, scope, optional)
+        if error is not None:
+            await self.send_body(scope, send, error.get_data(), status=error.status_code, content_type=error.content_type)
+            return False, None
+        return True, identity
+
+    async def get_report(self, scope, receive, send, batch_id):
+        ok, _ = await self.authenticate(scope, send, optional=True)
+        if not ok:
+            return
+        try:
+            report_data = await self.reports.get(report_path(batch_id))
+        except FileNotFoundError:
+            return await self.send_json(scope, send, {"error": "Report not found"}, 404)
+        except Exception as e:
+            logger.exception("failed to get report", extra={"batch_id": batch_id})
+            return await self.send_json(scope, send, {"error": f"Failed to get report: {str(e)}"}, 500)
+        await self.send_json(scope, send, {"report": report_data})
+
+    async def download_report(self, scope, receive, send, batch_id):
+        ok, _ = await self.authenticate(scope, send, optional=True)
+        if not ok:
+            return
+        try:
+            report_data = await self.reports.get(report_path(batch_id))
+        except FileNotFoundError:
+            return await self.send_json(scope, send, {"error": "Report not found"}, 404)
+        except Exception as e:
+            logger.exception("failed to download report", extra={"batch_id": batch_id})
+            return await self.send_json(scope, send, {"error": f"Failed to download report: {str(e)}"}, 500)
+
+        # Stop writing rows as soon as the client goes away
+        disconnected = asyncio.Event()
+
+        async def watch_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        try:
+            filename = f"spam_analysis_report_{batch_id}.csv"
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": self.response_headers(scope, "text/csv; charset=utf-8", [
+                    (b"content-disposition", f"attachment; filename={filename}".encode('latin-1', 'replace'))
+                ])
+            })
+            rows = iter_report_csv(report_data)
+            while not disconnected.is_set():
+                chunk = list(itertools.islice(rows, self.csv_chunk_rows))
+                if not chunk:
+                    break
+                output = io.StringIO()
+                csv.writer(output).writerows(chunk)
+                # Awaiting send applies the client's backpressure
+                await send({"type": "http.response.body", "body": output.getvalue().encode('utf-8'), "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            watcher.cancel()
+
+    async def get_visualizations(self, scope, receive, send, batch_id):
+        ok, _ = await self.authenticate(scope, send, optional=True)
+        if not ok:
+            return
+        try:
+            # Pre-generated visualizations are served as stored, without re-encoding
+            viz_path = viz_path_for(batch_id)
+            try:
+                body = await self.run_io(read_bytes, viz_path)
+            except FileNotFoundError:
+                body = None
+            record_cache("visualizations", body is not None)
+            if body is not None:
+                return await self.send_cacheable(scope, send, body)
+
+            if not await self.run_io(os.path.exists, report_path(batch_id)):
+                return await self.send_json(scope, send, {"error": "Report not found"}, 404)
+
+            # A previous render failed: report it once, the next request retries
+            renderer = server.visualization_renderer
+            if await self.run_io(renderer.status, batch_id) == "failed":
+                error = renderer.pop_error(batch_id)
+                return await self.send_json(scope, send, {"error": f"Failed to generate visualizations: {error}"}, 500)
+
+            if await self.run_io(renderer.submit, batch_id) == "ready":
+                return await self.send_cacheable(scope, send, await self.run_io(read_bytes, viz_path))
+            await self.send_json(scope, send, {"status": "pending", "batch_id": batch_id}, 202)
+        except Exception as e:
+            logger.exception("visualization request failed", extra={"batch_id": batch_id})
+            await self.send_json(scope, send, {"error": f"Failed to process visualization request: {str(e)}"}, 500)
+
+    async def get_history(self, scope, receive, send):
+        ok, user_id = await self.authenticate(scope, send)
+        if not ok:
+            return
+        history = await self.run_io(load_history)
+        await self.send_json(scope, send, {"history": history.get(user_id, [])})
+
+    async def get_scan_details(self, scope, receive, send, scan_id):
+        ok, user_id = await self.authenticate(scope, send)
+        if not ok:
+            return
+        history = await self.run_io(load_history)
+        if user_id not in history:
+            return await self.send_json(scope, send, {"error": "No history found"}, 404)
+
+        scan = next((entry for entry in history[user_id] if entry["id"] == scan_id), None)
+        if not scan:
+            return await self.send_json(scope, send, {"error": "Scan not found"}, 404)
+        await self.send_json(scope, send, {"scan": scan})
+
+
+flask_app = create_app()
+application = AsyncApp(
+    flask_app,
+    io_threads=flask_app.config["ASGI_IO_THREADS"],
+    wsgi_threads=flask_app.config["ASGI_WSGI_THREADS"],
+    report_cache_size=flask_app.config["ASGI_REPORT_CACHE_SIZE"],
+    csv_chunk_rows=flask_app.config["ASGI_CSV_CHUNK_ROWS"]
+)
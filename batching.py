@@ -0,0 +1,116 @@
+import time
+import threading
+
+from metrics import BATCH_SIZE
+
+
+class _Pending:
+    __slots__ = ("message", "enqueued_at", "event", "result", "error")
+
+    def __init__(self, message):
+        self.message = message
+        self.enqueued_at = time.perf_counter()
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Collects concurrent single-message requests and scores them together.
+
+    A background thread waits for the first queued message, then keeps
+    collecting for up to max_wait seconds or max_batch_size messages, scores
+    the batch with one call to score_fn and hands each caller its result.
+    """
+
+    def __init__(self, score_fn, max_batch_size=32, max_wait=0.002):
+        self.score_fn = score_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.condition = threading.Condition()
+        self._queue = []
+        self._thread = None
+
+        # Metrics (updated by the worker thread only)
+        self.batch_count = 0
+        self.message_count = 0
+        self.batch_size_counts = {}
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="predict-microbatcher", daemon=True)
+            self._thread.start()
+
+    def submit(self, message, timeout=30):
+        """Queue a message and block until its batch has been scored."""
+        pending = _Pending(message)
+        with self.condition:
+            self._ensure_worker()
+            self._queue.append(pending)
+            self.condition.notify()
+
+        if not pending.event.wait(timeout):
+            with self.condition:
+                # Still queued: drop it so it neither takes a batch slot nor counts
+                # in the metrics. Already taken: its batch is being scored anyway.
+                if pending in self._queue:
+                    self._queue.remove(pending)
+            raise TimeoutError("Timed out waiting for batched prediction")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _next_batch(self):
+        with self.condition:
+            while not self._queue:
+                self.condition.wait()
+            deadline = time.perf_counter() + self.max_wait
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            batch = self._queue[:self.max_batch_size]
+            del self._queue[:self.max_batch_size]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+            try:
+                results = self.score_fn([pending.message for pending in batch])
+                for pending, result in zip(batch, results):
+                    pending.result = result
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+
+            size = len(batch)
+            BATCH_SIZE.observe(size, "predict_microbatch")
+            self.batch_count += 1
+            self.message_count += size
+            self.batch_size_counts[size] = self.batch_size_counts.get(size, 0) + 1
+            for pending in batch:
+                waited = started - pending.enqueued_at
+                self.queue_wait_total += waited
+                self.queue_wait_max = max(self.queue_wait_max, waited)
+                pending.event.set()
+
+    def queue_depth(self):
+        return len(self._queue)
+
+    def stats(self):
+        return {
+            "batches": self.batch_count,
+            "messages": self.message_count,
+            "mean_batch_size": round(self.message_count / self.batch_count, 2) if self.batch_count else 0,
+            "batch_sizes": {str(size): count for size, count in sorted(self.batch_size_counts.items())},
+            "mean_queue_wait_ms": round(self.queue_wait_total / self.message_count * 1000, 3) if self.message_count else 0,
+            "max_queue_wait_ms": round(self.queue_wait_max * 1000, 3),
+            "queue_depth": self.queue_depth(),
+            "window_ms": self.max_wait * 1000,
+            "max_batch_size": self.max_batch_size
+        }
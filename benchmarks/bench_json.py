@@ -0,0 +1,113 @@
+"""Encode time and output size of /report responses per JSON backend.
+
+Builds a {"report": ...} payload from the saved reports (results repeated
+up to --rows rows, as a large bulk upload would produce) and encodes it
+the way jsonify() does with:
+  - flask: Flask's stock encoder (the previous default),
+  - stdlib: NumpyJSONEncoder, Flask's encoder plus NumPy support,
+  - orjson: OrjsonEncoder, when the orjson package is installed.
+Each backend also encodes a copy whose confidences and influences are left
+as NumPy float32 scalars, which Flask's stock encoder cannot encode.
+
+Usage: python benchmarks/bench_json.py [--reports 'reports/*.pkl'] [--rows 5000] [--repeat 5]
+"""
+import os
+import sys
+import copy
+import glob
+import json
+import time
+import pickle
+import argparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import numpy as np
+from flask.json import JSONEncoder
+from json_provider import NumpyJSONEncoder, OrjsonEncoder, orjson
+
+
+def load_payload(pattern, rows):
+    reports = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, 'rb') as f:
+            reports.append(pickle.load(f))
+    reports = [report for report in reports if report.get("results")]
+    if not reports:
+        sys.exit(f"No reports with results match {pattern}")
+
+    # The largest report supplies the summary fields; rows come from all of them
+    report = copy.deepcopy(max(reports, key=lambda r: len(r["results"])))
+    pool = [result for r in reports for result in r["results"]]
+    report["results"] = [copy.deepcopy(pool[i % len(pool)]) for i in range(max(rows, len(pool)))]
+    return {"report": report}, len(reports)
+
+
+def with_numpy_values(payload):
+    payload = copy.deepcopy(payload)
+    for result in payload["report"]["results"]:
+        result["confidence"] = np.float32(result["confidence"])
+        for item in result.get("word_influence", []):
+            item["influence"] = np.float32(item["influence"])
+    return payload
+
+
+def time_encode(encoder_cls, payload, repeat):
+    """Best-of-repeat seconds and the output, encoded as jsonify() does."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = encoder_cls(sort_keys=True, separators=(",", ":")).encode(payload)
+        timings.append(time.perf_counter() - start)
+    return min(timings), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reports", default=os.path.join(REPO_ROOT, "reports", "*.pkl"))
+    parser.add_argument("--rows", type=int, default=5000, help="result rows in the encoded report")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payload, report_count = load_payload(args.reports, args.rows)
+    numpy_payload = with_numpy_values(payload)
+    backends = {"flask": JSONEncoder, "stdlib": NumpyJSONEncoder}
+    if orjson is not None:
+        backends["orjson"] = OrjsonEncoder
+
+    reference = None
+    results = []
+    for name, encoder_cls in backends.items():
+        seconds, body = time_encode(encoder_cls, payload, args.repeat)
+        decoded = json.loads(body)
+        if reference is None:
+            reference = decoded
+        row = {
+            "backend": name,
+            "encode_ms": round(seconds * 1000, 2),
+            "bytes": len(body.encode('utf-8')),
+            "identical_values": decoded == reference
+        }
+        try:
+            numpy_seconds, _ = time_encode(encoder_cls, numpy_payload, args.repeat)
+            row["numpy_values_encode_ms"] = round(numpy_seconds * 1000, 2)
+        except TypeError:
+            row["numpy_values_encode_ms"] = None  # Flask's stock encoder rejects NumPy scalars
+        results.append(row)
+
+    baseline = results[0]["encode_ms"]
+    for row in results:
+        row["speedup"] = round(baseline / row["encode_ms"], 2) if row["encode_ms"] else None
+
+    print(json.dumps({
+        "benchmark": "json_encoding",
+        "reports_loaded": report_count,
+        "rows": len(payload["report"]["results"]),
+        "orjson_installed": orjson is not None,
+        "results": results
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Per-message latency on adversarially long inputs.
+
+Scores (with word-influence explanation) a normal email and several
+pathological ones: inline base64 attachments, huge HTML and long repeated
+text, under each size policy. With the default head_tail/sample policies
+latency should stay flat as the input grows; with 'none' it grows linearly.
+
+Usage: python benchmarks/bench_long_messages.py [--max-chars N] [--repeat N]
+"""
+import os
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import joblib
+from scoring import predict_messages, spam_coefficients, SIZE_POLICIES
+
+
+def adversarial_inputs(rng):
+    normal = "Hi team, the quarterly report is attached. Let me know if you have questions before Friday's meeting."
+    inputs = {"normal": normal}
+    for megabytes in (1, 5):
+        blob = base64.b64encode(rng.randbytes(megabytes * 1024 * 1024 * 3 // 4)).decode('ascii')
+        inputs[f"base64_{megabytes}mb"] = f"Please see the attachment. {blob} Click here to claim your prize!"
+    row = "<tr><td class='cell'>Limited offer &amp; free gift</td><td><a href='http://x.example/win'>win</a></td></tr>"
+    inputs["html_2mb"] = "<html><body><table>" + row * (2 * 1024 * 1024 // len(row)) + "</table></body></html>"
+    inputs["repeated_words_2mb"] = ("free money winner urgent " * (2 * 1024 * 1024 // 25))
+    return inputs
+
+
+def time_scoring(model, explainer, message, policy, max_chars, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        predict_messages(model, [message], explainer=explainer, size_policy=policy, max_chars=max_chars)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=os.path.join(REPO_ROOT, "spam_model.pkl"))
+    parser.add_argument("--max-chars", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    explainer = (model.named_steps['tfidf'].get_feature_names_out(),
+                 spam_coefficients(model.named_steps['clf']))
+
+    results = []
+    for name, message in adversarial_inputs(random.Random(0)).items():
+        row = {"input": name, "chars": len(message)}
+        for policy in SIZE_POLICIES:
+            seconds = time_scoring(model, explainer, message, policy, args.max_chars, args.repeat)
+            row[f"{policy}_ms"] = round(seconds * 1000, 2)
+        results.append(row)
+
+    print(json.dumps({"benchmark": "long_messages", "max_chars": args.max_chars, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Accuracy, agreement, memory and latency of reduced-precision models.
+
+Trains the serving pipeline (TF-IDF, max_features=5000 + MultinomialNB) on
+a split of the dataset and scores the held-out rows with:
+  - the sklearn pipeline in float64 (reference) and float32
+    (model_store.reduce_precision, what MODEL_PRECISION='float32' serves);
+  - array_model artifacts exported in float64, float32 and float16.
+For each it reports held-out accuracy, prediction agreement and the largest
+spam-probability difference against the reference, the bytes of weight
+arrays a worker holds, and per-message latency.
+
+Usage: python benchmarks/bench_precision.py [--dataset dataset.csv] [--test-size 0.2] [--repeat 3]
+"""
+import os
+import sys
+import json
+import time
+import copy
+import tempfile
+import argparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import numpy as np
+from array_model import ArrayModel, export_pipeline, artifact_size
+from model_store import reduce_precision
+from train import iter_chunks
+
+
+def weight_bytes_pipeline(model):
+    vectorizer = model.named_steps['tfidf']
+    classifier = model.named_steps['clf']
+    return int(vectorizer.idf_.nbytes + classifier.feature_log_prob_.nbytes + classifier.class_log_prior_.nbytes)
+
+
+def weight_bytes_arrays(model):
+    return int(model.idf.nbytes + model.feature_log_prob.nbytes + model.class_log_prior.nbytes)
+
+
+def best_time(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dataset", default=os.path.join(REPO_ROOT, "dataset.csv"))
+    parser.add_argument("--test-size", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.model_selection import train_test_split
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.pipeline import Pipeline
+
+    texts, labels = [], []
+    for chunk_texts, chunk_labels in iter_chunks(args.dataset, 100000):
+        texts.extend(chunk_texts)
+        labels.extend(chunk_labels.tolist())
+    train_texts, test_texts, train_labels, test_labels = train_test_split(
+        texts, np.array(labels), test_size=args.test_size, random_state=args.seed, stratify=labels
+    )
+
+    reference = Pipeline([
+        ('tfidf', TfidfVectorizer(stop_words='english', max_features=5000)),
+        ('clf', MultinomialNB())
+    ]).fit(train_texts, train_labels)
+
+    candidates = {
+        "pipeline_float64": (reference, weight_bytes_pipeline(reference), None),
+    }
+    pipeline32 = reduce_precision(copy.deepcopy(reference), 'float32')
+    candidates["pipeline_float32"] = (pipeline32, weight_bytes_pipeline(pipeline32), None)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype in ("float64", "float32", "float16"):
+            artifact_dir = os.path.join(tmp, dtype)
+            export_pipeline(reference, artifact_dir, dtype=dtype)
+            model = ArrayModel(artifact_dir)
+            candidates[f"arrays_{dtype}"] = (model, weight_bytes_arrays(model), artifact_size(artifact_dir))
+
+        reference_pred = reference.predict(test_texts)
+        reference_spam = reference.predict_proba(test_texts)[:, 1]
+
+        results = []
+        for name, (model, weight_bytes, size) in candidates.items():
+            predictions = model.predict(test_texts)
+            spam = model.predict_proba(test_texts)[:, 1]
+            seconds = best_time(lambda: model.predict_proba(test_texts), args.repeat)
+            results.append({
+                "model": name,
+                "accuracy": round(float((predictions == test_labels).mean()), 5),
+                "agreement": round(float((predictions == reference_pred).mean()), 5),
+                "max_spam_probability_diff": float(np.abs(spam - reference_spam).max()),
+                "weight_bytes": weight_bytes,
+                "artifact_bytes": size,
+                "latency_us_per_message": round(seconds / len(test_texts) * 1e6, 2)
+            })
+
+    print(json.dumps({
+        "benchmark": "precision",
+        "train_rows": len(train_texts),
+        "held_out_rows": len(test_texts),
+        "results": results
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
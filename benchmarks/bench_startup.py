@@ -0,0 +1,112 @@
+"""Startup benchmark for the API process.
+
+Measures the module import cost of ``app`` with ``python -X importtime``
+and the wall-clock cold start (interpreter launch until ``create_app()``
+has returned and the saved model is loaded and ready to score; warm-up is
+not included). With ``--check`` it exits non-zero when a budget is
+exceeded or when a lazily-imported dependency is pulled in at startup.
+tests/test_startup.py runs the lazy-import check under pytest; the timing
+budgets are only checked here, since they depend on the machine.
+
+The measured processes keep model versions and the feedback log in a
+temporary directory, so create_app() never writes to (or publishes into)
+the repository.
+
+Usage: python benchmarks/bench_startup.py [--check] [--runs N]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Documented targets (see README "Performance targets")
+IMPORT_BUDGET_SECONDS = 1.5
+COLD_START_TARGET_SECONDS = 3.0
+
+# Only needed by CSV parsing, training or chart rendering
+LAZY_MODULES = ("pandas", "matplotlib", "seaborn")
+
+# create_app() only opens the model store; current() loads the pickle
+COLD_START_SNIPPET = "import app; app.create_app(warmup_mode='off'); app.model_store.current()"
+
+
+def run_isolated(args, **kwargs):
+    """Run a Python subprocess in the repo with model state in a temp dir."""
+    state_dir = tempfile.mkdtemp(prefix="bench-startup-")
+    env = dict(os.environ,
+               MODEL_VERSIONS_DIR=os.path.join(state_dir, "model_versions"),
+               FEEDBACK_LOG_FILE=os.path.join(state_dir, "feedback.jsonl"))
+    try:
+        return subprocess.run([sys.executable, *args], cwd=REPO_ROOT, env=env, **kwargs)
+    finally:
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+
+def measure_import_time():
+    """Return (total_seconds, {module: cumulative_seconds}) for `import app`."""
+    proc = run_isolated(["-X", "importtime", "-c", "import app"], capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"import app failed:\n{proc.stderr[-2000:]}")
+
+    # Lines look like "import time:   self_us |   cumulative_us | <indent>module"
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative_us) / 1e6
+    return modules.get("app", 0.0), modules
+
+
+def measure_cold_start(runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run_isolated(["-c", COLD_START_SNIPPET], check=True, capture_output=True)
+        timings.append(time.perf_counter() - start)
+    return min(timings), sum(timings) / len(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--check", action="store_true", help="fail when over budget")
+    parser.add_argument("--runs", type=int, default=3, help="cold start repetitions")
+    args = parser.parse_args()
+
+    import_seconds, modules = measure_import_time()
+    best, mean = measure_cold_start(args.runs)
+    eager = [name for name in LAZY_MODULES if name in modules]
+
+    result = {
+        "benchmark": "startup",
+        "import_seconds": round(import_seconds, 3),
+        "import_budget_seconds": IMPORT_BUDGET_SECONDS,
+        "cold_start_best_seconds": round(best, 3),
+        "cold_start_mean_seconds": round(mean, 3),
+        "cold_start_target_seconds": COLD_START_TARGET_SECONDS,
+        "slowest_imports": sorted(modules.items(), key=lambda x: x[1], reverse=True)[:10],
+        "eagerly_imported_lazy_modules": eager,
+    }
+    print(json.dumps(result, indent=2))
+
+    if args.check:
+        failures = []
+        if import_seconds > IMPORT_BUDGET_SECONDS:
+            failures.append(f"import time {import_seconds:.2f}s exceeds {IMPORT_BUDGET_SECONDS}s")
+        if best > COLD_START_TARGET_SECONDS:
+            failures.append(f"cold start {best:.2f}s exceeds {COLD_START_TARGET_SECONDS}s")
+        if eager:
+            failures.append(f"imported at startup: {', '.join(eager)}")
+        for failure in failures:
+            print(f"FAIL: {failure}", file=sys.stderr)
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
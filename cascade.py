@@ -0,0 +1,186 @@
+"""Cheap pre-classification ahead of the model.
+
+Stages run in order on each message and the first one that decides wins:
+  - allowlist / blocklist: exact hashes of known-good messages and known
+    spam campaigns (sha256 of the lower-cased, whitespace-collapsed text,
+    one hex digest per line in a text file);
+  - rules: regular expressions compiled once at start-up, loaded from a
+    JSON list of {"name", "pattern", "label", "ignore_case", "reason"}.
+Undecided messages fall through to the model. Every stage records how many
+messages it checked and decided and the time it took.
+
+Hashes are taken over the full message, so a list entry only ever matches
+that exact message. Rules run on the text the model would score, i.e.
+after the MESSAGE_SIZE_POLICY limit, so a very large message costs the
+rule patterns no more than the model.
+
+Hashes for the lists can be produced with:
+  python cascade.py hash < messages.txt >> cascade_lists/blocklist.txt
+"""
+import re
+import sys
+import json
+import time
+import hashlib
+import threading
+
+LABELS = ("spam", "ham")
+
+
+def message_hash(message):
+    normalized = " ".join(message.split()).lower()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def load_hashes(path):
+    try:
+        with open(path, 'r') as f:
+            return {line.strip().lower() for line in f if line.strip() and not line.startswith('#')}
+    except FileNotFoundError:
+        return set()
+
+
+class HashListStage:
+    """Decides messages whose hash is in a fixed set."""
+
+    def __init__(self, name, hashes, label):
+        self.name = name
+        self.hashes = frozenset(hashes)
+        self.label = label
+
+    def __bool__(self):
+        return bool(self.hashes)
+
+    def decide(self, text, digest):
+        if digest in self.hashes:
+            return self.label, f"exact match in {self.name}"
+        return None
+
+
+class RuleStage:
+    """Decides messages matching one of a set of precompiled patterns."""
+
+    name = "rules"
+
+    def __init__(self, rules):
+        self.rules = []
+        for rule in rules:
+            if rule.get("label") not in LABELS:
+                raise ValueError(f"Rule '{rule.get('name')}' needs a label of 'spam' or 'ham'")
+            flags = re.IGNORECASE if rule.get("ignore_case", True) else 0
+            self.rules.append((
+                re.compile(rule["pattern"], flags),
+                rule["label"],
+                rule.get("reason") or f"matched rule {rule.get('name', rule['pattern'])}"
+            ))
+
+    @classmethod
+    def from_file(cls, path):
+        try:
+            with open(path, 'r') as f:
+                return cls(json.load(f))
+        except FileNotFoundError:
+            return cls([])
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def decide(self, text, digest):
+        for pattern, label, reason in self.rules:
+            if pattern.search(text):
+                return label, reason
+        return None
+
+
+class Cascade:
+    """Runs the pre-classification stages and falls through to the model."""
+
+    def __init__(self, stages):
+        # Empty stages are skipped entirely, so an unconfigured cascade costs nothing
+        self.stages = [stage for stage in stages if stage]
+        self.lock = threading.Lock()
+        self._stats = {}
+
+    @classmethod
+    def from_files(cls, allowlist_path=None, blocklist_path=None, rules_path=None):
+        return cls([
+            HashListStage("allowlist", load_hashes(allowlist_path), "ham") if allowlist_path else None,
+            HashListStage("blocklist", load_hashes(blocklist_path), "spam") if blocklist_path else None,
+            RuleStage.from_file(rules_path) if rules_path else None
+        ])
+
+    def record(self, stage, checked, hits, seconds):
+        with self.lock:
+            entry = self._stats.setdefault(stage, {"checked": 0, "hits": 0, "seconds": 0.0})
+            entry["checked"] += checked
+            entry["hits"] += hits
+            entry["seconds"] += seconds
+
+    def decide(self, messages, texts=None):
+        """One decision dict per message, or None where the model must decide.
+
+        texts, aligned with messages, are the size-limited texts the rules
+        run on; the full messages are used when not given.
+        """
+        decisions = [None] * len(messages)
+        if not self.stages:
+            return decisions
+
+        texts = messages if texts is None else texts
+        digests = [message_hash(message) for message in messages]
+        pending = list(range(len(messages)))
+        for stage in self.stages:
+            start = time.perf_counter()
+            still_pending = []
+            for i in pending:
+                outcome = stage.decide(texts[i], digests[i])
+                if outcome is None:
+                    still_pending.append(i)
+                else:
+                    label, reason = outcome
+                    decisions[i] = {
+                        "prediction": label,
+                        "confidence": 100.0,
+                        "word_influence": [],
+                        "decided_by": stage.name,
+                        "reason": reason
+                    }
+            self.record(stage.name, len(pending), len(pending) - len(still_pending), time.perf_counter() - start)
+            pending = still_pending
+            if not pending:
+                break
+        return decisions
+
+    def apply(self, messages, score_fn, texts=None):
+        """Score messages, sending only the undecided ones to score_fn.
+
+        score_fn receives the full messages; texts is passed to decide().
+        """
+        decisions = self.decide(messages, texts)
+        undecided = [message for message, decision in zip(messages, decisions) if decision is None]
+        scored = iter(())
+        if undecided:
+            start = time.perf_counter()
+            scored = iter(score_fn(undecided))
+            self.record("model", len(undecided), len(undecided), time.perf_counter() - start)
+        return [decision if decision is not None else next(scored) for decision in decisions]
+
+    def stats(self):
+        """Per-stage checked/hit counts, hit rate and mean latency per message."""
+        with self.lock:
+            return {
+                stage: {
+                    **entry,
+                    "hit_rate": round(entry["hits"] / entry["checked"], 5) if entry["checked"] else 0.0,
+                    "mean_us_per_message": round(entry["seconds"] / entry["checked"] * 1e6, 2) if entry["checked"] else 0.0
+                }
+                for stage, entry in self._stats.items()
+            }
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] != ["hash"]:
+        sys.exit("Usage: python cascade.py hash < messages.txt")
+    for line in sys.stdin:
+        if line.strip():
+            print(message_hash(line))
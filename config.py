@@ -26,4 +26,93 @@ class Config:
     # Session Configuration
     SESSION_COOKIE_SECURE = False  # Set to False for development (no HTTPS)
     SESSION_COOKIE_HTTPONLY = True
-    SESSION_COOKIE_SAMESITE = 'Lax'  # More permissive for development 
\ No newline at end of file
+    SESSION_COOKIE_SAMESITE = 'Lax'  # More permissive for development 
+    
+    # Visualization rendering (background process pool)
+    VISUALIZATION_WORKERS = 2
+    VISUALIZATION_WAIT_SECONDS = 10  # How long a chart request waits on the pool
+    VISUALIZATION_CACHE_MAX_BYTES = 200 * 1024 * 1024
+    VISUALIZATION_CACHE_MAX_AGE = 365 * 24 * 3600  # Renders of a report never change
+    
+    # Bulk analysis
+    BULK_CHUNK_SIZE = 1000  # Messages vectorized and scored per chunk
+    BULK_ARCHIVE_WORKERS = 4  # Archive members decompressed and scored in parallel
+    # Uploads over these limits are rejected with 413 (decompression bombs)
+    BULK_MAX_DECOMPRESSED_BYTES = 512 * 1024 * 1024  # Total after gz/zst/zip decompression
+    BULK_MAX_ARCHIVE_MEMBERS = 10000  # Supported files in a .zip
+    
+    # ASGI serving (asgi.py): report, history and visualization reads run on
+    # the event loop with file access on the I/O pool; every other request
+    # runs the Flask app on the WSGI pool
+    ASGI_IO_THREADS = 32
+    ASGI_WSGI_THREADS = 16
+    ASGI_REPORT_CACHE_SIZE = 16  # Unpickled reports kept for repeated reads
+    ASGI_CSV_CHUNK_ROWS = 500  # Rows per chunk of a streamed CSV download
+    
+    # Logging: records go through a queue to a background writer thread and
+    # carry the request's X-Request-ID. At LOG_LEVEL 'DEBUG', debug records
+    # are kept for this fraction of requests only.
+    LOG_LEVEL = 'INFO'
+    LOG_FORMAT = 'json'  # or 'text'
+    LOG_DEBUG_SAMPLE_RATE = 0.01
+    
+    # Metrics for GET /metrics. Under several worker processes set
+    # METRICS_DIR (gunicorn.conf.py does): each process writes its values
+    # there every METRICS_FLUSH_INTERVAL seconds and a scrape adds them up
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = 5
+    
+    # Encoder behind jsonify(): 'auto' uses orjson when it is installed,
+    # 'orjson' requires it, 'stdlib' is Flask's encoder; all handle NumPy values
+    JSON_BACKEND = 'auto'
+    
+    # Streaming predictions
+    PREDICT_STREAM_BATCH_SIZE = 64  # Lines scored together before results are flushed
+    
+    # Micro-batching of concurrent single-message /predict requests
+    PREDICT_MICROBATCH_ENABLED = False
+    PREDICT_MICROBATCH_WINDOW_MS = 2  # Longest a request waits for others to join
+    PREDICT_MICROBATCH_MAX_SIZE = 32
+    
+    # Per-message size policy applied before vectorization: 'head_tail',
+    # 'sample' or 'none'. Bounds latency on huge pasted attachments/HTML.
+    MESSAGE_SIZE_POLICY = 'head_tail'
+    MESSAGE_MAX_CHARS = 20000
+    
+    # Weight precision of the served model: 'float64' or 'float32' (opt-in;
+    # only the classifier's log-probability arrays shrink, the IDF stays
+    # float64 under scikit-learn 1.0)
+    MODEL_PRECISION = 'float64'
+    
+    # Named models for /predict: 'nb' is the served MultinomialNB pipeline and
+    # 'lr' the LogisticRegression saved as LR_MODEL_FILE + LR_VECTORIZER_FILE.
+    # MODEL_MODE 'shadow' also scores every request with SECONDARY_MODEL for
+    # latency/disagreement stats; 'ensemble' averages the two probabilities.
+    DEFAULT_MODEL = 'nb'
+    MODEL_MODE = 'single'
+    SECONDARY_MODEL = 'lr'
+    ENSEMBLE_PRIMARY_WEIGHT = 0.5
+    LR_MODEL_FILE = 'model_lr.pkl'
+    LR_VECTORIZER_FILE = 'vectorizer.pkl'
+    
+    # Pre-classifier cascade ahead of the model: exact message hashes
+    # (allow -> ham, block -> spam) and compiled regex rules. Missing files
+    # leave that stage out.
+    CASCADE_ENABLED = True
+    CASCADE_ALLOWLIST_FILE = 'cascade_lists/allowlist.txt'
+    CASCADE_BLOCKLIST_FILE = 'cascade_lists/blocklist.txt'
+    CASCADE_RULES_FILE = 'cascade_lists/rules.json'
+    
+    # Start-up warm-up: load models, score a representative batch through
+    # vectorization, prediction and explanation, prime caches. /ready
+    # answers 503 until it has finished.
+    WARMUP_ENABLED = True
+    WARMUP_MESSAGES_FILE = 'test_emails.txt'  # One representative message per line
+    WARMUP_RENDER_POOL = True  # Also start the chart rendering processes
+    
+    # Online updates from user feedback (the environment variables of the
+    # same name override the paths, e.g. to keep benchmarks out of the repo)
+    MODEL_VERSIONS_DIR = os.environ.get('MODEL_VERSIONS_DIR', 'model_versions')
+    FEEDBACK_LOG_FILE = os.environ.get('FEEDBACK_LOG_FILE', 'feedback.jsonl')
+    FEEDBACK_BATCH_SIZE = 50  # Apply as soon as this many labels are queued
+    FEEDBACK_APPLY_INTERVAL = 60  # ...or at least this often (seconds)
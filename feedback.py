@@ -0,0 +1,199 @@
+import os
+import json
+import logging
+import datetime
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+LABELS = {"ham": 0, "spam": 1}
+
+
+class FeedbackTrainer:
+    """Applies user spam/ham feedback to the model incrementally.
+
+    Feedback is appended to a log file. A background thread applies it
+    every apply_interval seconds (or as soon as batch_size items are
+    waiting): the entries logged since the last applied one are vectorized
+    with the current, unchanged TF-IDF vectorizer and a copy of the
+    MultinomialNB counts is updated with partial_fit. The result is
+    published as a new model version, so the previous one can be restored
+    with ModelStore.rollback().
+
+    Each version records the log offset it was trained up to (and the
+    log's inode), so entries logged but not applied before a restart are
+    picked up by replay(), and whichever worker process applies takes the
+    entries of all of them. A log rotated to a new file is read from its
+    start; one truncated in place stops feedback with an error rather than
+    applying its entries again.
+    Applying holds the model store's update lock, so workers never apply
+    the same entries twice or publish over each other.
+    """
+
+    def __init__(self, model_store, log_path="feedback.jsonl", batch_size=50, apply_interval=60):
+        self.model_store = model_store
+        self.log_path = log_path
+        self.batch_size = batch_size
+        self.apply_interval = apply_interval
+        self.condition = threading.Condition()
+        self._pending = 0
+        self._thread = None
+        self.applied_count = 0
+        self.last_error = None
+
+    def add(self, message, label, user_id=None):
+        """Log one labelled message; returns the number this process has waiting."""
+        if label not in LABELS:
+            raise ValueError("label must be 'spam' or 'ham'")
+
+        entry = {
+            "message": message,
+            "label": label,
+            "user_id": user_id,
+            "timestamp": datetime.datetime.now().isoformat()
+        }
+        line = (json.dumps(entry) + "\n").encode('utf-8')
+        with self.condition:
+            # One O_APPEND write per entry, so lines from several workers never interleave
+            fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+            self._pending += 1
+            self._ensure_thread()
+            if self._pending >= self.batch_size:
+                self.condition.notify()
+            return self._pending
+
+    def pending_count(self):
+        with self.condition:
+            return self._pending
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="feedback-trainer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self._pending >= self.batch_size, timeout=self.apply_interval)
+                if not self._pending:
+                    continue
+            try:
+                self.apply_pending()
+            except Exception as e:
+                # The offset did not move, so the entries are retried next time
+                logger.exception("failed to apply feedback")
+                self.last_error = str(e)
+
+    def applied_offset(self, index):
+        """(offset, inode) of the log up to which feedback is in a published version.
+
+        The inode is None for versions published before it was recorded.
+        """
+        applied = [entry for entry in index["versions"] if "feedback_offset" in entry]
+        if applied:
+            # The newest such version, not the current one: a rollback does not
+            # make feedback pending again. Offsets only grow within one log.
+            latest = max(applied, key=lambda entry: entry["version"])
+            return latest["feedback_offset"], latest.get("feedback_log_inode")
+        # Logs written before offsets were recorded: skip the entries already applied
+        applied = sum(entry.get("feedback_count", 0) for entry in index["versions"] if entry.get("note") == "feedback")
+        offset = 0
+        if applied and os.path.exists(self.log_path):
+            with open(self.log_path, 'rb') as f:
+                for _ in range(applied):
+                    line = f.readline()
+                    if not line.endswith(b"\n"):
+                        break
+                    offset += len(line)
+        return offset, None
+
+    def read_log(self, offset, inode=None):
+        """Complete entries logged from offset on, the offset after them and the log's inode.
+
+        Raises RuntimeError when the log was truncated in place, since there
+        is no telling which of its entries were applied.
+        """
+        if not os.path.exists(self.log_path):
+            return [], offset, inode
+        batch = []
+        with open(self.log_path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if inode is not None and stat.st_ino != inode:
+                logger.info("feedback log was rotated; reading the new one from the start",
+                            extra={"path": self.log_path, "offset": offset})
+                offset = 0
+            elif stat.st_size < offset:
+                raise RuntimeError(
+                    f"feedback log {self.log_path} is shorter ({stat.st_size} bytes) than the applied "
+                    f"offset ({offset}); it was truncated in place. Restore it, or rotate it to a new file."
+                )
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Still being written
+                offset += len(line)
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning("skipping malformed feedback log line", extra={"path": self.log_path})
+                    continue
+                if isinstance(entry, dict) and entry.get("label") in LABELS and isinstance(entry.get("message"), str):
+                    batch.append(entry)
+        return batch, offset, stat.st_ino
+
+    def replay(self):
+        """Apply feedback logged but not yet applied, e.g. before a restart."""
+        try:
+            version = self.apply_pending()
+        except Exception as e:
+            logger.exception("failed to replay feedback")
+            self.last_error = str(e)
+            return None
+        if version is not None:
+            logger.info("replayed feedback", extra={"version": version})
+        return version
+
+    def apply_pending(self):
+        """Fold every unapplied log entry into a new model version.
+
+        Returns the new version, or None when there was nothing to apply.
+        """
+        with self.condition:
+            taken = self._pending
+        with self.model_store.updating():
+            batch, offset, inode = self.read_log(*self.applied_offset(self.model_store.load_versions()))
+            version = self.apply(batch, feedback_offset=offset, feedback_log_inode=inode) if batch else None
+        with self.condition:
+            self._pending = max(0, self._pending - taken)
+        return version
+
+    def apply(self, batch, **metadata):
+        """Fold a batch of feedback into a new model version."""
+        with self.model_store.updating():
+            model = self.model_store.load_for_training()
+            vectorizer = model.named_steps['tfidf']
+            classifier = model.named_steps['clf']
+
+            # The vocabulary and IDF weights stay fixed; only the class and
+            # feature counts of the classifier are updated
+            X = vectorizer.transform([entry["message"] for entry in batch])
+            y = np.array([LABELS[entry["label"]] for entry in batch])
+            classifier.partial_fit(X, y)
+
+            version = self.model_store.publish(
+                model,
+                note="feedback",
+                feedback_count=len(batch),
+                spam_feedback=int(y.sum()),
+                ham_feedback=int(len(y) - y.sum()),
+                **metadata
+            )
+        self.applied_count += len(batch)
+        self.last_error = None
+        return version
@@ -0,0 +1,51 @@
+"""Gunicorn settings for serving wsgi:application.
+
+Worker and thread counts default from the CPUs available to the process
+and can be overridden with WEB_CONCURRENCY and GUNICORN_THREADS.
+"""
+import os
+import gc
+import shutil
+import tempfile
+import multiprocessing
+
+
+def available_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS
+        return multiprocessing.cpu_count()
+
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+
+# Scoring is CPU-bound and mostly holds the GIL: one process per CPU. A few
+# threads per worker overlap uploads, report file I/O and frontend polling.
+workers = int(os.environ.get("WEB_CONCURRENCY", available_cpus()))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+worker_class = "gthread"
+
+# Load the model in the master once; workers inherit it copy-on-write
+preload_app = True
+
+# Every process writes its metrics here and /metrics adds them up (see
+# metrics.py). Cleared at start-up so counters start from zero.
+metrics_dir = os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "spam_api_metrics"))
+shutil.rmtree(metrics_dir, ignore_errors=True)
+
+# Bulk uploads of large archives can take a while to score
+timeout = 300
+graceful_timeout = 30
+
+
+def pre_fork(server, worker):
+    # Move every object created so far (the model included) into the
+    # permanent generation so the collector never writes to their headers
+    # and un-shares those pages in the workers
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from app import after_fork
+    from wsgi import application
+    after_fork(application)
@@ -0,0 +1,336 @@
+import io
+import re
+import csv
+import gzip
+import html
+import logging
+import zipfile
+import threading
+from email import policy
+from email.parser import BytesParser
+
+logger = logging.getLogger(__name__)
+
+# Plain formats the scorer understands, and the compressions wrapped around them
+TEXT_FORMATS = {'txt', 'csv'}
+MAIL_FORMATS = {'eml', 'mbox'}
+COMPRESSIONS = {'gz', 'zst'}
+ARCHIVES = {'zip'}
+
+
+def split_extensions(filename):
+    """Return (format, compression) for names like 'emails.csv.gz'.
+
+    format is 'zip' for archives and compression is None for plain files.
+    """
+    parts = filename.lower().rsplit('.', 2)
+    if len(parts) < 2:
+        return None, None
+    if parts[-1] in COMPRESSIONS:
+        inner = parts[-2] if len(parts) == 3 else None
+        return inner, parts[-1]
+    return parts[-1], None
+
+
+def is_supported_upload(filename):
+    fmt, compression = split_extensions(filename)
+    if fmt in ARCHIVES:
+        return compression is None
+    return fmt in TEXT_FORMATS or fmt in MAIL_FORMATS
+
+
+class UploadTooLarge(ValueError):
+    """The upload expands past a configured limit (e.g. a decompression bomb)."""
+
+
+class ByteBudget:
+    """Decompressed bytes allowed for one upload, shared by its archive members."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def charge(self, size):
+        with self.lock:
+            self.used += size
+            if self.used > self.max_bytes:
+                raise UploadTooLarge(f"Upload expands to more than {self.max_bytes} bytes")
+
+
+class _BudgetedReader(io.RawIOBase):
+    """Charges every byte read from a stream to a ByteBudget."""
+
+    def __init__(self, stream, budget):
+        self.stream = stream
+        self.budget = budget
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        self.budget.charge(len(data))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def open_decompressed(stream, compression, budget=None):
+    """Wrap a binary stream so it is decompressed incrementally as it is read.
+
+    With a ByteBudget, reading past its limit raises UploadTooLarge.
+    """
+    if compression is None:
+        decompressed = stream
+    elif compression == 'gz':
+        decompressed = gzip.GzipFile(fileobj=stream, mode='rb')
+    elif compression == 'zst':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("Zstandard uploads require the 'zstandard' package on the server")
+        decompressed = zstandard.ZstdDecompressor().stream_reader(stream)
+    else:
+        raise ValueError(f"Unsupported compression: {compression}")
+    if budget is None:
+        return decompressed
+    return io.BufferedReader(_BudgetedReader(decompressed, budget))
+
+
+def _text_stream(binary_stream):
+    return io.TextIOWrapper(binary_stream, encoding='utf-8', errors='replace', newline='')
+
+
+def iter_text_messages(binary_stream):
+    """One email per line."""
+    for line in _text_stream(binary_stream):
+        line = line.strip()
+        if line:
+            yield line
+
+
+# Message column names tried, in order, when the caller doesn't name one
+MESSAGE_COLUMN_CANDIDATES = ('message', 'text', 'content', 'email')
+
+CSV_CHUNK_ROWS = 10000
+
+
+def select_csv_columns(header, message_column=None, id_column=None, label_column=None):
+    """Map 'message' and optional 'id'/'label' to column indexes in header.
+
+    Explicitly named columns must exist (case-insensitive). Otherwise the
+    message column is the first known name, or the first non-label column.
+    """
+    lowered = [col.strip().lower() for col in header]
+
+    def find(name):
+        if name.strip().lower() not in lowered:
+            raise ValueError(f"Column '{name}' not found. Available columns: {', '.join(header)}")
+        return lowered.index(name.strip().lower())
+
+    columns = {}
+    if message_column:
+        columns['message'] = find(message_column)
+    else:
+        for candidate in MESSAGE_COLUMN_CANDIDATES:
+            if candidate in lowered:
+                columns['message'] = lowered.index(candidate)
+                break
+        else:
+            non_label = [idx for idx, col in enumerate(lowered) if col != 'label']
+            if not non_label:
+                raise ValueError("No suitable column found for messages")
+            columns['message'] = non_label[0]
+
+    if id_column:
+        columns['id'] = find(id_column)
+    if label_column:
+        columns['label'] = find(label_column)
+    return columns
+
+
+def iter_csv_records(binary_stream, message_column=None, id_column=None, label_column=None):
+    """Stream (message, extras) records from CSV, reading only needed columns.
+
+    The header is parsed once to pick the columns; the body is then read in
+    chunks by pandas' C parser restricted to those columns (or the csv
+    module if pandas is unavailable). The file is never parsed twice.
+    """
+    text = _text_stream(binary_stream)
+    header = next(csv.reader([text.readline()]), None)
+    if not header:
+        return
+
+    columns = select_csv_columns(header, message_column, id_column, label_column)
+    logger.debug("using CSV columns", extra={"columns": {key: header[idx] for key, idx in columns.items()}})
+    extra_keys = [('record_id', columns['id'])] if 'id' in columns else []
+    if 'label' in columns:
+        extra_keys.append(('label', columns['label']))
+
+    try:
+        import pandas as pd
+    except ImportError:
+        pd = None
+
+    if pd is None:
+        message_idx = columns['message']
+        for row in csv.reader(text):
+            if len(row) > message_idx:
+                yield row[message_idx], {key: row[idx] if idx < len(row) else '' for key, idx in extra_keys}
+        return
+
+    reader = pd.read_csv(
+        text,
+        header=None,
+        names=list(range(len(header))),
+        usecols=sorted(set(columns.values())),
+        dtype=str,
+        keep_default_na=False,
+        chunksize=CSV_CHUNK_ROWS,
+        engine='c'
+    )
+    for frame in reader:
+        frame = frame.fillna('')
+        messages = frame[columns['message']].tolist()
+        extra_values = [(key, frame[idx].tolist()) for key, idx in extra_keys]
+        for i, message in enumerate(messages):
+            yield message, {key: values[i] for key, values in extra_values}
+
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_SPACE_RE = re.compile(r'\s+')
+_MBOX_ESCAPED_FROM_RE = re.compile(rb'^>+From ')
+
+
+def email_to_text(raw_bytes):
+    """Subject and decoded body of one RFC 822 message, as used in training.
+
+    Training combines the 'Subject' and 'Message' columns with a space, so
+    the same is done here. The plain-text part is preferred; HTML-only mail
+    has its tags stripped.
+    """
+    msg = BytesParser(policy=policy.default).parsebytes(raw_bytes)
+    subject = str(msg.get('subject', '') or '')
+
+    body = ''
+    part = msg.get_body(preferencelist=('plain', 'html'))
+    if part is not None:
+        try:
+            body = part.get_content()
+        except (LookupError, UnicodeDecodeError):
+            # Unknown or wrong charset declared; decode the raw payload leniently
+            body = (part.get_payload(decode=True) or b'').decode('utf-8', errors='replace')
+        if part.get_content_subtype() == 'html':
+            body = html.unescape(_TAG_RE.sub(' ', body))
+
+    return _SPACE_RE.sub(' ', f"{subject} {body}").strip()
+
+
+def iter_mbox_messages(binary_stream):
+    """Split an mbox stream on 'From ' separator lines, one message at a time.
+
+    Only the current message is held in memory, unlike the stdlib mailbox
+    module which needs a seekable file and builds a table of contents.
+    """
+    lines = []
+    for line in binary_stream:
+        if line.startswith(b'From ') and (not lines or lines[-1] in (b'\n', b'\r\n')):
+            if lines:
+                yield email_to_text(b''.join(lines))
+            lines = []
+            continue
+        if _MBOX_ESCAPED_FROM_RE.match(line):
+            line = line[1:]  # mboxrd quoting of body lines starting with 'From '
+        lines.append(line)
+    if any(line.strip() for line in lines):
+        yield email_to_text(b''.join(lines))
+
+
+def iter_records(binary_stream, fmt, csv_options=None):
+    """Yield (message, extras) records with non-empty messages from an upload.
+
+    extras holds per-record fields such as CSV id/label values, or None.
+    csv_options may name the message_column, id_column and label_column.
+    """
+    if fmt == 'csv':
+        records = iter_csv_records(binary_stream, **(csv_options or {}))
+    elif fmt == 'txt':
+        records = ((message, None) for message in iter_text_messages(binary_stream))
+    elif fmt == 'mbox':
+        records = ((message, None) for message in iter_mbox_messages(binary_stream))
+    elif fmt == 'eml':
+        records = [(email_to_text(binary_stream.read()), None)]
+    else:
+        raise ValueError(f"Unsupported file type: {fmt}")
+
+    for message, extras in records:
+        if message and isinstance(message, str):
+            yield message, extras
+
+
+def list_archive_members(archive, max_members=None, budget=None):
+    """Names of supported files inside a zip archive, in archive order.
+
+    Raises UploadTooLarge when there are more than max_members of them, or
+    when their declared sizes already exceed the budget (zipfile never
+    reads past a member's declared size).
+    """
+    members = []
+    declared = 0
+    for info in archive.infolist():
+        name = info.filename
+        if info.is_dir() or name.startswith('__MACOSX/') or name.rsplit('/', 1)[-1].startswith('.'):
+            continue
+        fmt, compression = split_extensions(name)
+        if fmt in TEXT_FORMATS or fmt in MAIL_FORMATS:
+            members.append(name)
+            declared += info.file_size
+            if max_members is not None and len(members) > max_members:
+                raise UploadTooLarge(f"Archive has more than {max_members} files")
+    if budget is not None and declared > budget.max_bytes:
+        raise UploadTooLarge(f"Upload expands to more than {budget.max_bytes} bytes")
+    return members
+
+
+def iter_member_records(archive, name, csv_options=None, budget=None):
+    """Stream the records of one archive member, decompressing as it goes."""
+    fmt, compression = split_extensions(name)
+    with archive.open(name) as raw:
+        # Charge what the member expands to, after any inner .gz/.zst
+        yield from iter_records(open_decompressed(raw, compression, budget), fmt, csv_options)
+
+
+def plan_archive_tasks(members, group_size):
+    """Split archive members into units of work, keeping archive order.
+
+    Each .eml member holds a single message, so consecutive .eml members are
+    grouped (up to group_size) to be vectorized together; every other member
+    is its own unit. Returns a list of (kind, names) with kind 'file' or 'eml'.
+    """
+    tasks = []
+    group = []
+    for name in members:
+        if split_extensions(name)[0] == 'eml':
+            group.append(name)
+            if len(group) >= group_size:
+                tasks.append(('eml', group))
+                group = []
+            continue
+        if group:
+            tasks.append(('eml', group))
+            group = []
+        tasks.append(('file', [name]))
+    if group:
+        tasks.append(('eml', group))
+    return tasks
+
+
+def iter_eml_members(archive, names, budget=None):
+    """Yield records for a group of .eml members, tagged with their member."""
+    for name in names:
+        for message, _ in iter_member_records(archive, name, budget=budget):
+            yield message, {"source": name}
+
+
+def open_archive(stream):
+    return zipfile.ZipFile(stream)
@@ -0,0 +1,58 @@
+"""JSON encoders for Flask responses.
+
+Flask 2.0 encodes jsonify() output with app.json_encoder.
+  - NumpyJSONEncoder is Flask's encoder plus NumPy scalars and arrays, so
+    results no longer need converting value by value.
+  - OrjsonEncoder encodes the whole document with orjson (an optional
+    package), several times faster on large reports. It falls back to
+    NumpyJSONEncoder for anything orjson rejects (e.g. integers wider than
+    64 bits) and for indents other than 2.
+
+orjson writes non-ASCII text as UTF-8 rather than \\u escapes, and NaN as
+null; either way the output decodes to the same values.
+"""
+import numpy as np
+from flask.json import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKENDS = ('auto', 'orjson', 'stdlib')
+
+
+class NumpyJSONEncoder(JSONEncoder):
+    def default(self, o):
+        if isinstance(o, np.generic):
+            return o.item()
+        if isinstance(o, np.ndarray):
+            return o.tolist()
+        return super().default(o)
+
+
+class OrjsonEncoder(NumpyJSONEncoder):
+    def encode(self, o):
+        if self.indent not in (None, 2):
+            return super().encode(o)
+        # Dates go through Flask's default (HTTP dates) rather than orjson's ISO format
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if self.indent == 2:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(o, default=self.default, option=option).decode('utf-8')
+        except (orjson.JSONEncodeError, TypeError):
+            return super().encode(o)
+
+
+def json_encoder_for(backend='auto'):
+    """Encoder class for a JSON_BACKEND setting; 'auto' uses orjson when installed."""
+    if backend not in JSON_BACKENDS:
+        raise ValueError(f"Unknown JSON backend '{backend}'. Use one of: {', '.join(JSON_BACKENDS)}")
+    if backend == 'orjson' and orjson is None:
+        raise ValueError("The 'orjson' JSON backend requires the 'orjson' package")
+    if backend != 'stdlib' and orjson is not None:
+        return OrjsonEncoder
+    return NumpyJSONEncoder
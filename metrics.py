@@ -0,0 +1,310 @@
+"""Prometheus metrics, served in the text format by GET /metrics.
+
+Counters and histograms are sharded per thread. A thread only ever writes
+its own dict, so recording a value takes no lock; locks are only taken
+when a thread records its first value and when the values are collected.
+Gauges are callbacks evaluated at scrape time.
+
+Under a multi-process server, set METRICS_DIR. Each process then writes
+its values to METRICS_DIR/<pid>-<start time>.json every flush_interval
+seconds, and the process answering /metrics adds up every file. The start
+time keeps a worker whose pid was recycled from overwriting, and so
+dropping, the counts of the exited process that had it. Counters and histograms of
+exited processes keep counting. Gauges carry a pid label and are only
+reported for processes that flushed recently.
+"""
+import os
+import json
+import time
+import bisect
+import atexit
+import threading
+import contextlib
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    escaped = (
+        str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        for value in values
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class _ShardedMetric:
+    kind = None
+
+    def __init__(self, registry, name, help, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.reset()
+
+    def reset(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()  # Shard registration and collection only
+        self._shards = []
+        self._retired = {}
+
+    def _shard(self):
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), values))
+            self.registry.ensure_flusher()
+            return values
+
+    def collect(self):
+        """Values summed over all threads, keyed by label values."""
+        with self._lock:
+            live = []
+            for thread, values in self._shards:
+                if thread.is_alive():
+                    live.append((thread, values))
+                else:
+                    # Fold shards of finished threads (e.g. per-upload pools) into one
+                    self.merge(self._retired, values)
+            self._shards = live
+            totals = {}
+            self.merge(totals, self._retired)
+            for _, values in live:
+                self.merge(totals, dict(values))
+        return totals
+
+
+class Counter(_ShardedMetric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        values = self._shard()
+        values[labelvalues] = values.get(labelvalues, 0) + amount
+
+    @staticmethod
+    def merge(totals, values):
+        for key, value in values.items():
+            totals[key] = totals.get(key, 0) + value
+
+
+class Histogram(_ShardedMetric):
+    """Per label set: a count per bucket (the last is +Inf), then the sum."""
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(registry, name, help, labelnames)
+
+    def observe(self, value, *labelvalues):
+        values = self._shard()
+        counts = values.get(labelvalues)
+        if counts is None:
+            counts = values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, *labelvalues):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    @staticmethod
+    def merge(totals, values):
+        for key, counts in values.items():
+            current = totals.get(key)
+            if current is None:
+                totals[key] = list(counts)
+            else:
+                for i, count in enumerate(counts):
+                    current[i] += count
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = {}
+        self.gauges = {}
+        self.directory = None
+        self.flush_interval = 5.0
+        self.filename = self._new_filename()
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+
+    @staticmethod
+    def _new_filename():
+        return f"{os.getpid()}-{time.time_ns()}.json"
+
+    def counter(self, name, help, labelnames=()):
+        self.metrics[name] = Counter(self, name, help, labelnames)
+        return self.metrics[name]
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.metrics[name] = Histogram(self, name, help, labelnames, buckets)
+        return self.metrics[name]
+
+    def add_gauge(self, name, help, fn, labelnames=()):
+        """fn() returns the value, or {label values tuple: value} with labelnames."""
+        self.gauges[name] = (help, tuple(labelnames), fn)
+
+    def configure(self, directory=None, flush_interval=5.0):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self.ensure_flusher()
+
+    def ensure_flusher(self):
+        if self.directory and self._flusher is None:
+            with self._flusher_lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+                    self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def gauge_values(self):
+        values = {}
+        for name, (_, labelnames, fn) in self.gauges.items():
+            try:
+                value = fn()
+            except Exception:
+                continue  # The service behind it is not set up (yet)
+            if value is None:
+                continue
+            values[name] = value if labelnames else {(): value}
+        return values
+
+    def snapshot(self):
+        return {
+            "pid": os.getpid(),
+            "time": time.time(),
+            "metrics": {
+                name: [[list(key), value] for key, value in metric.collect().items()]
+                for name, metric in self.metrics.items()
+            },
+            "gauges": {
+                name: [[list(key), value] for key, value in samples.items()]
+                for name, samples in self.gauge_values().items()
+            }
+        }
+
+    def flush(self):
+        """Write this process's values for the other processes to read."""
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, self.filename)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def _snapshots(self):
+        own = self.snapshot()
+        snapshots = [own]
+        if self.directory and os.path.isdir(self.directory):
+            for filename in os.listdir(self.directory):
+                if not filename.endswith(".json") or filename == self.filename:
+                    continue
+                try:
+                    with open(os.path.join(self.directory, filename), 'r') as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # Removed while listing
+        return snapshots
+
+    def render(self):
+        snapshots = self._snapshots()
+        multiprocess = self.directory is not None
+        lines = []
+
+        for name, metric in self.metrics.items():
+            totals = {}
+            for snapshot in snapshots:
+                metric.merge(totals, {tuple(key): value for key, value in snapshot["metrics"].get(name, [])})
+            lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(totals.items()):
+                if metric.kind == "counter":
+                    lines.append(f"{name}{_labels(metric.labelnames, key)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float("inf"),), value[:-1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(metric.labelnames + ('le',), key + (_number(bound),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(metric.labelnames, key)} {_number(value[-1])}")
+                lines.append(f"{name}_count{_labels(metric.labelnames, key)} {cumulative}")
+
+        # Exited processes stop flushing; leave their gauges out
+        fresh_after = time.time() - 3 * self.flush_interval
+        live = [snapshot for snapshot in snapshots if snapshot["time"] >= fresh_after]
+        for name, (help, labelnames, _) in self.gauges.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            names = labelnames + (("pid",) if multiprocess else ())
+            for snapshot in live:
+                pid = (str(snapshot["pid"]),) if multiprocess else ()
+                for key, value in snapshot["gauges"].get(name, []):
+                    lines.append(f"{name}{_labels(names, tuple(key) + pid)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def after_fork(self):
+        # A forked worker starts from zero; the parent keeps reporting its own values
+        for metric in self.metrics.values():
+            metric.reset()
+        self.filename = self._new_filename()
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUESTS = registry.counter(
+    "spam_api_http_requests_total", "HTTP requests by route, method and status", ("route", "method", "status")
+)
+HTTP_LATENCY = registry.histogram(
+    "spam_api_http_request_duration_seconds", "HTTP request latency by route", ("route", "method")
+)
+# Stages: upload_parse, vectorization, prediction, word_influence,
+# report_persistence, viz_rendering and chart_rendering (queue wait included)
+STAGE_SECONDS = registry.histogram(
+    "spam_api_stage_duration_seconds", "Time spent in each processing stage", ("stage",)
+)
+BATCH_SIZE = registry.histogram(
+    "spam_api_batch_size", "Messages per scored batch", ("batcher",), buckets=SIZE_BUCKETS
+)
+CACHE_REQUESTS = registry.counter(
+    "spam_api_cache_requests_total", "Cache lookups by cache and result", ("cache", "result")
+)
+
+
+def record_request(route, method, status, seconds):
+    HTTP_REQUESTS.inc(route, method, str(status))
+    HTTP_LATENCY.observe(seconds, route, method)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=registry.after_fork)
+atexit.register(registry.flush)
@@ -0,0 +1,195 @@
+import time
+import logging
+import threading
+import joblib
+import numpy as np
+
+from metrics import STAGE_SECONDS
+from model_store import check_sklearn_version
+from scoring import (
+    apply_size_policy, classify_matrix, format_predictions, spam_class_index, spam_coefficients
+)
+
+logger = logging.getLogger(__name__)
+
+MODES = ('single', 'shadow', 'ensemble')
+
+
+class PairModel:
+    """A model saved as separate vectorizer and classifier pickles.
+
+    Loaded on first use and exposed like ModelStore.current(), as a
+    tfidf/clf Pipeline plus its (feature_names, coef) explainer.
+    """
+
+    def __init__(self, model_path, vectorizer_path):
+        self.model_path = model_path
+        self.vectorizer_path = vectorizer_path
+        self.lock = threading.Lock()
+        self.pickled_sklearn_version = None
+        self._loaded = None
+
+    def current(self):
+        if self._loaded is None:
+            with self.lock:
+                if self._loaded is None:
+                    from sklearn.pipeline import Pipeline
+
+                    vectorizer = joblib.load(self.vectorizer_path)
+                    classifier = joblib.load(self.model_path)
+                    self.pickled_sklearn_version = (
+                        check_sklearn_version(self.vectorizer_path, vectorizer)
+                        or check_sklearn_version(self.model_path, classifier)
+                    )
+                    model = Pipeline([('tfidf', vectorizer), ('clf', classifier)])
+                    explainer = (vectorizer.get_feature_names_out(), spam_coefficients(classifier))
+                    self._loaded = (model, explainer)
+                    logger.info("loaded model", extra={"path": self.model_path, "vectorizer_path": self.vectorizer_path})
+        return self._loaded
+
+
+class ModelStats:
+    """Per-model latency and pairwise disagreement counters."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.disagreement = {}
+
+    def record_latency(self, name, seconds, messages):
+        with self.lock:
+            entry = self.latency.setdefault(name, {"calls": 0, "messages": 0, "seconds": 0.0, "max_seconds": 0.0})
+            entry["calls"] += 1
+            entry["messages"] += messages
+            entry["seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+    def record_disagreement(self, primary, secondary, compared, disagreed):
+        with self.lock:
+            entry = self.disagreement.setdefault(f"{primary}:{secondary}", {"compared": 0, "disagreed": 0})
+            entry["compared"] += compared
+            entry["disagreed"] += disagreed
+
+    def snapshot(self):
+        with self.lock:
+            latency = {
+                name: {
+                    **entry,
+                    "mean_ms_per_call": round(entry["seconds"] / entry["calls"] * 1000, 3),
+                    "mean_us_per_message": round(entry["seconds"] / max(entry["messages"], 1) * 1e6, 1)
+                }
+                for name, entry in self.latency.items()
+            }
+            disagreement = {
+                pair: {**entry, "rate": round(entry["disagreed"] / entry["compared"], 5) if entry["compared"] else 0.0}
+                for pair, entry in self.disagreement.items()
+            }
+        return {"latency": latency, "disagreement": disagreement}
+
+
+class ModelRegistry:
+    """Named models for the prediction endpoints.
+
+    Every request is scored by one primary model. In 'shadow' mode the
+    secondary model scores the same messages too, only for the latency and
+    disagreement statistics; in 'ensemble' mode the two spam probabilities
+    are averaged (primary_weight for the primary) and the explanation comes
+    from the primary. When both models share a vocabulary and IDF the
+    secondary classifier reuses the primary's TF-IDF matrix.
+    """
+
+    def __init__(self, default_model, mode='single', secondary_model=None, primary_weight=0.5):
+        if mode not in MODES:
+            raise ValueError(f"Unknown model mode '{mode}'")
+        self.default_model = default_model
+        self.mode = mode
+        self.secondary_model = secondary_model
+        self.primary_weight = primary_weight
+        self.sources = {}
+        self.stats = ModelStats()
+        self._shared_check = (None, None, False)
+
+    def register(self, name, source):
+        """source is anything with current() -> (pipeline, explainer)."""
+        self.sources[name] = source
+
+    def names(self):
+        return list(self.sources)
+
+    def sklearn_version_mismatches(self):
+        """name -> scikit-learn version, for loaded models pickled with another version."""
+        return {
+            name: source.pickled_sklearn_version
+            for name, source in self.sources.items()
+            if getattr(source, 'pickled_sklearn_version', None)
+        }
+
+    def current(self, name=None):
+        name = name or self.default_model
+        if name not in self.sources:
+            raise KeyError(name)
+        return self.sources[name].current()
+
+    def _same_features(self, a, b):
+        """Whether two fitted vectorizers produce identical matrices (cached per pair)."""
+        checked_a, checked_b, same = self._shared_check
+        if checked_a is not a or checked_b is not b:
+            same = a is b or (
+                type(a) is type(b)
+                and a.get_params() == b.get_params()
+                and a.vocabulary_ == b.vocabulary_
+                and np.array_equal(getattr(a, 'idf_', None), getattr(b, 'idf_', None))
+            )
+            self._shared_check = (a, b, same)
+        return same
+
+    def _timed_score(self, name, model, texts, X=None):
+        start = time.perf_counter()
+        if X is None:
+            X = model.named_steps['tfidf'].transform(texts)
+            STAGE_SECONDS.observe(time.perf_counter() - start, "vectorization")
+        classify_start = time.perf_counter()
+        is_spam, probabilities = classify_matrix(model.named_steps['clf'], X)
+        STAGE_SECONDS.observe(time.perf_counter() - classify_start, "prediction")
+        self.stats.record_latency(name, time.perf_counter() - start, len(texts))
+        return is_spam, probabilities, X
+
+    def predict(self, messages, model=None, mode=None, explain=True, top_n=20,
+                size_policy='none', max_chars=None):
+        """Score messages like scoring.predict_messages, by model name and mode."""
+        name = model or self.default_model
+        mode = mode or self.mode
+        if name not in self.sources:
+            raise KeyError(name)
+        if mode not in MODES:
+            raise ValueError(f"Unknown model mode '{mode}'")
+
+        texts, size_infos = apply_size_policy(messages, max_chars, size_policy)
+        primary, explainer = self.current(name)
+        is_spam, probabilities, X = self._timed_score(name, primary, texts)
+        confidence = probabilities.max(axis=1)
+        label = name
+
+        secondary_name = self.secondary_model
+        if mode != 'single' and secondary_name in self.sources and secondary_name != name:
+            secondary, _ = self.current(secondary_name)
+            shared = self._same_features(primary.named_steps['tfidf'], secondary.named_steps['tfidf'])
+            other_spam, other_probabilities, _ = self._timed_score(
+                secondary_name, secondary, texts, X=X if shared else None
+            )
+            self.stats.record_disagreement(name, secondary_name, len(texts), int((is_spam != other_spam).sum()))
+
+            if mode == 'ensemble':
+                spam_probability = (
+                    self.primary_weight * probabilities[:, spam_class_index(primary.named_steps['clf'])]
+                    + (1 - self.primary_weight) * other_probabilities[:, spam_class_index(secondary.named_steps['clf'])]
+                )
+                is_spam = spam_probability > 0.5
+                confidence = np.where(is_spam, spam_probability, 1 - spam_probability)
+                label = f"ensemble({name},{secondary_name})"
+
+        results = format_predictions(is_spam, confidence, X, size_infos,
+                                     explainer=explainer if explain else None, top_n=top_n)
+        for result in results:
+            result["model"] = label
+        return results
@@ -0,0 +1,207 @@
+"""Cross-validated model selection for the TF-IDF + MultinomialNB pipeline.
+
+Evaluates a grid over max_features, n-gram range and NB smoothing (alpha).
+The corpus is tokenized once per n-gram range and the resulting
+document-term count matrix is cached on disk, so later runs and every grid
+point reuse it; max_features is applied by selecting columns. Grid points
+are evaluated in parallel across cores and reported with accuracy,
+inference latency and model size. Latency is measured after the grid has
+finished, one candidate at a time, as serving sees it: one predict_proba
+call per message (median and p95).
+
+Note: the max_features column selection uses corpus-wide term frequencies
+(not per-fold ones) so a single cached matrix serves every fold.
+
+Usage: python model_selection.py --dataset dataset.csv --max-features 1000,5000,20000 \\
+           --ngrams 1-1,1-2 --alphas 0.1,0.5,1.0 --folds 5 --jobs -1
+"""
+import os
+import json
+import time
+import pickle
+import hashlib
+import argparse
+import itertools
+
+import numpy as np
+import joblib
+
+from train import iter_chunks, build_vectorizer
+
+
+def load_corpus(dataset_path, sample=None):
+    texts, labels = [], []
+    for chunk_texts, chunk_labels in iter_chunks(dataset_path, 100000):
+        texts.extend(chunk_texts)
+        labels.append(chunk_labels)
+        if sample and len(texts) >= sample:
+            break
+    labels = np.concatenate(labels) if labels else np.array([], dtype=int)
+    if sample:
+        texts, labels = texts[:sample], labels[:sample]
+    return texts, labels
+
+
+def cached_counts(texts, dataset_path, ngram_range, cache_dir, sample=None):
+    """Document-term counts for one n-gram range, cached as .npz on disk."""
+    from scipy import sparse
+    from sklearn.feature_extraction.text import CountVectorizer
+
+    stat = os.stat(dataset_path)
+    key = hashlib.sha1(
+        f"{os.path.abspath(dataset_path)}|{stat.st_size}|{stat.st_mtime}|{ngram_range}|{sample}".encode()
+    ).hexdigest()[:16]
+    matrix_path = os.path.join(cache_dir, f"counts_{key}.npz")
+    vocab_path = os.path.join(cache_dir, f"vocab_{key}.pkl")
+
+    if os.path.exists(matrix_path) and os.path.exists(vocab_path):
+        print(f"Using cached document-term matrix {matrix_path}")
+        return sparse.load_npz(matrix_path).tocsr(), joblib.load(vocab_path)
+
+    start = time.perf_counter()
+    counts = CountVectorizer(stop_words='english', ngram_range=ngram_range)
+    X = counts.fit_transform(texts)
+    terms = counts.get_feature_names_out()
+    print(f"Tokenized {len(texts)} documents for ngram_range={ngram_range} "
+          f"in {time.perf_counter() - start:.1f}s ({X.shape[1]} terms)")
+
+    os.makedirs(cache_dir, exist_ok=True)
+    sparse.save_npz(matrix_path, X)
+    joblib.dump(terms, vocab_path)
+    return X, terms
+
+
+def top_columns(X, max_features):
+    """Column indexes of the max_features most frequent terms, in term order."""
+    term_freq = np.asarray(X.sum(axis=0)).ravel()
+    if max_features >= len(term_freq):
+        return np.arange(len(term_freq))
+    top = np.argpartition(-term_freq, max_features - 1)[:max_features]
+    return np.sort(top)
+
+
+def build_pipeline(terms, columns, ngram_range, idf, classifier):
+    """A servable Pipeline equivalent to the evaluated candidate."""
+    from sklearn.pipeline import Pipeline
+
+    vocabulary = {str(terms[col]): i for i, col in enumerate(columns)}
+    vectorizer = build_vectorizer(vocabulary, idf, ngram_range=ngram_range)
+    return Pipeline([('tfidf', vectorizer), ('clf', classifier)])
+
+
+def evaluate_candidate(X, y, terms, ngram_range, max_features, alpha, folds, seed):
+    """Cross-validate one grid point (run in a worker process).
+
+    Returns the result row and the servable pipeline fitted on all rows.
+    """
+    from sklearn.feature_extraction.text import TfidfTransformer
+    from sklearn.model_selection import StratifiedKFold
+    from sklearn.naive_bayes import MultinomialNB
+
+    columns = top_columns(X, max_features)
+    Xk = X[:, columns]
+
+    scores = []
+    splitter = StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed)
+    for train_idx, test_idx in splitter.split(Xk, y):
+        tfidf = TfidfTransformer().fit(Xk[train_idx])
+        classifier = MultinomialNB(alpha=alpha).fit(tfidf.transform(Xk[train_idx]), y[train_idx])
+        scores.append(float((classifier.predict(tfidf.transform(Xk[test_idx])) == y[test_idx]).mean()))
+
+    # Size (and, later, latency) are measured on the servable pipeline fitted on all rows
+    tfidf = TfidfTransformer().fit(Xk)
+    classifier = MultinomialNB(alpha=alpha).fit(tfidf.transform(Xk), y)
+    pipeline = build_pipeline(terms, columns, ngram_range, tfidf.idf_, classifier)
+
+    return {
+        "max_features": int(len(columns)),
+        "ngram_range": list(ngram_range),
+        "alpha": alpha,
+        "accuracy_mean": round(float(np.mean(scores)), 4),
+        "accuracy_std": round(float(np.std(scores)), 4),
+        "model_size_kb": round(len(pickle.dumps(pipeline)) / 1024, 1)
+    }, pipeline
+
+
+def single_message_latency(pipeline, texts):
+    """(median, p95) seconds of predict_proba on one message at a time."""
+    pipeline.predict_proba(texts[:1])  # First-call overhead is not serving latency
+    timings = []
+    for text in texts:
+        start = time.perf_counter()
+        pipeline.predict_proba([text])
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)), float(np.percentile(timings, 95))
+
+
+def parse_list(value, cast):
+    return [cast(item) for item in value.split(',') if item]
+
+
+def parse_ngram(value):
+    low, high = value.split('-')
+    return (int(low), int(high))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grid-search TF-IDF/MultinomialNB settings with cached features.")
+    parser.add_argument("--dataset", default="dataset.csv")
+    parser.add_argument("--max-features", default="1000,5000,20000")
+    parser.add_argument("--ngrams", default="1-1,1-2", help="comma separated ranges, e.g. 1-1,1-2")
+    parser.add_argument("--alphas", default="0.1,0.5,1.0")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--jobs", type=int, default=-1, help="parallel workers (-1 = all cores)")
+    parser.add_argument("--sample", type=int, default=None, help="only use the first N rows")
+    parser.add_argument("--cache-dir", default=".feature_cache")
+    parser.add_argument("--output", default="model_selection_results.json")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-messages", type=int, default=200,
+                        help="messages scored one by one per candidate for latency")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.dataset):
+        parser.error(f"Dataset file '{args.dataset}' not found.")
+
+    texts, y = load_corpus(args.dataset, args.sample)
+    rng = np.random.RandomState(args.seed)
+    latency_texts = [texts[i] for i in rng.choice(len(texts), size=min(args.latency_messages, len(texts)), replace=False)]
+
+    grid_max_features = parse_list(args.max_features, int)
+    grid_alphas = parse_list(args.alphas, float)
+
+    evaluated = []
+    start = time.perf_counter()
+    for ngram_range in parse_list(args.ngrams, parse_ngram):
+        X, terms = cached_counts(texts, args.dataset, ngram_range, args.cache_dir, args.sample)
+        # Large arrays passed to the workers are memory-mapped by joblib, not copied
+        evaluated.extend(joblib.Parallel(n_jobs=args.jobs)(
+            joblib.delayed(evaluate_candidate)(
+                X, y, terms, ngram_range, max_features, alpha, args.folds, args.seed
+            )
+            for max_features, alpha in itertools.product(grid_max_features, grid_alphas)
+        ))
+    print(f"\nEvaluated {len(evaluated)} candidates in {time.perf_counter() - start:.1f}s")
+
+    # Serially, so candidates don't compete for cores while being timed
+    results = []
+    for result, pipeline in evaluated:
+        median, p95 = single_message_latency(pipeline, latency_texts)
+        result["latency_median_us"] = round(median * 1e6, 1)
+        result["latency_p95_us"] = round(p95 * 1e6, 1)
+        results.append(result)
+    print(f"Measured single-message latency on {len(latency_texts)} messages per candidate\n")
+
+    results.sort(key=lambda r: (-r["accuracy_mean"], r["latency_median_us"]))
+    print(f"{'features':>9} {'ngrams':>7} {'alpha':>6} {'accuracy':>15} {'p50 us':>8} {'p95 us':>8} {'size KB':>9}")
+    for r in results:
+        print(f"{r['max_features']:>9} {'%d-%d' % tuple(r['ngram_range']):>7} {r['alpha']:>6} "
+              f"{r['accuracy_mean']:>8.4f} ±{r['accuracy_std']:.4f} "
+              f"{r['latency_median_us']:>8} {r['latency_p95_us']:>8} {r['model_size_kb']:>9}")
+
+    with open(args.output, 'w') as f:
+        json.dump({"dataset": args.dataset, "folds": args.folds, "results": results}, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
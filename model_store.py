@@ -0,0 +1,221 @@
+import os
+import json
+import shutil
+import logging
+import datetime
+import threading
+import contextlib
+import joblib
+import numpy as np
+
+from scoring import spam_coefficients
+
+try:
+    import fcntl
+except ImportError:  # Windows: no pre-fork workers, the thread lock is enough
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Weight dtypes the serving pipeline can be cast to. float16 is only
+# available for array artifacts (see array_model.py): SciPy sparse products
+# do not support it.
+SERVING_PRECISIONS = ('float64', 'float32')
+
+
+def reduce_precision(model, precision):
+    """Cast the classifier weights of a loaded pipeline in place.
+
+    Only the classifier's log-probability arrays shrink, by half their
+    size (tens of KB for the shipped model). The IDF weights are left alone: scikit-learn 1.0
+    stores them as a float64 diagonal matrix whatever dtype is assigned,
+    so the TF-IDF products stay float64 too. Feature and class counts stay
+    float64 because partial_fit accumulates into them.
+    """
+    if precision not in SERVING_PRECISIONS:
+        raise ValueError(f"Unsupported model precision '{precision}'")
+    if precision == 'float64':
+        return model
+    dtype = np.dtype(precision)
+    classifier = model.named_steps['clf']
+    classifier.feature_log_prob_ = classifier.feature_log_prob_.astype(dtype)
+    classifier.class_log_prior_ = classifier.class_log_prior_.astype(dtype)
+    return model
+
+
+def check_sklearn_version(path, *estimators):
+    """Warn when a pickle was written by another scikit-learn version.
+
+    Returns the version it was pickled with when that differs from the
+    installed one (predictions may then differ or fail), else None.
+    """
+    import sklearn
+
+    for estimator in estimators:
+        steps = getattr(estimator, 'named_steps', None)
+        for step in (steps.values() if steps is not None else [estimator]):
+            pickled = getattr(step, '_sklearn_version', None)
+            if pickled is not None and pickled != sklearn.__version__:
+                logger.warning("model was pickled with a different scikit-learn version", extra={
+                    "path": path, "pickled_version": pickled, "installed_version": sklearn.__version__
+                })
+                return pickled
+    return None
+
+
+class ModelStore:
+    """Keeps the trained pipeline loaded between requests.
+
+    The pickle is only re-read when its modification time changes (e.g.
+    after retraining), instead of on every request. The feature names and
+    spam coefficients used to explain predictions are cached alongside it.
+    With precision='float32' the served copy is cast by reduce_precision;
+    the pickle on disk always keeps full precision.
+
+    Updates are serialised with updating(), which pre-fork workers sharing
+    the same files also respect through a lock file in versions_dir.
+    """
+
+    def __init__(self, model_path, versions_dir="model_versions", precision='float64'):
+        if precision not in SERVING_PRECISIONS:
+            raise ValueError(f"Unsupported model precision '{precision}'")
+        self.model_path = model_path
+        self.versions_dir = versions_dir
+        self.precision = precision
+        self.lock = threading.Lock()
+        self.publish_lock = threading.RLock()
+        self._lock_file = None
+        self._lock_depth = 0
+        self.load_count = 0
+        self.pickled_sklearn_version = None  # Set when it differs from the installed version
+        self._model = None
+        self._explainer = None
+        self._mtime = None
+
+    def _load(self, mtime):
+        model = joblib.load(self.model_path)
+        self.pickled_sklearn_version = check_sklearn_version(self.model_path, model)
+        model = reduce_precision(model, self.precision)
+        feature_names = model.named_steps['tfidf'].get_feature_names_out()
+        coef = spam_coefficients(model.named_steps['clf'])
+        self._model = model
+        self._explainer = (feature_names, coef)
+        self._mtime = mtime
+        self.load_count += 1
+        logger.info("loaded model", extra={"path": self.model_path, "precision": self.precision})
+
+    def current(self):
+        """Return (pipeline, (feature_names, coef)) for the latest model."""
+        mtime = os.path.getmtime(self.model_path)
+        if mtime != self._mtime:
+            with self.lock:
+                if mtime != self._mtime:
+                    self._load(mtime)
+        return self._model, self._explainer
+
+    def get(self):
+        return self.current()[0]
+
+    @contextlib.contextmanager
+    def updating(self):
+        """Hold the update lock, across threads and processes, for a
+        read-modify-publish sequence. Re-entrant within a thread."""
+        with self.publish_lock:
+            if self._lock_depth == 0 and fcntl is not None:
+                os.makedirs(self.versions_dir, exist_ok=True)
+                self._lock_file = open(os.path.join(self.versions_dir, "publish.lock"), 'a')
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and self._lock_file is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def load_for_training(self):
+        """A private full-precision copy of the serving model, for updates.
+
+        Load and publish inside updating(), so no other worker publishes
+        in between and its update is lost.
+        """
+        return joblib.load(self.model_path)
+
+    # Model versions: every published model is kept in versions_dir and
+    # copied over model_path, which the serving path reloads on change.
+
+    def _index_path(self):
+        return os.path.join(self.versions_dir, "versions.json")
+
+    def _version_path(self, version):
+        return os.path.join(self.versions_dir, f"spam_model_v{version}.pkl")
+
+    def load_versions(self):
+        if os.path.exists(self._index_path()):
+            with open(self._index_path(), 'r') as f:
+                return json.load(f)
+        return {"current": None, "versions": []}
+
+    def _save_versions(self, index):
+        tmp_path = f"{self._index_path()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f, indent=2)
+        os.replace(tmp_path, self._index_path())
+
+    def _install(self, source_path):
+        # Copy then rename so the serving path never sees a partial pickle
+        tmp_path = f"{self.model_path}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, self.model_path)
+
+    def _ensure_baseline(self, index):
+        """Record the model currently on disk as version 1 so it can be restored."""
+        if index["versions"]:
+            return
+        os.makedirs(self.versions_dir, exist_ok=True)
+        shutil.copyfile(self.model_path, self._version_path(1))
+        index["versions"].append({
+            "version": 1,
+            "created": datetime.datetime.now().isoformat(),
+            "note": "baseline"
+        })
+        index["current"] = 1
+
+    def current_version(self):
+        return self.load_versions()["current"]
+
+    def publish(self, model, note="", **metadata):
+        """Save a new model version and make it the serving model."""
+        with self.updating():
+            index = self.load_versions()
+            self._ensure_baseline(index)
+            version = max(entry["version"] for entry in index["versions"]) + 1
+            joblib.dump(model, self._version_path(version))
+            self._install(self._version_path(version))
+            index["versions"].append({
+                "version": version,
+                "created": datetime.datetime.now().isoformat(),
+                "parent": index["current"],
+                "note": note,
+                **metadata
+            })
+            index["current"] = version
+            self._save_versions(index)
+            logger.info("published model version", extra={"version": version, "note": note})
+            return version
+
+    def rollback(self):
+        """Make the parent of the current version the serving model again."""
+        with self.updating():
+            index = self.load_versions()
+            current = next((entry for entry in index["versions"] if entry["version"] == index["current"]), None)
+            parent = current.get("parent") if current else None
+            if parent is None:
+                raise ValueError("No previous model version to roll back to")
+            self._install(self._version_path(parent))
+            index["current"] = parent
+            self._save_versions(index)
+            logger.info("rolled back model version", extra={"from_version": current['version'], "to_version": parent})
+            return parent
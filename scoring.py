@@ -0,0 +1,332 @@
+import time
+import uuid
+import datetime
+import threading
+import numpy as np
+
+from metrics import STAGE_SECONDS, BATCH_SIZE
+
+# Fixed confidence bins shared by every report so histograms can be merged
+CONFIDENCE_BINS = 20
+CONFIDENCE_BIN_EDGES = np.linspace(0.0, 100.0, CONFIDENCE_BINS + 1)
+
+
+def spam_class_index(classifier):
+    """Column of the spam class in predict_proba (labelled 1 or 'spam')."""
+    classes = list(classifier.classes_)
+    for label in (1, 'spam'):
+        if label in classes:
+            return classes.index(label)
+    return len(classes) - 1
+
+
+def spam_coefficients(classifier):
+    """Per-feature weight towards spam, used to explain predictions.
+
+    For Naive Bayes this is the log-probability ratio of spam over ham; for
+    linear models (e.g. LogisticRegression) the coefficients, signed so that
+    positive values push towards spam.
+    """
+    spam = spam_class_index(classifier)
+    if hasattr(classifier, 'feature_log_prob_'):
+        return classifier.feature_log_prob_[spam] - classifier.feature_log_prob_[1 - spam]
+    coef = np.asarray(classifier.coef_[0])
+    return coef if spam == 1 else -coef
+
+
+SIZE_POLICIES = ('none', 'head_tail', 'sample')
+SAMPLE_BLOCK_CHARS = 512
+
+
+def limit_message_size(message, max_chars, policy='head_tail'):
+    """Bound the text that is vectorized for one message.
+
+    'head_tail' keeps the first and last max_chars / 2 characters;
+    'sample' keeps evenly spaced blocks spanning the whole message, so the
+    result is deterministic for a given input. Returns (text, info) where
+    info records the applied policy, or None if the message was unchanged.
+    """
+    if policy == 'none' or not max_chars or len(message) <= max_chars:
+        return message, None
+
+    if policy == 'head_tail':
+        half = max_chars // 2
+        text = message[:half] + ' ' + message[len(message) - (max_chars - half):]
+    elif policy == 'sample':
+        block = min(SAMPLE_BLOCK_CHARS, max_chars)
+        n_blocks = max_chars // block
+        stride = len(message) // n_blocks
+        text = ' '.join(message[i * stride:i * stride + block] for i in range(n_blocks))
+    else:
+        raise ValueError(f"Unknown size policy '{policy}'. Use one of: {', '.join(SIZE_POLICIES)}")
+
+    return text, {"policy": policy, "original_length": len(message), "scored_length": len(text)}
+
+
+def apply_size_policy(messages, max_chars, policy):
+    """limit_message_size over a batch; returns (texts, infos)."""
+    if policy == 'none' or not max_chars:
+        return messages, [None] * len(messages)
+    limited = [limit_message_size(message, max_chars, policy) for message in messages]
+    return [text for text, _ in limited], [info for _, info in limited]
+
+
+def classify_matrix(classifier, X):
+    """(is_spam, probabilities) for an already vectorized chunk."""
+    probabilities = classifier.predict_proba(X)
+    is_spam = probabilities.argmax(axis=1) == spam_class_index(classifier)
+    return is_spam, probabilities
+
+
+def score_chunk(model, messages):
+    """Vectorize a chunk once and score it with the pipeline's classifier.
+
+    Returns (is_spam, probabilities, X) where X is the TF-IDF matrix,
+    so callers can explain predictions without transforming again.
+    """
+    start = time.perf_counter()
+    X = model.named_steps['tfidf'].transform(messages)
+    vectorized = time.perf_counter()
+    is_spam, probabilities = classify_matrix(model.named_steps['clf'], X)
+    STAGE_SECONDS.observe(vectorized - start, "vectorization")
+    STAGE_SECONDS.observe(time.perf_counter() - vectorized, "prediction")
+    return is_spam, probabilities, X
+
+
+def top_influence_indices(X, coef, top_n=20):
+    """Yield the feature indices of each row, most influential first."""
+    for i in range(X.shape[0]):
+        indices = X.indices[X.indptr[i]:X.indptr[i + 1]]
+        order = np.argsort(-np.abs(coef[indices]), kind='stable')[:top_n]
+        yield indices[order]
+
+
+class ReportAggregates:
+    """Running statistics for a bulk report, updated chunk by chunk.
+
+    Keeps per-class confidence histograms and the summed absolute influence
+    of each vocabulary index over every message's top words, so charts
+    never need the per-email rows.
+    """
+
+    def __init__(self, n_features):
+        self.spam_count = 0
+        self.ham_count = 0
+        self.spam_histogram = np.zeros(CONFIDENCE_BINS, dtype=np.int64)
+        self.ham_histogram = np.zeros(CONFIDENCE_BINS, dtype=np.int64)
+        self.influence_sums = np.zeros(n_features, dtype=np.float64)
+
+    def update(self, is_spam, confidences, top_indices, coef):
+        is_spam = np.asarray(is_spam, dtype=bool)
+        confidences = np.asarray(confidences, dtype=np.float64)
+
+        n_spam = int(is_spam.sum())
+        self.spam_count += n_spam
+        self.ham_count += len(is_spam) - n_spam
+        self.spam_histogram += np.histogram(confidences[is_spam], bins=CONFIDENCE_BIN_EDGES)[0]
+        self.ham_histogram += np.histogram(confidences[~is_spam], bins=CONFIDENCE_BIN_EDGES)[0]
+
+        if top_indices:
+            indices = np.concatenate(top_indices)
+            np.add.at(self.influence_sums, indices, np.abs(coef[indices]))
+
+    def to_summary(self, feature_names):
+        """Plain-Python form stored in the report (only non-zero words kept)."""
+        nonzero = np.flatnonzero(self.influence_sums)
+        return {
+            "spam_count": self.spam_count,
+            "ham_count": self.ham_count,
+            "confidence_bin_edges": CONFIDENCE_BIN_EDGES.tolist(),
+            "spam_histogram": self.spam_histogram.tolist(),
+            "ham_histogram": self.ham_histogram.tolist(),
+            "word_influence_indices": nonzero.tolist(),
+            "word_influence_words": [str(feature_names[i]) for i in nonzero],
+            "word_influence_totals": self.influence_sums[nonzero].tolist()
+        }
+
+
+def top_words_from_aggregates(aggregates, top_n=30):
+    """Top (word, summed influence) pairs from a stored report summary."""
+    totals = np.asarray(aggregates["word_influence_totals"], dtype=np.float64)
+    order = np.argsort(-totals, kind='stable')[:top_n]
+    words = aggregates["word_influence_words"]
+    return [(words[i], float(totals[i])) for i in order]
+
+
+class BulkScorer:
+    """Scores a stream of messages chunk by chunk for one bulk report.
+
+    Chunks may be scored from several threads (e.g. one per archive
+    member); aggregates are merged under a lock. With a cascade, messages
+    it decides skip vectorization and carry its decided_by/reason.
+    """
+
+    def __init__(self, model, chunk_size=1000, size_policy='none', max_chars=None, cascade=None):
+        self.model = model
+        self.cascade = cascade
+        self.chunk_size = chunk_size
+        self.size_policy = size_policy
+        self.max_chars = max_chars
+        self.feature_names = model.named_steps['tfidf'].get_feature_names_out()
+        self.coef = spam_coefficients(model.named_steps['clf'])
+        self.aggregates = ReportAggregates(len(self.feature_names))
+        self.lock = threading.Lock()
+
+    def score(self, messages, extras=None):
+        """Score one chunk and return its result rows.
+
+        extras is an optional list, aligned with messages, of dicts merged
+        into each row (e.g. the archive member or CSV id it came from).
+        """
+        texts, size_infos = apply_size_policy(messages, self.max_chars, self.size_policy)
+        decisions = self.cascade.decide(messages, texts) if self.cascade is not None else [None] * len(messages)
+        undecided = [i for i, decision in enumerate(decisions) if decision is None]
+
+        is_spam = np.array([decision is not None and decision["prediction"] == "spam" for decision in decisions], dtype=bool)
+        # Probability of the predicted class, as a percentage
+        confidences = np.full(len(messages), 100.0)
+        top_indices = [np.array([], dtype=np.int64)] * len(messages)
+        if undecided:
+            start = time.perf_counter()
+            spam, probabilities, X = score_chunk(self.model, [texts[i] for i in undecided])
+            is_spam[undecided] = spam
+            confidences[undecided] = np.round(probabilities.max(axis=1) * 100, 2)
+            with STAGE_SECONDS.time("word_influence"):
+                for i, indices in zip(undecided, top_influence_indices(X, self.coef)):
+                    top_indices[i] = indices
+            if self.cascade is not None:
+                self.cascade.record("model", len(undecided), len(undecided), time.perf_counter() - start)
+
+        with self.lock:
+            self.aggregates.update(is_spam, confidences, top_indices, self.coef)
+
+        confidences = confidences.tolist()
+        results = []
+        for i, message in enumerate(messages):
+            indices = top_indices[i]
+            result = {
+                "id": str(uuid.uuid4()),
+                "message": message[:100] + "..." if len(message) > 100 else message,
+                "full_message": message,
+                "prediction": "spam" if is_spam[i] else "ham",
+                "confidence": confidences[i],
+                "word_influence": [
+                    {"word": word, "influence": influence}
+                    for word, influence in zip(self.feature_names[indices].tolist(), self.coef[indices].tolist())
+                ],
+                "timestamp": datetime.datetime.now().isoformat()
+            }
+            if size_infos[i] is not None:
+                result["size_policy"] = size_infos[i]
+            if decisions[i] is not None:
+                result["decided_by"] = decisions[i]["decided_by"]
+                result["reason"] = decisions[i]["reason"]
+            if extras is not None and extras[i]:
+                result.update(extras[i])
+            results.append(result)
+        return results
+
+    def consume(self, records, source=None):
+        """Score an iterable of (message, extras) records in chunks.
+
+        The iterable is never materialised; source, when given, tags every
+        row with the archive member it came from.
+        """
+        results = []
+        chunks = chunked(records, self.chunk_size)
+        while True:
+            # Pulling the next chunk is where the upload is decompressed and parsed
+            with STAGE_SECONDS.time("upload_parse"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            BATCH_SIZE.observe(len(chunk), "bulk_chunk")
+            messages = [message for message, _ in chunk]
+            extras = [dict(extra or {}) for _, extra in chunk]
+            if source is not None:
+                for extra in extras:
+                    extra["source"] = source
+            results.extend(self.score(messages, extras=extras))
+        return results
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def ramped_chunks(iterable, max_size):
+    """Like chunked, but sizes double from 1 up to max_size.
+
+    The first results of a stream go out immediately while later chunks
+    still get the throughput of batched scoring.
+    """
+    size = 1
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+            size = min(size * 2, max_size)
+    if chunk:
+        yield chunk
+
+
+def predict_messages(model, messages, explain=True, top_n=20, explainer=None,
+                     size_policy='none', max_chars=None):
+    """Score a batch of messages for the prediction endpoints.
+
+    Returns one dict per message with the prediction, confidence and, when
+    explain is set, the top words that influenced it. explainer is an
+    optional cached (feature_names, coef) pair for the model. Oversized
+    messages are cut down per size_policy and carry a 'size_policy' entry.
+    """
+    texts, size_infos = apply_size_policy(messages, max_chars, size_policy)
+    is_spam, probabilities, X = score_chunk(model, texts)
+    if explain and explainer is None:
+        explainer = (model.named_steps['tfidf'].get_feature_names_out(),
+                     spam_coefficients(model.named_steps['clf']))
+    return format_predictions(is_spam, probabilities.max(axis=1), X, size_infos,
+                              explainer=explainer if explain else None, top_n=top_n)
+
+
+def format_predictions(is_spam, probabilities, X, size_infos, explainer=None, top_n=20):
+    """Result dicts for scored messages.
+
+    probabilities is the probability of each predicted class; X and the
+    (feature_names, coef) explainer give the word influence, which is left
+    out when explainer is None.
+    """
+    explain = explainer is not None
+    # One tolist() per array instead of a float() per value
+    confidences = np.round(np.asarray(probabilities) * 100, 2).tolist()
+    if explain:
+        feature_names, coef = explainer
+        top_indices = top_influence_indices(X, coef, top_n=top_n)
+
+    start = time.perf_counter()
+    results = []
+    for i, spam in enumerate(is_spam):
+        result = {
+            "prediction": "spam" if spam else "ham",
+            "confidence": confidences[i]
+        }
+        if explain:
+            indices = next(top_indices)
+            result["word_influence"] = [
+                {"word": word, "influence": influence}
+                for word, influence in zip(feature_names[indices].tolist(), coef[indices].tolist())
+            ]
+        if size_infos[i] is not None:
+            result["size_policy"] = size_infos[i]
+        results.append(result)
+    if explain:
+        STAGE_SECONDS.observe(time.perf_counter() - start, "word_influence")
+    return results
@@ -0,0 +1,176 @@
+"""Shrink the vectorizer and model pickles without changing predictions.
+
+Fitted sklearn vectorizers keep stop_words_, every term pruned by
+max_features/min_df/max_df. It is only diagnostic, but it is pickled and
+unpickled with the model. This tool
+  - drops stop_words_ from every vectorizer found in the artifact, and
+  - replaces vocabulary_ with a SortedVocabulary, a dict that pickles as one
+    separator-joined string of the terms in column order instead of a
+    key/value pair per term.
+MultinomialNB feature/class counts are kept: feedback updates need them.
+
+Each artifact is written slimmed to --output-dir (or over the original
+with --in-place), reporting size and load time before and after. It is
+only kept when a fresh interpreter can load it and the vectorizer output
+and, for pipelines, predict_proba are identical on the sample messages.
+
+Usage: python slim_artifacts.py spam_model.pkl vectorizer.pkl --output-dir slim [--texts test_emails.txt]
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+
+import joblib
+import numpy as np
+
+SEPARATOR = "\x00"
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Run in a new interpreter, so the pickle must resolve every class by its
+# importable module path (not the __main__ of the slimming run)
+VERIFY_SNIPPET = """
+import sys, joblib
+from slim_artifacts import outputs_equal, read_messages
+original, slimmed, texts = sys.argv[1:4]
+sys.exit(0 if outputs_equal(joblib.load(original), joblib.load(slimmed), read_messages(texts)) else 1)
+"""
+
+
+class SortedVocabulary(dict):
+    """term -> column mapping pickled compactly as the terms in column order.
+
+    It is a real dict, so vectorizers use it unchanged; only pickling
+    differs. Unpickling needs this module to be importable.
+    """
+
+    @classmethod
+    def from_terms(cls, joined):
+        terms = joined.split(SEPARATOR) if joined else []
+        return cls(zip(terms, range(len(terms))))
+
+    @classmethod
+    def from_mapping(cls, vocabulary):
+        terms = sorted(vocabulary, key=vocabulary.get)
+        if [vocabulary[term] for term in terms] != list(range(len(terms))):
+            raise ValueError("vocabulary columns are not 0..n-1")
+        if any(SEPARATOR in term for term in terms):
+            raise ValueError("vocabulary term contains the separator character")
+        return cls(zip(terms, range(len(terms))))
+
+    def __reduce__(self):
+        return (SortedVocabulary.from_terms, (SEPARATOR.join(sorted(self, key=self.get)),))
+
+
+def iter_vectorizers(artifact):
+    """Vectorizers in an artifact: a pipeline's steps or the artifact itself."""
+    steps = getattr(artifact, 'named_steps', None)
+    candidates = steps.values() if steps is not None else [artifact]
+    return [step for step in candidates if hasattr(step, 'vocabulary_')]
+
+
+def slim(artifact):
+    """Strip an artifact in place; returns the list of changes made."""
+    changes = []
+    for vectorizer in iter_vectorizers(artifact):
+        if getattr(vectorizer, 'stop_words_', None) is not None:
+            changes.append(f"dropped stop_words_ ({len(vectorizer.stop_words_)} terms)")
+            del vectorizer.stop_words_
+        if not isinstance(vectorizer.vocabulary_, SortedVocabulary):
+            compact = SortedVocabulary.from_mapping(vectorizer.vocabulary_)
+            # A fixed vocabulary passed to the constructor is the same mapping; keep one copy
+            if isinstance(vectorizer.vocabulary, dict) and vectorizer.vocabulary == vectorizer.vocabulary_:
+                vectorizer.vocabulary = compact
+            vectorizer.vocabulary_ = compact
+            changes.append(f"compact vocabulary ({len(compact)} terms)")
+    return changes
+
+
+def load_time(path, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        joblib.load(path)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def outputs_equal(before, after, messages):
+    """Whether two artifacts give identical output on messages."""
+    if hasattr(before, 'predict_proba'):
+        return bool(np.array_equal(before.predict_proba(messages), after.predict_proba(messages)))
+    X, Y = before.transform(messages), after.transform(messages)
+    return X.shape == Y.shape and (X != Y).nnz == 0
+
+
+def read_messages(path):
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def verify_in_subprocess(original_path, slimmed_path, texts_path):
+    """Load both pickles in a fresh interpreter and compare their output."""
+    paths = [os.path.abspath(path) for path in (original_path, slimmed_path, texts_path)]
+    result = subprocess.run([sys.executable, "-c", VERIFY_SNIPPET, *paths], cwd=MODULE_DIR)
+    return result.returncode == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Strip training-only state from vectorizer/model pickles.")
+    parser.add_argument("artifacts", nargs="+", help="pickles holding a vectorizer or a tfidf/clf pipeline")
+    parser.add_argument("--output-dir", default="slim")
+    parser.add_argument("--in-place", action="store_true", help="replace the original files")
+    parser.add_argument("--texts", default="test_emails.txt", help="one message per line, used for verification")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    messages = read_messages(args.texts)
+    if not args.in_place:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    report, failed = [], False
+    for path in args.artifacts:
+        original = joblib.load(path)
+        if not iter_vectorizers(original):
+            print(f"{path}: no vectorizer to slim, skipped")
+            continue
+
+        artifact = joblib.load(path)
+        changes = slim(artifact)
+        target = path if args.in_place else os.path.join(args.output_dir, os.path.basename(path))
+        tmp_path = f"{target}.tmp"
+        joblib.dump(artifact, tmp_path)
+
+        unchanged = verify_in_subprocess(path, tmp_path, args.texts)
+        entry = {
+            "artifact": path,
+            "changes": changes,
+            "bytes_before": os.path.getsize(path),
+            "bytes_after": os.path.getsize(tmp_path),
+            "load_seconds_before": round(load_time(path, args.repeat), 4),
+            "load_seconds_after": round(load_time(tmp_path, args.repeat), 4),
+            "predictions_unchanged": unchanged
+        }
+        if unchanged:
+            if args.in_place:
+                shutil.copyfile(path, f"{path}.orig")
+            os.replace(tmp_path, target)
+            entry["written"] = target
+        else:
+            os.remove(tmp_path)
+            failed = True
+        report.append(entry)
+
+    print(json.dumps({"verified_on_messages": len(messages), "artifacts": report}, indent=2))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # Run the imported module's main() so pickled SortedVocabulary objects
+    # reference slim_artifacts.SortedVocabulary rather than __main__
+    from slim_artifacts import main
+    main()
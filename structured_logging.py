@@ -0,0 +1,199 @@
+"""Structured, leveled logging for the API.
+
+configure_logging() routes every record through a QueueHandler. A
+QueueListener thread formats and writes the records, so request threads
+never block on stderr. Before a record is queued:
+  - it is tagged with the request's correlation id (see start_request);
+  - DEBUG records are dropped unless the request was picked for debug
+    sampling;
+  - bearer tokens and JWTs are masked in the message;
+  - sensitive extra= fields (Authorization, passwords, message bodies) are
+    replaced by their length or a placeholder.
+"""
+import os
+import re
+import sys
+import copy
+import json
+import uuid
+import queue
+import random
+import atexit
+import logging
+import datetime
+import contextvars
+import logging.handlers
+
+LOG_FORMATS = ('json', 'text')
+
+request_id_var = contextvars.ContextVar("request_id", default="-")
+debug_sampled_var = contextvars.ContextVar("debug_sampled", default=False)
+
+# extra= fields whose values are never written out
+SENSITIVE_FIELDS = frozenset({
+    "authorization", "cookie", "password", "token", "access_token", "refresh_token",
+    "message", "messages", "full_message", "body"
+})
+SECRET_PATTERNS = [
+    (re.compile(r"(Bearer\s+)\S+", re.IGNORECASE), r"\1[REDACTED]"),
+    (re.compile(r"eyJ[\w-]+\.[\w-]+\.[\w-]*"), "[REDACTED]")  # JWTs
+]
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+# Attributes every LogRecord has; anything else came from extra=
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_queue_handler = None
+_listener = None
+
+
+def redact_text(text):
+    """Stand-in for a message body or secret: its length only."""
+    return f"[REDACTED {len(text)} chars]" if isinstance(text, (str, bytes)) else "[REDACTED]"
+
+
+def scrub(text):
+    for pattern, replacement in SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def start_request(incoming_id=None, sample_rate=0.0):
+    """Bind a correlation id to the current context and decide debug sampling.
+
+    A well-formed incoming X-Request-ID is kept so ids match across
+    services; otherwise a new one is generated.
+    """
+    request_id = incoming_id if incoming_id and REQUEST_ID_PATTERN.fullmatch(incoming_id) else uuid.uuid4().hex
+    request_id_var.set(request_id)
+    debug_sampled_var.set(sample_rate >= 1.0 or random.random() < sample_rate)
+    return request_id
+
+
+class ContextFilter(logging.Filter):
+    """Adds the correlation id, samples DEBUG records and redacts secrets."""
+
+    def __init__(self, sample_rate=1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and self.sample_rate < 1.0 and not debug_sampled_var.get():
+            return False
+        record.request_id = request_id_var.get()
+        record.msg = scrub(record.getMessage())
+        record.args = None
+        for key, value in list(vars(record).items()):
+            if key in _RECORD_ATTRS:
+                continue
+            if key.lower() in SENSITIVE_FIELDS:
+                setattr(record, key, redact_text(value))
+            elif isinstance(value, str):
+                setattr(record, key, scrub(value))
+        return True
+
+
+class ContextQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that keeps the traceback out of the message.
+
+    The stock prepare() folds the traceback into msg and clears exc_info,
+    so JsonFormatter could never emit it as its own field. Here it is
+    rendered to exc_text, which the formatters read.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None  # Tracebacks cannot be pickled or outlive the frame
+        if record.exc_text:
+            record.exc_text = scrub(record.exc_text)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+
+def _extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, extra= fields included."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+            **_extra_fields(record)
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s")
+
+    def format(self, record):
+        record.request_id = getattr(record, "request_id", "-")
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+def configure_logging(level="INFO", fmt="json", sample_rate=1.0, stream=None):
+    """Send all logging through a queue drained by a background thread.
+
+    Calling it again replaces the previous set-up.
+    """
+    global _queue_handler, _listener
+    if fmt not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format '{fmt}'. Use one of: {', '.join(LOG_FORMATS)}")
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+    root = logging.getLogger()
+    if _queue_handler is not None:
+        root.removeHandler(_queue_handler)
+        _listener.stop()
+
+    _queue_handler = ContextQueueHandler(queue.SimpleQueue())
+    _queue_handler.addFilter(ContextFilter(sample_rate))
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, output)
+    _listener.start()
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+
+def _restart_after_fork():
+    # The listener thread does not survive a fork (pre-fork workers); without
+    # a new one the child's records would queue forever
+    global _listener
+    if _queue_handler is None:
+        return
+    _queue_handler.queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, *_listener.handlers)
+    _listener.start()
+
+
+def _flush_at_exit():
+    if _listener is not None:
+        _listener.stop()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+atexit.register(_flush_at_exit)
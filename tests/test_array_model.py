@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+joblib = pytest.importorskip("joblib")
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+pytest.importorskip("sklearn")
+
+from conftest import REPO_ROOT
+from array_model import ArrayModel, export_pipeline
+
+
+@pytest.fixture(scope="module")
+def messages():
+    with open(os.path.join(REPO_ROOT, "test_emails.txt"), 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+@pytest.fixture(scope="module")
+def pipeline():
+    return joblib.load(os.path.join(REPO_ROOT, "spam_model.pkl"))
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_array_model_matches_pipeline(tmp_path, pipeline, messages, mmap):
+    export_pipeline(pipeline, str(tmp_path / "arrays"))
+    model = ArrayModel(str(tmp_path / "arrays"), mmap=mmap)
+
+    assert list(model.predict(messages)) == list(pipeline.predict(messages))
+    # Same operations in the same order as scikit-learn: equal to the last bit
+    np.testing.assert_array_equal(model.predict_proba(messages), pipeline.predict_proba(messages))
@@ -0,0 +1,40 @@
+import os
+import sys
+import subprocess
+
+import pytest
+
+joblib = pytest.importorskip("joblib")
+np = pytest.importorskip("numpy")
+pytest.importorskip("sklearn")
+
+from conftest import REPO_ROOT
+from slim_artifacts import read_messages
+
+TEXTS = os.path.join(REPO_ROOT, "test_emails.txt")
+
+
+def slim_to(tmp_path, *artifacts):
+    paths = [os.path.join(REPO_ROOT, name) for name in artifacts]
+    subprocess.run(
+        [sys.executable, os.path.join(REPO_ROOT, "slim_artifacts.py"), *paths,
+         "--output-dir", str(tmp_path), "--texts", TEXTS, "--repeat", "1"],
+        check=True, cwd=str(tmp_path), stdout=subprocess.DEVNULL
+    )
+    return [os.path.join(tmp_path, name) for name in artifacts]
+
+
+def test_slimmed_pipeline_predicts_the_same(tmp_path):
+    slimmed_path, = slim_to(tmp_path, "spam_model.pkl")
+    messages = read_messages(TEXTS)
+    original = joblib.load(os.path.join(REPO_ROOT, "spam_model.pkl"))
+    slimmed = joblib.load(slimmed_path)
+
+    assert list(slimmed.predict(messages)) == list(original.predict(messages))
+    assert np.array_equal(slimmed.predict_proba(messages), original.predict_proba(messages))
+
+
+def test_slimmed_pickle_does_not_reference_main(tmp_path):
+    for path in slim_to(tmp_path, "spam_model.pkl", "vectorizer.pkl"):
+        with open(path, 'rb') as f:
+            assert b"__main__" not in f.read()
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("flask")
+pytest.importorskip("flask_jwt_extended")
+pytest.importorskip("sklearn")
+
+from conftest import REPO_ROOT
+
+sys.path.insert(0, os.path.join(REPO_ROOT, "benchmarks"))
+import bench_startup
+
+
+# Wall-clock budgets are checked by `python benchmarks/bench_startup.py --check`,
+# not here: they depend on the machine and would make the suite flaky.
+
+def test_heavy_dependencies_are_imported_lazily():
+    _, modules = bench_startup.measure_import_time()
+    assert [name for name in bench_startup.LAZY_MODULES if name in modules] == []
@@ -0,0 +1,212 @@
+"""Out-of-core training for the spam detection pipeline.
+
+Streams the labelled dataset in chunks, so corpora far larger than memory
+can be used, and writes a Pipeline([('tfidf', ...), ('clf', ...)]) pickle
+that the server loads in place of spam_model.pkl.
+
+Two passes are made over the CSV:
+  1. term and document frequencies are counted chunk by chunk to choose the
+     max_features vocabulary (by corpus term frequency, as TfidfVectorizer
+     does) and compute its IDF weights;
+  2. each chunk is transformed with the fixed vocabulary and fed to
+     MultinomialNB.partial_fit.
+
+Usage: python train.py --dataset dataset.csv --output spam_model.pkl
+"""
+import os
+import sys
+import time
+import heapq
+import argparse
+
+import numpy as np
+import joblib
+
+LABEL_MAP = {'spam': 1, 'ham': 0}
+
+
+def prepare_frame(df):
+    """Return (text, label) Series from a dataset frame.
+
+    Combines Subject and Message when both exist, and maps a 'Spam/Ham'
+    column to 1/0 labels, matching what the server has always trained on.
+    """
+    if "Spam/Ham" not in df.columns and "label" not in df.columns:
+        raise ValueError("Dataset must contain 'Spam/Ham' or 'label' column.")
+
+    # Check if we need to map labels
+    if "Spam/Ham" in df.columns:
+        labels = df['Spam/Ham'].map(LABEL_MAP)
+    else:
+        labels = df['label']
+
+    # Combine subject and message if available
+    if "Subject" in df.columns and "Message" in df.columns:
+        text = df['Subject'].fillna('') + ' ' + df['Message'].fillna('')
+    elif "Message" in df.columns:
+        text = df['Message'].fillna('')
+    elif "message" in df.columns:
+        text = df['message'].fillna('')
+    else:
+        raise ValueError("Dataset must contain 'Message' or 'message' column.")
+    return text.astype(str), labels
+
+
+def iter_chunks(dataset_path, chunk_size):
+    """Yield (texts, labels) chunks, skipping rows without a usable label."""
+    import pandas as pd
+
+    header = pd.read_csv(dataset_path, nrows=0).columns
+    wanted = [col for col in ("Subject", "Message", "message", "Spam/Ham", "label") if col in header]
+    for df in pd.read_csv(dataset_path, usecols=wanted, chunksize=chunk_size):
+        text, labels = prepare_frame(df)
+        keep = labels.notna().to_numpy()
+        yield text[keep].tolist(), labels[keep].astype(int).to_numpy()
+
+
+def peak_memory_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class TermCounter:
+    """Corpus term and document frequencies accumulated chunk by chunk.
+
+    Memory is bounded: whenever the table grows past max_terms it is cut
+    back to the max_terms // 2 most frequent terms, so it never holds more
+    than max_terms plus one chunk's vocabulary. The counts are exact when
+    the corpus has at most max_terms distinct terms. Past that, a pruned
+    term that comes back restarts from zero, so terms near the cut-off may
+    be undercounted; keep max_terms well above max_features.
+    """
+
+    def __init__(self, max_terms=2000000):
+        self.max_terms = max_terms
+        self.pruned = False
+        self.term_freq = {}
+        self.doc_freq = {}
+        self.n_docs = 0
+
+    def update(self, texts):
+        from sklearn.feature_extraction.text import CountVectorizer
+
+        counts = CountVectorizer(stop_words='english')
+        X = counts.fit_transform(texts)
+        tf = np.asarray(X.sum(axis=0)).ravel()
+        df = np.bincount(X.indices, minlength=X.shape[1])
+        for term, idx in counts.vocabulary_.items():
+            self.term_freq[term] = self.term_freq.get(term, 0) + int(tf[idx])
+            self.doc_freq[term] = self.doc_freq.get(term, 0) + int(df[idx])
+        self.n_docs += len(texts)
+
+        if len(self.term_freq) > self.max_terms:
+            keep = heapq.nlargest(self.max_terms // 2, self.term_freq.items(), key=lambda x: x[1])
+            self.term_freq = dict(keep)
+            self.doc_freq = {term: self.doc_freq[term] for term in self.term_freq}
+            self.pruned = True
+
+    def vocabulary(self, max_features):
+        """Top terms by corpus frequency, indexed alphabetically like sklearn."""
+        top = sorted(self.term_freq.items(), key=lambda x: (-x[1], x[0]))[:max_features]
+        terms = sorted(term for term, _ in top)
+        return {term: idx for idx, term in enumerate(terms)}
+
+    def idf(self, vocabulary):
+        # Same smoothed IDF as TfidfTransformer(smooth_idf=True)
+        df = np.array([self.doc_freq[term] for term in sorted(vocabulary, key=vocabulary.get)], dtype=np.float64)
+        return np.log((1 + self.n_docs) / (1 + df)) + 1
+
+
+def build_vectorizer(vocabulary, idf, ngram_range=(1, 1)):
+    """A fitted TfidfVectorizer with a fixed vocabulary and given IDF."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    vectorizer = TfidfVectorizer(stop_words='english', ngram_range=ngram_range, vocabulary=vocabulary)
+    # Fitting with a fixed vocabulary only sets up the transformer; the
+    # corpus IDF computed out of core then replaces the dummy one
+    vectorizer.fit([" ".join(vocabulary)])
+    vectorizer.idf_ = idf
+    return vectorizer
+
+
+def train_out_of_core(dataset_path, chunk_size=100000, max_features=5000, alpha=1.0, max_terms=2000000, log=print):
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.pipeline import Pipeline
+
+    if max_terms // 2 < max_features:
+        raise ValueError("max_terms must be at least twice max_features")
+    stats = {"dataset": dataset_path, "chunk_size": chunk_size}
+
+    # Pass 1: vocabulary and IDF
+    start = time.perf_counter()
+    counter = TermCounter(max_terms=max_terms)
+    for texts, _ in iter_chunks(dataset_path, chunk_size):
+        counter.update(texts)
+        log(f"pass 1: {counter.n_docs} rows, {len(counter.term_freq)} candidate terms")
+    vocabulary = counter.vocabulary(max_features)
+    vectorizer = build_vectorizer(vocabulary, counter.idf(vocabulary))
+    pass1_seconds = time.perf_counter() - start
+
+    # Pass 2: incremental classifier fit
+    start = time.perf_counter()
+    classifier = MultinomialNB(alpha=alpha)
+    rows = 0
+    for texts, labels in iter_chunks(dataset_path, chunk_size):
+        classifier.partial_fit(vectorizer.transform(texts), labels, classes=np.array([0, 1]))
+        rows += len(texts)
+        log(f"pass 2: {rows} rows, {rows / (time.perf_counter() - start):.0f} rows/s")
+    pass2_seconds = time.perf_counter() - start
+
+    stats.update({
+        "rows": rows,
+        "vocabulary_size": len(vocabulary),
+        "candidate_terms_pruned": counter.pruned,  # Counts near the cut-off may be approximate
+        "pass1_seconds": round(pass1_seconds, 2),
+        "pass2_seconds": round(pass2_seconds, 2),
+        "rows_per_second": round(2 * rows / (pass1_seconds + pass2_seconds), 1) if rows else 0,
+        "peak_memory_mb": peak_memory_mb()
+    })
+    pipeline = Pipeline([('tfidf', vectorizer), ('clf', classifier)])
+    return pipeline, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the spam model out of core from a large CSV.")
+    parser.add_argument("--dataset", default="dataset.csv")
+    parser.add_argument("--output", default="spam_model.pkl",
+                        help="pickle loadable by the server in place of spam_model.pkl")
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--max-features", type=int, default=5000)
+    parser.add_argument("--alpha", type=float, default=1.0, help="MultinomialNB smoothing")
+    parser.add_argument("--max-terms", type=int, default=2000000,
+                        help="bound on candidate terms kept in memory during the vocabulary pass")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.dataset):
+        parser.error(f"Dataset file '{args.dataset}' not found.")
+
+    pipeline, stats = train_out_of_core(
+        args.dataset,
+        chunk_size=args.chunk_size,
+        max_features=args.max_features,
+        alpha=args.alpha,
+        max_terms=args.max_terms
+    )
+
+    # Write next to the target and rename so a running server never loads a partial file
+    tmp_path = f"{args.output}.tmp"
+    joblib.dump(pipeline, tmp_path)
+    os.replace(tmp_path, args.output)
+
+    print(f"Model saved to {args.output}")
+    for key, value in stats.items():
+        print(f"  {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+import os
+import io
+import json
+import pickle
+import time
+import base64
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from metrics import STAGE_SECONDS, record_cache
+
+logger = logging.getLogger(__name__)
+
+REPORTS_DIR = "reports"
+
+
+def report_path_for(batch_id, reports_dir=REPORTS_DIR):
+    return os.path.join(reports_dir, f"{batch_id}.pkl")
+
+
+def viz_path_for(batch_id, reports_dir=REPORTS_DIR):
+    return os.path.join(reports_dir, f"{batch_id}_viz.json")
+
+
+def compute_chart_data(report_data, bins=20, top_words=30):
+    """Aggregate a report into the compact data behind each chart.
+
+    Confidence histograms share fixed 0-100 bin edges so the client can
+    draw spam and ham bars on the same axis without re-binning. Reports
+    scored with running aggregates are summarised without touching the
+    per-email rows.
+    """
+    import numpy as np
+    from scoring import CONFIDENCE_BINS, top_words_from_aggregates
+
+    aggregates = report_data.get("aggregates")
+    # Stored histograms can be merged down to any divisor of their bin count
+    if aggregates is not None and CONFIDENCE_BINS % bins == 0:
+        factor = CONFIDENCE_BINS // bins
+        bin_edges = np.asarray(aggregates["confidence_bin_edges"])[::factor]
+        spam_hist = np.asarray(aggregates["spam_histogram"]).reshape(bins, factor).sum(axis=1)
+        ham_hist = np.asarray(aggregates["ham_histogram"]).reshape(bins, factor).sum(axis=1)
+    else:
+        results = report_data["results"]
+        confidences = np.fromiter((result["confidence"] for result in results), dtype=np.float64, count=len(results))
+        is_spam = np.fromiter((result["prediction"] == "spam" for result in results), dtype=bool, count=len(results))
+
+        bin_edges = np.linspace(0.0, 100.0, bins + 1)
+        spam_hist, _ = np.histogram(confidences[is_spam], bins=bin_edges)
+        ham_hist, _ = np.histogram(confidences[~is_spam], bins=bin_edges)
+
+    if aggregates is not None:
+        sorted_words = top_words_from_aggregates(aggregates, top_n=top_words)
+    else:
+        sorted_words = _aggregate_word_influence(report_data["results"])[:top_words]
+
+    return {
+        "counts": {
+            "spam": int(report_data["spam_count"]),
+            "ham": int(report_data["ham_count"]),
+            "total": int(report_data["total_emails"])
+        },
+        "confidence_histogram": {
+            "bin_edges": [round(float(edge), 2) for edge in bin_edges],
+            "spam": spam_hist.tolist(),
+            "ham": ham_hist.tolist()
+        },
+        "word_influence": {
+            "words": [word for word, _ in sorted_words],
+            "influence": [round(float(influence), 4) for _, influence in sorted_words]
+        }
+    }
+
+
+def _aggregate_word_influence(results):
+    """Sum absolute influence per word from per-email rows (older reports)."""
+    word_influences = {}
+    for result in results:
+        for word_info in result["word_influence"]:
+            word = word_info["word"]
+            word_influences[word] = word_influences.get(word, 0.0) + abs(word_info["influence"])
+    return sorted(word_influences.items(), key=lambda x: x[1], reverse=True)
+
+
+CHART_NAMES = ("pie_chart", "confidence_histogram", "word_influence")
+
+# Figure widths in inches, used to turn a requested pixel width into a DPI
+CHART_FIGSIZES = {
+    "pie_chart": (8, 8),
+    "confidence_histogram": (10, 6),
+    "word_influence": (12, 8),
+}
+
+CHART_FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+    "webp": "image/webp",
+}
+
+DEFAULT_DPI = 100
+MIN_DPI = 10
+MAX_DPI = 300
+
+
+def _draw_pie_chart(plt, sns, report_data):
+    plt.figure(figsize=CHART_FIGSIZES["pie_chart"])
+    plt.pie(
+        [report_data["spam_count"], report_data["ham_count"]],
+        labels=["Spam", "Ham"],
+        autopct='%1.1f%%',
+        colors=['#ff6b6b', '#4ecdc4']
+    )
+    plt.title('Spam vs Ham Distribution')
+
+
+def _draw_confidence_histogram(plt, sns, report_data):
+    aggregates = report_data.get("aggregates")
+    if aggregates is not None:
+        edges = aggregates["confidence_bin_edges"]
+        widths = [right - left for left, right in zip(edges[:-1], edges[1:])]
+        plt.figure(figsize=CHART_FIGSIZES["confidence_histogram"])
+        plt.bar(edges[:-1], aggregates["spam_histogram"], width=widths, align='edge', color='#ff6b6b', alpha=0.7, label='Spam')
+        plt.bar(edges[:-1], aggregates["ham_histogram"], width=widths, align='edge', color='#4ecdc4', alpha=0.7, label='Ham')
+        plt.title('Confidence Distribution')
+        plt.xlabel('Confidence (%)')
+        plt.ylabel('Count')
+        plt.legend()
+        return
+
+    spam_confidences = [result["confidence"] for result in report_data["results"] if result["prediction"] == "spam"]
+    ham_confidences = [result["confidence"] for result in report_data["results"] if result["prediction"] == "ham"]
+
+    plt.figure(figsize=CHART_FIGSIZES["confidence_histogram"])
+    if spam_confidences:
+        sns.histplot(spam_confidences, color='#ff6b6b', label='Spam', alpha=0.7, bins=10)
+    if ham_confidences:
+        sns.histplot(ham_confidences, color='#4ecdc4', label='Ham', alpha=0.7, bins=10)
+    plt.title('Confidence Distribution')
+    plt.xlabel('Confidence (%)')
+    plt.ylabel('Count')
+    plt.legend()
+
+
+def _draw_word_influence(plt, sns, report_data):
+    aggregates = report_data.get("aggregates")
+    if aggregates is not None:
+        from scoring import top_words_from_aggregates
+        sorted_words = top_words_from_aggregates(aggregates, top_n=30)
+    else:
+        sorted_words = _aggregate_word_influence(report_data["results"])[:30]
+    words = [item[0] for item in sorted_words]
+    influences = [item[1] for item in sorted_words]
+
+    plt.figure(figsize=CHART_FIGSIZES["word_influence"])
+    plt.barh(words, influences, color='#6c5ce7')
+    plt.title('Top Influential Words')
+    plt.xlabel('Influence Score')
+    plt.tight_layout()
+
+
+_CHART_DRAWERS = {
+    "pie_chart": _draw_pie_chart,
+    "confidence_histogram": _draw_confidence_histogram,
+    "word_influence": _draw_word_influence,
+}
+
+
+def _import_pyplot():
+    import matplotlib
+    matplotlib.use('Agg')  # Set the backend to Agg before importing pyplot
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    return plt, sns
+
+
+def _warm_worker():
+    _import_pyplot()
+    return os.getpid()
+
+
+def _load_report(report_path):
+    with open(report_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def _save_figure(plt, fmt="png", dpi=DEFAULT_DPI):
+    """Save the current figure and return the encoded bytes."""
+    buf = io.BytesIO()
+    if fmt == "webp":
+        # Render a PNG and let Pillow (a matplotlib dependency) re-encode it
+        from PIL import Image
+        plt.savefig(buf, format='png', dpi=dpi, bbox_inches='tight')
+        buf.seek(0)
+        out = io.BytesIO()
+        Image.open(buf).save(out, format='WEBP', quality=80, method=6)
+        data = out.getvalue()
+    else:
+        plt.savefig(buf, format=fmt, dpi=dpi, bbox_inches='tight')
+        data = buf.getvalue()
+    plt.close()
+    return data
+
+
+def _write_atomic(path, data, mode='wb'):
+    # Write to a temporary file first so readers never see a partial file
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, mode) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def render_report_visualizations(report_path, viz_path):
+    """Render the report charts and write them to viz_path.
+
+    Runs inside a worker process, so pyplot's global state is private to
+    the process and never shared with the API threads.
+    """
+    plt, sns = _import_pyplot()
+    report_data = _load_report(report_path)
+
+    visualizations = {}
+    plt.close('all')
+    for chart in CHART_NAMES:
+        _CHART_DRAWERS[chart](plt, sns, report_data)
+        visualizations[chart] = base64.b64encode(_save_figure(plt)).decode('utf-8')
+
+    _write_atomic(viz_path, json.dumps({"visualizations": visualizations}), mode='w')
+    return viz_path
+
+
+def render_chart(report_path, chart, fmt, dpi, out_path):
+    """Render a single chart in the given format and DPI to out_path."""
+    plt, sns = _import_pyplot()
+    report_data = _load_report(report_path)
+
+    plt.close('all')
+    _CHART_DRAWERS[chart](plt, sns, report_data)
+    _write_atomic(out_path, _save_figure(plt, fmt=fmt, dpi=dpi))
+    return out_path
+
+
+def resolve_dpi(chart, width=None, dpi=None):
+    """Turn a requested pixel width or DPI into a clamped integer DPI."""
+    if width is not None:
+        dpi = width / CHART_FIGSIZES[chart][0]
+    if dpi is None:
+        dpi = DEFAULT_DPI
+    return int(min(max(round(dpi), MIN_DPI), MAX_DPI))
+
+
+class VisualizationCache:
+    """Per-(batch, chart, format, size) chart renders on disk.
+
+    Files are evicted least-recently-used first once the directory grows
+    past max_bytes. Hits are tracked in memory rather than by touching the
+    file, so a render keeps the mtime (and Last-Modified) it was written with.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self._last_used = {}
+
+    def path_for(self, batch_id, chart, fmt, dpi):
+        # SVG output is resolution independent, so every size shares one file
+        size = "vector" if fmt == "svg" else f"{dpi}dpi"
+        return os.path.join(self.cache_dir, f"{batch_id}_{chart}_{size}.{fmt}")
+
+    def etag_for(self, batch_id, chart, fmt, dpi):
+        """Reports never change once written, so the cache key identifies the render."""
+        return os.path.basename(self.path_for(batch_id, chart, fmt, dpi))
+
+    def get(self, batch_id, chart, fmt, dpi):
+        path = self.path_for(batch_id, chart, fmt, dpi)
+        if not os.path.exists(path):
+            return None
+        with self.lock:
+            self._last_used[path] = time.time()
+        return path
+
+    def enforce_budget(self):
+        with self.lock:
+            try:
+                entries = []
+                for filename in os.listdir(self.cache_dir):
+                    if '.tmp.' in filename:
+                        continue
+                    path = os.path.join(self.cache_dir, filename)
+                    stat = os.stat(path)
+                    # Files this process has not served since start-up fall back to their mtime
+                    last_used = max(stat.st_mtime, self._last_used.get(path, 0))
+                    entries.append((last_used, stat.st_size, path))
+            except OSError:
+                return
+
+            total = sum(size for _, size, _ in entries)
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+                self._last_used.pop(path, None)
+
+
+class VisualizationRenderer:
+    """Schedules report chart rendering on a background process pool."""
+
+    def __init__(self, reports_dir=REPORTS_DIR, max_workers=2, cache_max_bytes=200 * 1024 * 1024):
+        self.reports_dir = reports_dir
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self._executor = None
+        self._jobs = {}
+        self._errors = {}
+        self.cache = VisualizationCache(os.path.join(reports_dir, "viz_cache"), cache_max_bytes)
+
+    def _get_executor(self):
+        if self._executor is None:
+            # Never fork the threaded server: the children would inherit its
+            # locks mid-use and its at-fork hooks would start threads in them
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context(method))
+        return self._executor
+
+    def warm(self):
+        """Start the pool workers and import the plotting stack in them."""
+        with self.lock:
+            executor = self._get_executor()
+            futures = [executor.submit(_warm_worker) for _ in range(self.max_workers)]
+        return len({future.result() for future in futures})
+
+    def submit(self, batch_id):
+        """Queue rendering for a batch unless it is cached or already queued."""
+        viz_path = viz_path_for(batch_id, self.reports_dir)
+        if os.path.exists(viz_path):
+            return "ready"
+
+        with self.lock:
+            if batch_id in self._jobs:
+                return "pending"
+            self._errors.pop(batch_id, None)
+            future = self._get_executor().submit(
+                render_report_visualizations,
+                report_path_for(batch_id, self.reports_dir),
+                viz_path
+            )
+            self._jobs[batch_id] = future
+
+        started = time.perf_counter()
+        future.add_done_callback(lambda f: self._on_done(batch_id, f, started))
+        return "pending"
+
+    def _on_done(self, batch_id, future, started):
+        STAGE_SECONDS.observe(time.perf_counter() - started, "viz_rendering")
+        with self.lock:
+            self._jobs.pop(batch_id, None)
+            error = future.exception()
+            if error is not None:
+                logger.error("failed to generate visualizations", exc_info=error, extra={"batch_id": batch_id})
+                self._errors[batch_id] = str(error)
+
+    def submit_chart(self, batch_id, chart, fmt, dpi):
+        """Queue a single chart render and return its future.
+
+        Returns None when the render is already cached on disk.
+        """
+        cached = self.cache.get(batch_id, chart, fmt, dpi) is not None
+        record_cache("charts", cached)
+        if cached:
+            return None
+
+        out_path = self.cache.path_for(batch_id, chart, fmt, dpi)
+        key = (batch_id, chart, fmt, out_path)
+        with self.lock:
+            future = self._jobs.get(key)
+            if future is not None:
+                return future
+            os.makedirs(self.cache.cache_dir, exist_ok=True)
+            future = self._get_executor().submit(
+                render_chart,
+                report_path_for(batch_id, self.reports_dir),
+                chart, fmt, dpi, out_path
+            )
+            self._jobs[key] = future
+
+        started = time.perf_counter()
+        future.add_done_callback(lambda f: self._on_chart_done(key, f, started))
+        return future
+
+    def _on_chart_done(self, key, future, started):
+        STAGE_SECONDS.observe(time.perf_counter() - started, "chart_rendering")
+        with self.lock:
+            self._jobs.pop(key, None)
+        error = future.exception()
+        if error is not None:
+            logger.error("failed to render chart", exc_info=error, extra={"batch_id": key[0], "chart": key[1]})
+        else:
+            self.cache.enforce_budget()
+
+    def pending_count(self):
+        """Report and chart renders queued or running."""
+        with self.lock:
+            return len(self._jobs)
+
+    def status(self, batch_id):
+        """Return one of 'ready', 'pending', 'failed' or 'missing'."""
+        if os.path.exists(viz_path_for(batch_id, self.reports_dir)):
+            return "ready"
+        with self.lock:
+            if batch_id in self._jobs:
+                return "pending"
+            if batch_id in self._errors:
+                return "failed"
+        return "missing"
+
+    def pop_error(self, batch_id):
+        with self.lock:
+            return self._errors.pop(batch_id, None)
+
+    def shutdown(self):
+        with self.lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
@@ -0,0 +1,106 @@
+import os
+import time
+import logging
+import datetime
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Used when no representative messages file is available
+DEFAULT_WARMUP_MESSAGES = [
+    "Hi team, the quarterly report is attached. Let me know if you have questions before Friday's meeting.",
+    "URGENT: You have won $10,000,000! Click here to claim your prize now!",
+    "Can we move our call to 3pm tomorrow? Thanks.",
+    "FREE VIAGRA! Best prices guaranteed! Buy now and get 50% discount!",
+    "Your account statement for this month is ready to view in online banking."
+]
+
+
+def load_warmup_messages(path, limit=64):
+    """Up to limit non-empty lines of path, or the built-in messages."""
+    messages = []
+    if path and os.path.exists(path):
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            for line in f:
+                if line.strip():
+                    messages.append(line.strip())
+                if len(messages) >= limit:
+                    break
+    return messages or list(DEFAULT_WARMUP_MESSAGES)
+
+
+class Warmup:
+    """Runs the start-up warm-up once and tracks readiness.
+
+    Each step is a (name, fn) pair, timed individually. The state goes
+    pending -> warming_up -> ready, or failed if a step raises; only a ready
+    worker should receive traffic. Steps report failures that should not
+    block traffic (e.g. a secondary model) with record_model_error().
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state = "pending"
+        self.timings = {}
+        self.error = None
+        self.model_errors = {}
+        self.started_at = None
+        self.finished_at = None
+        self._thread = None
+
+    def run(self, steps):
+        with self.lock:
+            self.state = "warming_up"
+            self.started_at = datetime.datetime.now().isoformat()
+        start = time.perf_counter()
+        try:
+            for name, fn in steps:
+                step_start = time.perf_counter()
+                fn()
+                with self.lock:
+                    self.timings[name] = round(time.perf_counter() - step_start, 4)
+        except Exception as e:
+            logger.exception("warm-up failed")
+            with self.lock:
+                self.state = "failed"
+                self.error = str(e)
+        else:
+            with self.lock:
+                self.state = "ready"
+        with self.lock:
+            self.timings["total"] = round(time.perf_counter() - start, 4)
+            self.finished_at = datetime.datetime.now().isoformat()
+        logger.info("warm-up finished", extra={"state": self.state, "seconds": self.timings["total"]})
+
+    def record_model_error(self, name, error):
+        logger.error("model failed to warm up", exc_info=error, extra={"model": name})
+        with self.lock:
+            self.model_errors[name] = str(error)
+
+    def model_failed(self, name):
+        with self.lock:
+            return name in self.model_errors
+
+    def start(self, steps):
+        """Run the steps on a background thread."""
+        self._thread = threading.Thread(target=self.run, args=(steps,), name="warmup", daemon=True)
+        self._thread.start()
+
+    def mark_ready(self):
+        """Skip warm-up (when disabled) and report ready straight away."""
+        with self.lock:
+            self.state = "ready"
+
+    def is_ready(self):
+        return self.state == "ready"
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "status": self.state,
+                "timings": dict(self.timings),
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "error": self.error,
+                "model_errors": dict(self.model_errors)
+            }
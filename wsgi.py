@@ -0,0 +1,13 @@
+"""Entry point for pre-fork WSGI servers.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+Importing this module builds the app, which loads (or trains) the model and
+runs the warm-up to completion. With preload_app (see gunicorn.conf.py)
+that happens once in the master before the workers are forked, so they
+start warm and share the model's memory pages copy-on-write instead of
+each unpickling a private copy.
+"""
+from app import create_app
+
+application = create_app(warmup_mode="blocking")